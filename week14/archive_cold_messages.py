@@ -0,0 +1,28 @@
+## Move messages older than a set age out of Postgres into the zstd-compressed Parquet archive
+## (one directory per channel and month under archive-dir in the [telegram-db] config section).
+## The dashboard queries keep reading them: on Postgres they add in the archive for date ranges
+## that reach it, and analytics-engine = duckdb reads it next to the mirror. Run it on a
+## schedule, and again after re-crawling old history, which is merged into the archive.
+##
+##   python archive_cold_messages.py --older-than-months 12
+
+import argparse
+
+from week14.config import config
+from week14.utilities.archive_logic import archive_cold_messages, ARCHIVE_AFTER_MONTHS
+from week14.utilities.analytics_db import ARCHIVE_DIR
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive old channel messages to Parquet")
+    parser.add_argument(
+        "--older-than-months",
+        type=int,
+        default=config["telegram-db"].getint("archive-after-months", ARCHIVE_AFTER_MONTHS),
+        help="archive the months that ended at least this many months ago",
+    )
+    args = parser.parse_args()
+    if args.older_than_months < 1:
+        parser.error("--older-than-months must be at least 1")
+
+    num_moved = archive_cold_messages(args.older_than_months)
+    print(f"moved {num_moved} messages to {ARCHIVE_DIR}")
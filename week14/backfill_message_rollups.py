@@ -0,0 +1,25 @@
+## Rebuild the rollup tables the dashboards read instead of the messages themselves
+## (channel_message_counts_hourly for the time series charts, forward_edges_daily for the
+## forward network) from the messages in Postgres and the Parquet archive, a month at a time.
+## Schema migrations 4 and 5 fill them from Postgres alone, so run this once after them on a
+## database that already has an archive. The insert paths keep the rollups current after that.
+##
+##   python backfill_message_rollups.py --first-month 2022-01 --last-month 2022-12
+
+import argparse
+from datetime import datetime, timezone
+
+from week14.utilities.archive_logic import backfill_message_rollups
+
+
+def parse_month(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m").replace(tzinfo=timezone.utc)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the message rollup tables")
+    parser.add_argument("--first-month", type=parse_month, help="YYYY-MM; default: the earliest")
+    parser.add_argument("--last-month", type=parse_month, help="YYYY-MM; default: the latest")
+    args = parser.parse_args()
+
+    backfill_message_rollups(args.first_month, args.last_month)
@@ -0,0 +1,156 @@
+## Benchmark: the dashboard fetch_* queries on Postgres vs. DuckDB over the Parquet mirror
+##
+## Loads synthetic messages for a seed list of made-up channels in steps up to each size,
+## rebuilds the Parquet mirror, and times every dashboard query on both engines over the
+## whole date range loaded so far (the median of --repeats runs, after one warm-up run).
+##
+##   python benchmark_analytics_engines.py --sizes 1000000 10000000 50000000 --reset-channels
+##
+## The mirror covers the whole database and the synthetic messages are deleted at the end,
+## so point it at a scratch database.
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from week14.utilities import db, analytics_db
+from week14.utilities.db import (
+    bulk_load_channel_messages,
+    delete_channel_messages,
+    insert_data_into_channel_metadata_table_advanced,
+    insert_data_into_seed_table,
+)
+from week14.utilities.analytics_db import mirror_to_parquet
+
+NUM_CHANNELS = 100
+FIRST_CHANNEL_ID = 8_500_000_000
+SEED_LIST_NAME = "analytics_benchmark"
+FIRST_MESSAGE_DATETIME = datetime(2015, 1, 1, tzinfo=timezone.utc)
+SECONDS_BETWEEN_MESSAGES = 5
+
+
+def make_synthetic_messages(first: int, last: int) -> Iterator[dict]:
+    for i in range(first, last):
+        is_forward = i % 5 == 0
+        yield {
+            "channel_id": FIRST_CHANNEL_ID + i % NUM_CHANNELS,
+            "message_id": i // NUM_CHANNELS,
+            "message_datetime": FIRST_MESSAGE_DATETIME + timedelta(seconds=i * SECONDS_BETWEEN_MESSAGES),
+            "message_views": random.randint(0, 100_000),
+            "message_forwards": i % 97,
+            "message_text": " ".join(random.choices(["новости", "war", "Россия", "update"], k=12))
+            + (f" https://site{i % 53}.com/{i}" if i % 10 == 0 else ""),
+            "forwardee_channel_id": 1_000_000 + i % 397 if is_forward else None,
+            "forwardee_message_id": i if is_forward else None,
+            "message_is_forward": is_forward,
+            "api_response": None,
+        }
+
+
+def make_dashboard_queries(engine_module, channel_ids: list[int], end_date: str) -> dict:
+    # every query runs over the whole loaded range, the case that grows with the table
+    start_date = FIRST_MESSAGE_DATETIME.strftime("%Y-%m-%d")
+    seed_list_names = [SEED_LIST_NAME]
+    return {
+        "fetch_seed_metadata_full": lambda: engine_module.fetch_seed_metadata_full(seed_list_names),
+        "fetch_birth_chart_data": lambda: engine_module.fetch_birth_chart_data(
+            seed_list_names, "month"
+        ),
+        "fetch_time_series_chart_data": lambda: engine_module.fetch_time_series_chart_data(
+            seed_list_names, start_date, end_date, "day"
+        ),
+        "fetch_top_messages": lambda: engine_module.fetch_top_messages(
+            seed_list_names, start_date, end_date, 1000
+        ),
+        "fetch_weighted_edges_fwd_network": lambda: engine_module.fetch_weighted_edges_fwd_network(
+            channel_ids, start_date, end_date
+        ),
+        "fetch_domain_edges": lambda: engine_module.fetch_domain_edges(
+            channel_ids, start_date, end_date
+        ),
+    }
+
+
+def time_query(run_query, num_repeats: int) -> float:
+    run_query()
+    elapsed_seconds = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        run_query()
+        elapsed_seconds.append(time.perf_counter() - start_time)
+    return statistics.median(elapsed_seconds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Postgres vs. DuckDB/Parquet dashboard queries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--reset-channels", action="store_true",
+        help="confirm that stored messages of the synthetic channels may be deleted",
+    )
+    args = parser.parse_args()
+    if not args.reset_channels:
+        parser.error("the benchmark deletes the synthetic channels' messages; pass --reset-channels")
+
+    channel_ids = [FIRST_CHANNEL_ID + k for k in range(NUM_CHANNELS)]
+    insert_data_into_channel_metadata_table_advanced(
+        [
+            {
+                "channel_id": channel_id,
+                "channel_name": f"analytics_benchmark_{channel_id}",
+                "channel_title": f"Benchmark channel {channel_id}",
+                "channel_birthdate": FIRST_MESSAGE_DATETIME - timedelta(days=channel_id % 1000),
+                "channel_bio": None,
+                "num_subscribers": channel_id % 10_000,
+                "api_response": None,
+            }
+            for channel_id in channel_ids
+        ]
+    )
+    insert_data_into_seed_table(
+        [
+            {
+                "channel_id": channel_id,
+                "channel_name": f"analytics_benchmark_{channel_id}",
+                "seed_list": SEED_LIST_NAME,
+            }
+            for channel_id in channel_ids
+        ]
+    )
+
+    delete_channel_messages(channel_ids)
+    num_loaded = 0
+    try:
+        for num_messages in sorted(args.sizes):
+            start_time = time.perf_counter()
+            bulk_load_channel_messages(make_synthetic_messages(num_loaded, num_messages))
+            load_seconds = time.perf_counter() - start_time
+            num_loaded = num_messages
+
+            start_time = time.perf_counter()
+            mirror_to_parquet()
+            mirror_seconds = time.perf_counter() - start_time
+            print(
+                f"{num_messages:>11} messages: loaded in {load_seconds:.1f}s, "
+                f"mirrored in {mirror_seconds:.1f}s"
+            )
+
+            last_datetime = FIRST_MESSAGE_DATETIME + timedelta(
+                seconds=num_messages * SECONDS_BETWEEN_MESSAGES
+            )
+            end_date = (last_datetime + timedelta(days=1)).strftime("%Y-%m-%d")
+            postgres_queries = make_dashboard_queries(db, channel_ids, end_date)
+            duckdb_queries = make_dashboard_queries(analytics_db, channel_ids, end_date)
+            for query_name in postgres_queries:
+                postgres_seconds = time_query(postgres_queries[query_name], args.repeats)
+                duckdb_seconds = time_query(duckdb_queries[query_name], args.repeats)
+                print(
+                    f"{num_messages:>11}  {query_name:<34} postgres {postgres_seconds * 1000:9.1f}ms  "
+                    f"duckdb {duckdb_seconds * 1000:9.1f}ms  {postgres_seconds / duckdb_seconds:6.1f}x"
+                )
+    finally:
+        delete_channel_messages(channel_ids)
@@ -0,0 +1,77 @@
+## Benchmark: multi-row INSERT ... VALUES vs. COPY into a staging table, for channel_messages
+##
+## Loads the same synthetic messages through both paths at several sizes and reports rows/sec.
+## The INSERT path gets the records in batches of MESSAGES_PER_FLUSH, the way the crawler
+## used to write them; the COPY path gets them all at once. Synthetic channel ids are deleted
+## before and after every run.
+##
+##   python benchmark_bulk_load.py --sizes 10000 100000 1000000
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from week14.utilities.db import (
+    insert_data_into_channel_messages_table_advanced,
+    bulk_load_channel_messages,
+    delete_channel_messages,
+)
+from week14.utilities.logic import MESSAGES_PER_FLUSH
+
+NUM_CHANNELS = 20
+FIRST_CHANNEL_ID = 8_000_000_000
+
+
+def make_synthetic_record(i: int) -> dict:
+    channel_id = FIRST_CHANNEL_ID + i % NUM_CHANNELS
+    message_datetime = datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)
+    text = " ".join(random.choices(["новости", "war", "https://t.me/x", "Россия", "update"], k=30))
+    is_forward = i % 5 == 0
+    return {
+        "channel_id": channel_id,
+        "message_id": i,
+        "message_datetime": message_datetime,
+        "message_views": i * 3,
+        "message_forwards": i % 97,
+        "message_text": text,
+        "forwardee_channel_id": 1_000_000 + i % 37 if is_forward else None,
+        "forwardee_message_id": i if is_forward else None,
+        "message_is_forward": is_forward,
+        "api_response": json.dumps(
+            {"_": "Message", "id": i, "peer_id": {"_": "PeerChannel", "channel_id": channel_id},
+             "date": message_datetime.isoformat(), "message": text, "views": i * 3}
+        ),
+    }
+
+
+def load_with_insert(records: list[dict]) -> None:
+    for start in range(0, len(records), MESSAGES_PER_FLUSH):
+        insert_data_into_channel_messages_table_advanced(records[start:start + MESSAGES_PER_FLUSH])
+
+
+def load_with_copy(records: list[dict]) -> None:
+    bulk_load_channel_messages(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="INSERT vs. COPY for channel_messages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    channel_ids = [FIRST_CHANNEL_ID + k for k in range(NUM_CHANNELS)]
+    try:
+        for num_rows in args.sizes:
+            records = [make_synthetic_record(i) for i in range(num_rows)]
+            for name, load in [("insert", load_with_insert), ("copy", load_with_copy)]:
+                delete_channel_messages(channel_ids)
+                start_time = time.perf_counter()
+                load(records)
+                elapsed_seconds = time.perf_counter() - start_time
+                print(
+                    f"{num_rows:>9} rows  {name:<6} {elapsed_seconds:8.1f}s "
+                    f"{num_rows / elapsed_seconds:10.0f} rows/s"
+                )
+    finally:
+        delete_channel_messages(channel_ids)
@@ -0,0 +1,132 @@
+## Benchmark: end-to-end message ingest (iter_messages -> extraction -> Postgres) with no network
+##
+## Record real channels once (needs an account), or synthesize fixtures, then replay them through
+## crawl_and_save_channel_messages with a fake client and simulated API latency:
+##
+##   python benchmark_ingest_replay.py record some_channel other_channel --max-messages 5000
+##   python benchmark_ingest_replay.py synthesize --num-channels 4 --num-messages 20000
+##   python benchmark_ingest_replay.py run --latency-ms 150 --reset-channels
+##
+## "run" deletes whatever is stored for the fixture channels before every repeat, so point it
+## at a scratch database.
+
+import argparse
+import os
+import time
+
+from telethon.sync import TelegramClient
+
+from week14.config import app_name, api_id, api_hash, OUTPUT_DIR
+from week14.utilities.db import delete_channel_messages
+from week14.utilities.logic import crawl_and_save_channel_messages, MESSAGES_PER_FLUSH
+from week14.utilities.rate_limiter import AdaptiveRateLimiter
+from week14.utilities.telemetry import crawl_telemetry
+from week14.utilities.telethon_replay import (
+    ReplayTelegramClient,
+    record_channel_fixture,
+    synthesize_channel_fixture,
+)
+
+DEFAULT_FIXTURE_DIR = os.path.join(OUTPUT_DIR, "fixtures")
+
+
+def run_benchmark(
+    fixture_dir: str,
+    latency_seconds: float,
+    jitter_seconds: float,
+    messages_per_flush: int,
+    num_repeats: int,
+    paced: bool,
+) -> None:
+    client = ReplayTelegramClient(fixture_dir, latency_seconds, jitter_seconds)
+    channel_names = sorted(client.channel_ids_by_name)
+    channel_ids = sorted(client.channel_ids_by_name.values())
+    print(f"replaying {len(channel_names)} channels from {fixture_dir}")
+
+    for repeat in range(num_repeats):
+        delete_channel_messages(channel_ids)
+        # unless asked to, take pacing out of the picture and measure the pipeline itself
+        rate_limiter = (
+            AdaptiveRateLimiter()
+            if paced
+            else AdaptiveRateLimiter(rate=1e6, max_rate=1e6, burst=1000)
+        )
+        flush_seconds_before = sum(
+            entry.get("db_flush_seconds_sum", 0)
+            for entry in crawl_telemetry.summarize("channel").values()
+        )
+        num_requests_before = client.num_requests
+
+        start_time = time.perf_counter()
+        num_messages = 0
+        for channel_name in channel_names:
+            num_messages += crawl_and_save_channel_messages(
+                client, channel_name, messages_per_flush, rate_limiter
+            )
+        elapsed_seconds = time.perf_counter() - start_time
+
+        flush_seconds = (
+            sum(
+                entry.get("db_flush_seconds_sum", 0)
+                for entry in crawl_telemetry.summarize("channel").values()
+            )
+            - flush_seconds_before
+        )
+        print(
+            f"repeat {repeat + 1}: {num_messages} messages in {elapsed_seconds:.2f}s "
+            f"({num_messages / elapsed_seconds:.0f} messages/s), "
+            f"{client.num_requests - num_requests_before} simulated requests, "
+            f"{flush_seconds:.2f}s writing to Postgres"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline ingest benchmark on replayed Telethon data")
+    parser.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="save live channels as fixtures")
+    record_parser.add_argument("channel_names", nargs="+")
+    record_parser.add_argument("--max-messages", type=int, default=None)
+
+    synthesize_parser = subparsers.add_parser("synthesize", help="write made-up fixtures")
+    synthesize_parser.add_argument("--num-channels", type=int, default=4)
+    synthesize_parser.add_argument("--num-messages", type=int, default=10000)
+
+    run_parser = subparsers.add_parser("run", help="replay the fixtures into Postgres")
+    run_parser.add_argument("--latency-ms", type=float, default=0.0)
+    run_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    run_parser.add_argument("--messages-per-flush", type=int, default=MESSAGES_PER_FLUSH)
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--paced", action="store_true", help="keep the default rate limiter")
+    run_parser.add_argument(
+        "--reset-channels", action="store_true",
+        help="confirm that stored data for the fixture channels may be deleted",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        with TelegramClient(app_name, api_id, api_hash, flood_sleep_threshold=0) as client:
+            for channel_name in args.channel_names:
+                num_messages = record_channel_fixture(
+                    client, channel_name.lower(), args.fixture_dir, args.max_messages
+                )
+                print(f"saved {num_messages} messages from @{channel_name}")
+    elif args.command == "synthesize":
+        for i in range(args.num_channels):
+            synthesize_channel_fixture(
+                args.fixture_dir, f"synthetic_{i}", 9_000_000_000 + i, args.num_messages
+            )
+        print(f"wrote {args.num_channels} synthetic fixtures to {args.fixture_dir}")
+    elif args.command == "run":
+        if not args.reset_channels:
+            parser.error("run deletes the fixture channels' stored messages; pass --reset-channels")
+        run_benchmark(
+            args.fixture_dir,
+            args.latency_ms / 1000,
+            args.jitter_ms / 1000,
+            args.messages_per_flush,
+            args.repeats,
+            args.paced,
+        )
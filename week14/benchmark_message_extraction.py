@@ -0,0 +1,72 @@
+## Micro-benchmark: per-message extraction vs. the columnar page extractor
+##
+##   python benchmark_message_extraction.py --num-messages 50000
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import timeit
+
+from telethon.tl.patched import Message as TelegramMessage
+from telethon.tl.types import PeerChannel, MessageFwdHeader
+
+from week14.utilities.logic import (
+    extract_data_from_message_object,
+    extract_columns_from_message_page,
+    message_columns_to_records,
+)
+
+
+def make_synthetic_page(num_messages: int, forward_share: float = 0.3) -> list[TelegramMessage]:
+    base_datetime = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(num_messages):
+        fwd_from = None
+        if i < num_messages * forward_share:
+            fwd_from = MessageFwdHeader(
+                date=base_datetime,
+                from_id=PeerChannel(channel_id=1000 + i % 50),
+                channel_post=i,
+            )
+        messages.append(
+            TelegramMessage(
+                id=i + 1,
+                peer_id=PeerChannel(channel_id=42),
+                date=base_datetime + timedelta(minutes=i),
+                message=f"synthetic message number {i} https://example.com/{i}",
+                views=i * 10,
+                forwards=i,
+                fwd_from=fwd_from,
+            )
+        )
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the two message extractors")
+    parser.add_argument("--num-messages", type=int, default=50_000)
+    parser.add_argument("--num-repeats", type=int, default=3)
+    args = parser.parse_args()
+    num_messages = args.num_messages
+    num_repeats = args.num_repeats
+    page = make_synthetic_page(num_messages)
+
+    # sanity check: both extractors must agree before we time them
+    assert message_columns_to_records(extract_columns_from_message_page(page)) == [
+        extract_data_from_message_object(message) for message in page
+    ]
+
+    per_message_seconds = min(timeit.repeat(
+        lambda: [extract_data_from_message_object(message) for message in page],
+        number=1, repeat=num_repeats,
+    ))
+    columnar_seconds = min(timeit.repeat(
+        lambda: extract_columns_from_message_page(page),
+        number=1, repeat=num_repeats,
+    ))
+
+    print(f"page of {num_messages} synthetic messages, best of {num_repeats}:")
+    print(f"extract_data_from_message_object:  {per_message_seconds:.3f}s "
+          f"({num_messages / per_message_seconds:,.0f} messages/s)")
+    print(f"extract_columns_from_message_page: {columnar_seconds:.3f}s "
+          f"({num_messages / columnar_seconds:,.0f} messages/s)")
+    print(f"speedup: {per_message_seconds / columnar_seconds:.1f}x")
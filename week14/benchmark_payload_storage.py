@@ -0,0 +1,166 @@
+## Benchmark: api_response stored inline as JSON vs. zstd-compressed in a side table
+##
+## Builds the same synthetic channel_messages data in both layouts (in scratch bench_* tables),
+## then reports table sizes and the time of the top-messages query against each.
+
+from datetime import datetime, timedelta, timezone
+import json
+import random
+import time
+
+import sqlalchemy as sa
+import zstandard
+
+from week14.utilities.db import (
+    engine,
+    PAYLOAD_COMPRESSION_LEVEL,
+    PAYLOAD_DICTIONARY_SIZE,
+    PAYLOAD_DICTIONARY_SAMPLE_SIZE,
+)
+
+NUM_MESSAGES = 200_000
+NUM_CHANNELS = 50
+BATCH_SIZE = 5_000
+NUM_QUERY_REPEATS = 5
+
+
+def make_synthetic_record(i: int) -> dict:
+    channel_id = 1_000_000 + i % NUM_CHANNELS
+    message_datetime = datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=7 * i)
+    text = " ".join(random.choices(["новости", "war", "https://t.me/x", "Россия", "update", "видео"], k=40))
+    api_response = {
+        "_": "Message",
+        "id": i,
+        "peer_id": {"_": "PeerChannel", "channel_id": channel_id},
+        "date": message_datetime.isoformat(),
+        "message": text,
+        "out": False, "mentioned": False, "media_unread": False, "silent": False, "post": True,
+        "from_scheduled": False, "legacy": False, "edit_hide": False, "pinned": False, "noforwards": False,
+        "views": i * 3, "forwards": i % 97, "edit_date": None, "post_author": None, "grouped_id": None,
+        "entities": [{"_": "MessageEntityUrl", "offset": 10 * k, "length": 14} for k in range(5)],
+        "media": {"_": "MessageMediaPhoto", "photo": {"_": "Photo", "id": i, "access_hash": i * 31,
+                  "file_reference": "AQAAAAAAAAAAAAAAAAAAAAAAAAAA", "date": message_datetime.isoformat(),
+                  "sizes": [{"_": "PhotoSize", "type": t, "w": 320 * k, "h": 240 * k, "size": 1000 * k}
+                            for k, t in enumerate("smxy", start=1)], "dc_id": 2}},
+        "reactions": {"_": "MessageReactions", "results": [
+            {"_": "ReactionCount", "reaction": {"_": "ReactionEmoji", "emoticon": e}, "count": i % 50}
+            for e in ["👍", "🔥", "😡", "😂"]]},
+        "replies": None, "fwd_from": None, "reply_to": None,
+    }
+    return {
+        "channel_id": channel_id,
+        "message_id": i,
+        "message_datetime": message_datetime,
+        "message_views": i * 3,
+        "message_forwards": i % 97,
+        "message_text": text,
+        "forwardee_channel_id": None,
+        "forwardee_message_id": None,
+        "message_is_forward": False,
+        "api_response": json.dumps(api_response),
+    }
+
+
+def message_columns() -> list[sa.Column]:
+    return [
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("message_id", sa.types.INTEGER, primary_key=True),
+        sa.Column("message_datetime", sa.types.DateTime(timezone=True)),
+        sa.Column("message_views", sa.types.INTEGER),
+        sa.Column("message_forwards", sa.types.INTEGER),
+        sa.Column("message_text", sa.types.TEXT),
+        sa.Column("forwardee_channel_id", sa.types.BIGINT),
+        sa.Column("forwardee_message_id", sa.types.INTEGER),
+        sa.Column("message_is_forward", sa.types.BOOLEAN),
+    ]
+
+
+def time_top_messages_query(table: sa.Table) -> float:
+    stmt = (
+        sa.select(table)
+        .filter(
+            table.c.channel_id.in_([1_000_000 + k for k in range(0, NUM_CHANNELS, 2)]),
+            table.c.message_views.is_not(None),
+            table.c.message_datetime >= datetime(2022, 3, 1, tzinfo=timezone.utc),
+            table.c.message_datetime <= datetime(2023, 3, 1, tzinfo=timezone.utc),
+        )
+        .order_by(table.c.message_views.desc())
+        .limit(1000)
+    )
+    timings = []
+    for _ in range(NUM_QUERY_REPEATS):
+        start_time = time.perf_counter()
+        with engine.connect() as conn:
+            [dict(elt._mapping) for elt in conn.execute(stmt).fetchall()]
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def relation_size(table_name: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(sa.text(f"select pg_total_relation_size('{table_name}')")).scalar()
+
+
+if __name__ == '__main__':
+    bench_meta = sa.MetaData()
+    inline_table = sa.Table(
+        "bench_messages_inline", bench_meta, *message_columns(),
+        sa.Column("api_response", sa.types.JSON, nullable=False),
+    )
+    lean_table = sa.Table("bench_messages_lean", bench_meta, *message_columns())
+    payload_table = sa.Table(
+        "bench_message_payloads",
+        bench_meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("message_id", sa.types.INTEGER, primary_key=True),
+        sa.Column("payload", sa.types.LargeBinary, nullable=False),
+    )
+    bench_meta.drop_all(engine)
+    bench_meta.create_all(engine)
+
+    # same settings as the payload tables use, but trained locally so the benchmark
+    # leaves payload_dictionaries alone
+    dictionary = zstandard.train_dictionary(
+        PAYLOAD_DICTIONARY_SIZE,
+        [make_synthetic_record(i)["api_response"].encode("utf-8")
+         for i in range(PAYLOAD_DICTIONARY_SAMPLE_SIZE)],
+    )
+    compressor = zstandard.ZstdCompressor(level=PAYLOAD_COMPRESSION_LEVEL, dict_data=dictionary)
+
+    try:
+        for start in range(0, NUM_MESSAGES, BATCH_SIZE):
+            records = [make_synthetic_record(i) for i in range(start, min(start + BATCH_SIZE, NUM_MESSAGES))]
+            lean_records = [
+                {key: value for key, value in record.items() if key != "api_response"}
+                for record in records
+            ]
+            payload_records = [
+                {
+                    "channel_id": record["channel_id"],
+                    "message_id": record["message_id"],
+                    "payload": compressor.compress(record["api_response"].encode("utf-8")),
+                }
+                for record in records
+            ]
+            with engine.connect() as conn:
+                conn.execute(sa.insert(inline_table), records)
+                conn.execute(sa.insert(lean_table), lean_records)
+                conn.execute(sa.insert(payload_table), payload_records)
+                conn.commit()
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+                sa.text("vacuum analyze bench_messages_inline, bench_messages_lean, bench_message_payloads")
+            )
+
+        inline_size = relation_size("bench_messages_inline")
+        lean_size = relation_size("bench_messages_lean")
+        payload_size = relation_size("bench_message_payloads")
+        print(f"{NUM_MESSAGES} synthetic messages")
+        print(f"before: channel_messages with inline JSON    {inline_size / 2**20:8.1f} MiB")
+        print(f"after:  channel_messages without JSON        {lean_size / 2**20:8.1f} MiB")
+        print(f"        channel_message_payloads (zstd+dict) {payload_size / 2**20:8.1f} MiB")
+        print(f"top-messages query, best of {NUM_QUERY_REPEATS}: "
+              f"before {time_top_messages_query(inline_table) * 1000:.1f} ms, "
+              f"after {time_top_messages_query(lean_table) * 1000:.1f} ms")
+    finally:
+        bench_meta.drop_all(engine)
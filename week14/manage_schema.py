@@ -0,0 +1,36 @@
+## Versioned schema migrations for the week14 database, and a check on what the queries use
+##
+##   python manage_schema.py migrate             # apply every pending migration
+##   python manage_schema.py migrate --to 1
+##   python manage_schema.py status              # migrations applied, and indexes per fetch_* query
+
+import argparse
+
+from week14.utilities.db import apply_schema_migrations
+from week14.utilities.schema_logic import get_schema_migration_status, get_query_index_report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="apply pending migrations")
+    migrate_parser.add_argument("--to", type=int, default=None, help="stop after this version")
+    status_parser = subparsers.add_parser("status", help="report migrations and index use")
+    status_parser.add_argument("--seed-lists", nargs="+", default=None)
+    status_parser.add_argument("--start-date", default=None, help="YYYY-MM-DD")
+    status_parser.add_argument("--end-date", default=None, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        applied_versions = apply_schema_migrations(args.to)
+        print(f"applied {len(applied_versions)} migrations {applied_versions}")
+    else:
+        if (args.start_date is None) != (args.end_date is None):
+            parser.error("pass both --start-date and --end-date, or neither")
+        for migration in get_schema_migration_status():
+            applied_at = migration["applied_at"] or "pending"
+            print(f"{migration['version']:>4}  {migration['name']:<50} {applied_at}")
+        print()
+        for entry in get_query_index_report(args.seed_lists, args.start_date, args.end_date):
+            print(f"{entry['query']}: {entry['statement']}")
+            print(f"    indexes: {', '.join(entry['indexes']) or '-'}")
+            print(f"    sequential scans: {', '.join(entry['sequential_scans']) or '-'}")
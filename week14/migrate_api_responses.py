@@ -0,0 +1,18 @@
+## One-off: move api_response JSON columns into the compressed payload tables
+## (run once against databases created before channel_message_payloads existed)
+
+from week14.utilities.db import (
+    migrate_api_responses_to_payload_tables,
+    fetch_latest_payload_dictionary_id,
+    retrain_payload_dictionary,
+    payload_tables_by_kind,
+)
+
+if __name__ == '__main__':
+    migrate_api_responses_to_payload_tables()
+
+    # fresh databases never had api_response columns to train on, so train on whatever
+    # payloads have been stored since (once there are enough of them)
+    for payload_kind in payload_tables_by_kind.keys():
+        if fetch_latest_payload_dictionary_id(payload_kind) is None:
+            retrain_payload_dictionary(payload_kind)
@@ -0,0 +1,8 @@
+## One-off: move an existing channel_messages table over to monthly range partitions on
+## message_datetime (stop crawlers first; new databases get the layout from
+## partition-messages = yes in the [telegram-db] config section)
+
+from week14.utilities.db import migrate_channel_messages_to_partitions
+
+if __name__ == '__main__':
+    migrate_channel_messages_to_partitions()
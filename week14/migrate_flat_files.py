@@ -0,0 +1,45 @@
+## Load CSV/JSONL archives of channel metadata or messages into Postgres, in parallel
+##
+##   python migrate_flat_files.py channels russian_disinfo_channels_info.csv --seed-list russian_disinfo
+##   python migrate_flat_files.py messages russian_disinfo_channels_messages.csv --workers 8
+##
+## Progress is checkpointed after every chunk; run the same command again to resume an
+## interrupted migration, or pass --restart to start from the top.
+
+import argparse
+
+from week14.utilities.db import UPSERT_POLICIES
+from week14.utilities.migration_logic import (
+    migrate_flat_file,
+    FLAT_FILE_COLUMNS,
+    MIGRATION_CHUNK_ROWS,
+    MIGRATION_NUM_WORKERS,
+)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate flat files into the database")
+    parser.add_argument("kind", choices=sorted(FLAT_FILE_COLUMNS))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--seed-list", default=None, help="add migrated channels to this seed list")
+    parser.add_argument("--workers", type=int, default=MIGRATION_NUM_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=MIGRATION_CHUNK_ROWS)
+    parser.add_argument(
+        "--policy", choices=UPSERT_POLICIES, default="ignore",
+        help="what to do with rows that are already in the database",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignore any saved checkpoint")
+    args = parser.parse_args()
+
+    if args.kind == "messages" and args.seed_list is not None:
+        parser.error("--seed-list only applies to channels")
+
+    for path in args.paths:
+        migrate_flat_file(
+            path,
+            args.kind,
+            args.seed_list,
+            args.workers,
+            args.chunk_rows,
+            args.policy,
+            args.restart,
+        )
@@ -0,0 +1,13 @@
+## Rebuild the Parquet mirror of channel_messages and channel_metadata that the dashboard
+## queries read with analytics-engine = duckdb in the [telegram-db] config section
+## (parquet-dir sets where it goes). Run it on a schedule; the dashboards see the data as of
+## the last run.
+
+from week14.utilities.analytics_db import mirror_to_parquet, PARQUET_DIR
+
+if __name__ == '__main__':
+    info = mirror_to_parquet()
+    print(
+        f"mirrored {info['num_messages']} messages and {info['num_channels']} channels "
+        f"to {PARQUET_DIR}"
+    )
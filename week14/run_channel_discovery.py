@@ -0,0 +1,49 @@
+## Grow a seed list from the channels its seeds forward most, within a daily API budget
+##
+##   python run_channel_discovery.py russian_disinfo --target-seed-list russian_disinfo_discovered
+##   python run_channel_discovery.py russian_disinfo --target-seed-list russian_disinfo_discovered --dry-run
+
+import argparse
+
+from telethon.sync import TelegramClient
+
+from week14.config import app_name, api_id, api_hash
+from week14.utilities.discovery_logic import (
+    discover_channels,
+    get_discovery_frontier,
+    DISCOVERY_DAILY_API_BUDGET,
+    MAX_CHANNELS_PER_DISCOVERY_RUN,
+)
+from week14.utilities.job_queue_logic import enqueue_channel_message_jobs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Snowball channel discovery")
+    parser.add_argument("source_seed_lists", nargs="+")
+    parser.add_argument("--target-seed-list", required=True)
+    parser.add_argument("--daily-budget", type=int, default=DISCOVERY_DAILY_API_BUDGET)
+    parser.add_argument("--max-channels", type=int, default=MAX_CHANNELS_PER_DISCOVERY_RUN)
+    parser.add_argument("--dry-run", action="store_true", help="print the frontier and exit")
+    parser.add_argument(
+        "--enqueue-messages", action="store_true",
+        help="queue message crawls for the target seed list afterwards",
+    )
+    args = parser.parse_args()
+
+    if args.dry_run:
+        for candidate in get_discovery_frontier(args.source_seed_lists, args.max_channels):
+            print(
+                f"{candidate['forwardee_channel_id']:<16} forwarded {candidate['forward_weight']} "
+                f"times by {candidate['num_forwarding_channels']} channels"
+            )
+    else:
+        with TelegramClient(app_name, api_id, api_hash, flood_sleep_threshold=0) as client:
+            discover_channels(
+                client,
+                args.source_seed_lists,
+                args.target_seed_list,
+                args.daily_budget,
+                args.max_channels,
+            )
+        if args.enqueue_messages:
+            num_added = enqueue_channel_message_jobs([args.target_seed_list])
+            print(f"queued {num_added} message jobs")
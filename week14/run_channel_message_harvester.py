@@ -0,0 +1,24 @@
+## Crawl many channels at once, sharded across every configured Telegram account
+
+from week14.utilities.harvest_logic import harvest_and_save_channel_messages
+from week14.utilities.credential_pool import harvest_with_credential_pool
+from week14.config import app_name, api_id, api_hash, telegram_credentials, INPUT_DIR
+import os
+import pandas as pd
+
+if __name__ == '__main__':
+    seed_list_name = 'russian_disinfo'
+    max_concurrent_channels = 5
+
+    my_input_csv = os.path.join(INPUT_DIR, f'{seed_list_name}.csv')
+    channel_df = pd.read_csv(my_input_csv, encoding='utf-8-sig')
+    channel_names = list(set([x.lower() for x in list(channel_df['handle'])]))
+
+    if len(telegram_credentials) > 1:
+        harvest_with_credential_pool(
+            channel_names, telegram_credentials, max_concurrent_channels
+        )
+    else:
+        harvest_and_save_channel_messages(
+            channel_names, app_name, api_id, api_hash, max_concurrent_channels
+        )
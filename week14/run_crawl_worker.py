@@ -0,0 +1,68 @@
+## Durable crawl queue: enqueue channels, run N crawlers, check progress
+##
+##   python run_crawl_worker.py enqueue-metadata russian_disinfo
+##   python run_crawl_worker.py enqueue-messages russian_disinfo
+##   python run_crawl_worker.py work --num-workers 4 --stop-when-empty
+##   python run_crawl_worker.py status
+
+import argparse
+import os
+import pandas as pd
+
+from week14.config import telegram_credentials, INPUT_DIR
+from week14.utilities.job_queue_logic import (
+    enqueue_channel_metadata_jobs,
+    enqueue_channel_message_jobs,
+    get_crawl_job_counts,
+    run_crawl_workers,
+    JOB_TYPES,
+    LEASE_SECONDS,
+)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Postgres-backed Telegram crawl queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_metadata_parser = subparsers.add_parser(
+        "enqueue-metadata", help="queue metadata lookups for the handles in input/<seed_list>.csv"
+    )
+    enqueue_metadata_parser.add_argument("seed_list")
+    enqueue_metadata_parser.add_argument("--priority", type=int, default=0)
+
+    enqueue_messages_parser = subparsers.add_parser(
+        "enqueue-messages", help="queue message crawls for every channel on the seed lists"
+    )
+    enqueue_messages_parser.add_argument("seed_lists", nargs="+")
+    enqueue_messages_parser.add_argument("--priority", type=int, default=0)
+
+    work_parser = subparsers.add_parser("work", help="run crawler processes")
+    work_parser.add_argument("--num-workers", type=int, default=len(telegram_credentials))
+    work_parser.add_argument("--job-types", nargs="+", choices=JOB_TYPES, default=None)
+    work_parser.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS)
+    work_parser.add_argument("--stop-when-empty", action="store_true")
+
+    subparsers.add_parser("status", help="count jobs by type and state")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue-metadata":
+        channel_df = pd.read_csv(
+            os.path.join(INPUT_DIR, f"{args.seed_list}.csv"), encoding="utf-8-sig"
+        )
+        channel_names = sorted(set([x.lower() for x in list(channel_df["handle"])]))
+        num_added = enqueue_channel_metadata_jobs(channel_names, args.seed_list, args.priority)
+        print(f"queued {num_added} metadata jobs")
+    elif args.command == "enqueue-messages":
+        num_added = enqueue_channel_message_jobs(args.seed_lists, args.priority)
+        print(f"queued {num_added} message jobs")
+    elif args.command == "work":
+        run_crawl_workers(
+            telegram_credentials,
+            args.num_workers,
+            args.job_types,
+            args.lease_seconds,
+            args.stop_when_empty,
+        )
+    elif args.command == "status":
+        for record in get_crawl_job_counts():
+            print(f"{record['job_type']:<18} {record['status']:<8} {record['count']}")
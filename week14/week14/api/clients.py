@@ -159,6 +159,36 @@ def post_message_table_data_api(
     return records
 
 
+def post_message_search_api(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    query: str,
+    token: str,
+    page: int = 1,
+    page_size: int = 50,
+) -> dict:
+    resp = requests.post(
+        urljoin(api_base, "message_search"),
+        json={
+            "start_date": start_date,
+            "end_date": end_date,
+            "seed_list_names": seed_list_names,
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+        },
+        headers=get_auth_header(token)
+    )
+    resp.raise_for_status()
+
+    result = resp.json()["data"]
+    for hit in result["hits"]:
+        hit["message_datetime"] = format_date(hit["message_datetime"])
+
+    return result
+
+
 def post_domain_table_data_api(
     seed_list_names: list[str], start_date: str, end_date: str, token: str):
     resp = requests.post(
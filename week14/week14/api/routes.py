@@ -9,6 +9,8 @@ from ..utilities.logic import (
     make_forward_network,
     get_time_series_chart_data,
     render_message_table,
+    search_messages,
+    MAX_SEARCH_PAGE_SIZE,
     make_domain_table,
     make_domain_network
 )
@@ -157,6 +159,30 @@ async def render_message_table_api(
     return {"data": records}
 
 
+@router.post("/message_search")
+async def message_search_api(
+    request: Request,
+    start_date: str = Body(embed=True),
+    end_date: str = Body(embed=True),
+    seed_list_names: list = Body(embed=True),
+    query: str = Body(embed=True),
+    page: int = Body(default=1, embed=True),
+    page_size: int = Body(default=50, embed=True),
+):
+    email = verify_token(parse_token_from_starlette(request))
+    if page < 1 or not 1 <= page_size <= MAX_SEARCH_PAGE_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"page must be at least 1 and page_size between 1 and {MAX_SEARCH_PAGE_SIZE}",
+        )
+    result = search_messages(seed_list_names, start_date, end_date, query, page, page_size)
+
+    for hit in result["hits"]:
+        hit["message_datetime"] = hit["message_datetime"].strftime("%Y-%m-%d %H:%M:%SZ")
+
+    return {"data": result}
+
+
 @router.post("/domain_table")
 async def render_domain_table_api(
     request: Request,
@@ -1,6 +1,7 @@
 import os
 import platform
 import configparser
+import re
 
 HOME_DIR = os.environ["USERPROFILE"] if platform.system() == "Windows" else os.environ["HOME"]
 INPUT_DIR = os.path.join(HOME_DIR, "PycharmProjects", "dhs622", "week10", "input")
@@ -19,6 +20,24 @@ app_name = config["telegram-credentials-1"]["app-name"]
 api_id = config["telegram-credentials-1"]["api-id"]
 api_hash = config["telegram-credentials-1"]["api-hash"]
 
+# Every [telegram-credentials-N] section, in order of N. Each account needs its own
+# app-name, since that is also the name of its Telethon session file.
+telegram_credentials = [
+    {
+        "app_name": config[section]["app-name"],
+        "api_id": config[section]["api-id"],
+        "api_hash": config[section]["api-hash"],
+    }
+    for section in sorted(
+        [
+            section
+            for section in config.sections()
+            if re.fullmatch(r"telegram-credentials-\d+", section)
+        ],
+        key=lambda x: int(x.rsplit("-", 1)[1]),
+    )
+]
+
 api_host = "127.0.0.1"
 api_port = 8000
 api_base = f"http://{api_host}:{api_port}"
\ No newline at end of file
@@ -0,0 +1,487 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import duckdb
+from sqlalchemy.sql.schema import Table as SQLAlchemyTable
+
+from ..config import config, OUTPUT_DIR
+from .db import (
+    channel_message_table,
+    channel_metadata_table,
+    fetch_seed_channel_ids,
+    fetch_message_datetime_range,
+    copy_table_rows_to_csv,
+    get_month_start,
+    channel_message_counts_hourly_table_name,
+    forward_edges_daily_table_name,
+)
+
+# The Parquet mirror of channel_messages (one directory per month, hive style) and
+# channel_metadata that the dashboard queries read when analytics-engine = duckdb
+PARQUET_DIR = config["telegram-db"].get("parquet-dir", os.path.join(OUTPUT_DIR, "parquet"))
+PARQUET_MIRROR_INFO_FILE = "mirror.json"
+# Messages moved out of Postgres for good (see archive_logic), one directory per channel and
+# month: channel_id=<id>/message_month=<YYYY-MM>/
+ARCHIVE_DIR = config["telegram-db"].get("archive-dir", os.path.join(OUTPUT_DIR, "archive"))
+# A month's new archive files wait here, one directory per month, until the transaction that
+# removes its rows from Postgres has committed (see archive_logic.archive_cold_messages)
+ARCHIVE_STAGING_DIR = f"{ARCHIVE_DIR}.staging"
+ARCHIVE_STAGING_INFO_FILE = "staged.json"
+# DuckDB types of the SQLAlchemy types used in the mirrored tables
+DUCKDB_TYPES = {
+    "BIGINT": "BIGINT",
+    "INTEGER": "INTEGER",
+    "TEXT": "VARCHAR",
+    "BOOLEAN": "BOOLEAN",
+    "DATETIME": "TIMESTAMP",
+}
+# seed channels and date range of the message queries, as in db.py; the channel_id and
+# message_month bounds prune whole directories before any file is opened
+MESSAGE_WINDOW_FILTER = """
+    channel_id in (select unnest($seed_channel_ids::BIGINT[]))
+    and message_month between $start_month and $end_month
+    and message_datetime >= $start_datetime
+    and message_datetime <= $end_datetime
+"""
+# one connection per process; every query runs on its own cursor
+duckdb_connection = None
+
+
+def get_duckdb_columns(table: SQLAlchemyTable) -> dict[str, str]:
+    return {column.name: DUCKDB_TYPES[str(column.type)] for column in table.columns}
+
+
+def make_csv_reader(table: SQLAlchemyTable, csv_path: str) -> str:
+    # read_csv(...) for a headerless CSV of table's rows exported by db.copy_table_rows_to_csv
+    columns = ", ".join(
+        [f"'{name}': '{type_name}'" for name, type_name in get_duckdb_columns(table).items()]
+    )
+    return (
+        f"read_csv('{csv_path}', header = false, delim = ',', quote = '\"', escape = '\"', "
+        # Postgres writes NULL as an empty field and an empty string as ""
+        f"allow_quoted_nulls = false, columns = {{{columns}}})"
+    )
+
+
+def write_parquet_file(
+    duck, table: SQLAlchemyTable, csv_path: str, parquet_path: str, order_by: str
+) -> int:
+    # One CSV exported from Postgres, converted into one zstd-compressed Parquet file
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    return duck.execute(
+        f"copy (select * from {make_csv_reader(table, csv_path)} order by {order_by}) "
+        f"to '{parquet_path}' (format parquet, compression zstd)"
+    ).fetchone()[0]
+
+
+def mirror_to_parquet() -> dict:
+    """
+    Rebuild the Parquet mirror from Postgres: channel_metadata as one file, channel_messages
+    as one file per month of message_datetime, sorted by channel and datetime so that DuckDB
+    can skip row groups. Months are exported one at a time, so neither Postgres nor the
+    temporary files ever hold more than a month's messages. The new mirror is written next to
+    the old one and swapped in at the end; messages without a datetime aren't mirrored.
+    """
+    new_dir = f"{PARQUET_DIR}.new"
+    old_dir = f"{PARQUET_DIR}.old"
+    shutil.rmtree(new_dir, ignore_errors=True)
+    mirrored_at = datetime.now(timezone.utc)
+    num_messages = 0
+
+    duck = duckdb.connect()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "rows.csv")
+
+        with open(csv_path, "wb") as csv_file:
+            copy_table_rows_to_csv(channel_metadata_table, csv_file)
+        num_channels = write_parquet_file(
+            duck,
+            channel_metadata_table,
+            csv_path,
+            os.path.join(new_dir, "channel_metadata", "data.parquet"),
+            "channel_id",
+        )
+        print(f"mirrored {num_channels} channels")
+
+        first_datetime, last_datetime = fetch_message_datetime_range()
+        month_start = get_month_start(first_datetime) if first_datetime is not None else None
+        while month_start is not None and month_start <= last_datetime:
+            next_month_start = get_month_start(month_start + timedelta(days=32))
+            with open(csv_path, "wb") as csv_file:
+                num_month_messages = copy_table_rows_to_csv(
+                    channel_message_table,
+                    csv_file,
+                    channel_message_table.c.message_datetime >= month_start,
+                    channel_message_table.c.message_datetime < next_month_start,
+                )
+            if num_month_messages > 0:
+                write_parquet_file(
+                    duck,
+                    channel_message_table,
+                    csv_path,
+                    os.path.join(
+                        new_dir,
+                        "channel_messages",
+                        f"message_month={month_start.strftime('%Y-%m')}",
+                        "data.parquet",
+                    ),
+                    "channel_id, message_datetime",
+                )
+                num_messages += num_month_messages
+                print(f"mirrored {num_month_messages} messages from {month_start.strftime('%Y-%m')}")
+            month_start = next_month_start
+    duck.close()
+
+    info = {
+        "mirrored_at": mirrored_at.isoformat(),
+        "num_channels": num_channels,
+        "num_messages": num_messages,
+    }
+    with open(os.path.join(new_dir, PARQUET_MIRROR_INFO_FILE), "w") as f:
+        json.dump(info, f)
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(PARQUET_DIR):
+        os.rename(PARQUET_DIR, old_dir)
+    os.rename(new_dir, PARQUET_DIR)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return info
+
+
+def fetch_parquet_mirror_info() -> dict|None:
+    path = os.path.join(PARQUET_DIR, PARQUET_MIRROR_INFO_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_archive_month_dirs(month: str, archive_dir: str = ARCHIVE_DIR) -> list[str]:
+    if not os.path.isdir(archive_dir):
+        return []
+    return [
+        os.path.join(archive_dir, entry.name, f"message_month={month}")
+        for entry in os.scandir(archive_dir)
+        if entry.name.startswith("channel_id=")
+        and os.path.isdir(os.path.join(archive_dir, entry.name, f"message_month={month}"))
+    ]
+
+
+def summarize_archived_month(month: str, archive_dir: str = ARCHIVE_DIR) -> dict[str, list[dict]]:
+    # One archived month (or one staged in archive_dir) as rows of channel_message_counts_hourly
+    # and forward_edges_daily, keyed by table name (see db.write_month_rollups)
+    summary = {channel_message_counts_hourly_table_name: [], forward_edges_daily_table_name: []}
+    month_dirs = get_archive_month_dirs(month, archive_dir)
+    if len(month_dirs) == 0:
+        return summary
+    month_files = ", ".join([f"'{os.path.join(path, '*.parquet')}'" for path in month_dirs])
+    messages = f"""
+        read_parquet(
+            [{month_files}], hive_partitioning = true,
+            hive_types = {{'channel_id': BIGINT, 'message_month': VARCHAR}}
+        )
+    """
+    summary[channel_message_counts_hourly_table_name] = execute_duckdb_query(
+        f"""
+        select channel_id, date_trunc('hour', message_datetime) as message_hour,
+        count(*) as num_messages
+        from {messages}
+        where message_datetime is not null
+        group by all
+        order by all
+        """,
+        {},
+    )
+    summary[forward_edges_daily_table_name] = execute_duckdb_query(
+        f"""
+        select channel_id, message_datetime::DATE as day, forwardee_channel_id,
+        count(*) as count, coalesce(sum(message_views), 0)::BIGINT as views
+        from {messages}
+        where message_is_forward and forwardee_channel_id is not null
+        and message_datetime is not null
+        group by all
+        order by all
+        """,
+        {},
+    )
+    return summary
+
+
+def stage_archive_month(
+    csv_path: str, month_start: datetime, archived_at: datetime
+) -> dict[str, list[dict]]:
+    """
+    Write one month of messages (a CSV exported by db.archive_message_month) merged with the
+    month's archive to ARCHIVE_STAGING_DIR, as one zstd-compressed Parquet file per channel.
+    Messages already archived for the month are kept, unless the CSV has a newer copy of them.
+    archived_at, the time the archiving transaction records for the month, is kept with the
+    files so a run that died before publish_staged_archive_month can tell whether that
+    transaction committed. Returns the staged month summarized for the rollup tables (see
+    summarize_archived_month).
+    """
+    month = month_start.strftime("%Y-%m")
+    staging_dir = os.path.join(ARCHIVE_STAGING_DIR, month)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(ARCHIVE_STAGING_DIR, exist_ok=True)
+    old_dirs = get_archive_month_dirs(month)
+    columns = ", ".join([column.name for column in channel_message_table.columns])
+
+    rows = f"select {columns} from {make_csv_reader(channel_message_table, csv_path)}"
+    if len(old_dirs) > 0:
+        old_files = ", ".join([f"'{os.path.join(path, '*.parquet')}'" for path in old_dirs])
+        rows = f"""
+            with incoming as ({rows})
+            select * from incoming
+            union all
+            select {columns} from read_parquet(
+                [{old_files}], hive_partitioning = true,
+                hive_types = {{'channel_id': BIGINT, 'message_month': VARCHAR}}
+            ) as archived
+            where not exists (
+                select 1 from incoming
+                where incoming.channel_id = archived.channel_id
+                and incoming.message_id = archived.message_id
+            )
+        """
+    duck = duckdb.connect()
+    duck.execute(
+        f"""
+        copy (
+            select *, '{month}' as message_month from ({rows})
+            order by channel_id, message_datetime
+        ) to '{staging_dir}'
+        (format parquet, compression zstd, partition_by (channel_id, message_month))
+        """
+    )
+    duck.close()
+    # written last, so a month without it was never fully staged
+    with open(os.path.join(staging_dir, ARCHIVE_STAGING_INFO_FILE), "w") as f:
+        json.dump({"archived_at": archived_at.isoformat()}, f)
+    return summarize_archived_month(month, staging_dir)
+
+
+def fetch_staged_archive_months() -> list[dict]:
+    # Months left in ARCHIVE_STAGING_DIR, with the archived_at they were staged for (None if
+    # staging never finished)
+    if not os.path.isdir(ARCHIVE_STAGING_DIR):
+        return []
+    staged_months = []
+    for entry in sorted(os.scandir(ARCHIVE_STAGING_DIR), key=lambda entry: entry.name):
+        info_path = os.path.join(entry.path, ARCHIVE_STAGING_INFO_FILE)
+        archived_at = None
+        if os.path.exists(info_path):
+            with open(info_path) as f:
+                archived_at = datetime.fromisoformat(json.load(f)["archived_at"])
+        staged_months.append({"message_month": entry.name, "archived_at": archived_at})
+    return staged_months
+
+
+def publish_staged_archive_month(month: str) -> None:
+    # Swap the month's archive directories for the staged ones, channel by channel. The staged
+    # month holds every message the archive had for it, so no channel is left out; running
+    # this again after an interruption finishes the swap.
+    staging_dir = os.path.join(ARCHIVE_STAGING_DIR, month)
+    for path in get_archive_month_dirs(month, staging_dir):
+        channel_dir = os.path.basename(os.path.dirname(path))
+        archive_path = os.path.join(ARCHIVE_DIR, channel_dir, f"message_month={month}")
+        shutil.rmtree(archive_path, ignore_errors=True)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        os.rename(path, archive_path)
+    shutil.rmtree(staging_dir)
+
+
+def discard_staged_archive_month(month: str) -> None:
+    shutil.rmtree(os.path.join(ARCHIVE_STAGING_DIR, month), ignore_errors=True)
+
+
+def get_duckdb_cursor():
+    global duckdb_connection
+    if duckdb_connection is None:
+        duckdb_connection = duckdb.connect()
+    return duckdb_connection.cursor()
+
+
+def get_message_source(include_mirror: bool = True) -> str:
+    """
+    A subquery over every message DuckDB can see: the mirror of what is in Postgres (unless
+    include_mirror is False) and the archive of what was moved out of it. The files are listed
+    at query time, so a rebuilt mirror or newly archived months show up without reconnecting.
+    """
+    sources = []
+    if include_mirror:
+        if not os.path.exists(os.path.join(PARQUET_DIR, PARQUET_MIRROR_INFO_FILE)):
+            raise Exception(
+                f"no Parquet mirror in {PARQUET_DIR}; run mirror_to_parquet.py first"
+            )
+        messages_glob = os.path.join(PARQUET_DIR, "channel_messages", "*", "*.parquet")
+        sources.append(
+            f"select * from read_parquet('{messages_glob}', hive_partitioning = true, "
+            f"hive_types = {{'message_month': VARCHAR}})"
+        )
+    if os.path.isdir(ARCHIVE_DIR) and any(
+        entry.name.startswith("channel_id=") for entry in os.scandir(ARCHIVE_DIR)
+    ):
+        archive_glob = os.path.join(ARCHIVE_DIR, "*", "*", "*.parquet")
+        sources.append(
+            f"select * from read_parquet('{archive_glob}', hive_partitioning = true, "
+            f"hive_types = {{'channel_id': BIGINT, 'message_month': VARCHAR}})"
+        )
+    if len(sources) == 0:
+        # nothing archived yet: no rows, with the columns the queries expect
+        typed_nulls = [
+            f"null::{type_name} as {name}"
+            for name, type_name in get_duckdb_columns(channel_message_table).items()
+        ]
+        sources.append(f"select {', '.join(typed_nulls)}, null::VARCHAR as message_month where false")
+    return f"({' union all by name '.join(sources)}) as channel_messages"
+
+
+def get_metadata_source() -> str:
+    metadata_path = os.path.join(PARQUET_DIR, "channel_metadata", "data.parquet")
+    if not os.path.exists(metadata_path):
+        raise Exception(f"no Parquet mirror in {PARQUET_DIR}; run mirror_to_parquet.py first")
+    return f"read_parquet('{metadata_path}') as channel_metadata"
+
+
+def execute_duckdb_query(query: str, parameters: dict) -> list[dict]:
+    # The Parquet files hold naive UTC timestamps; hand them back timezone-aware, as Postgres does
+    cursor = get_duckdb_cursor()
+    try:
+        cursor.execute(query, parameters)
+        column_names = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return [
+        {
+            name: value.replace(tzinfo=timezone.utc) if isinstance(value, datetime) else value
+            for name, value in zip(column_names, row)
+        }
+        for row in rows
+    ]
+
+
+def get_message_window_parameters(
+    seed_channel_ids: list, start_date: str, end_date: str
+) -> dict:
+    start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
+    end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
+    return {
+        "seed_channel_ids": [int(channel_id) for channel_id in seed_channel_ids],
+        "start_datetime": start_datetime,
+        "end_datetime": end_datetime,
+        "start_month": start_datetime.strftime("%Y-%m"),
+        "end_month": end_datetime.strftime("%Y-%m"),
+    }
+
+
+def fetch_seed_metadata_full(seed_list_names: list[str]) -> list[dict]:
+    seed_channel_ids = fetch_seed_channel_ids(seed_list_names)
+    columns = ", ".join([column.name for column in channel_metadata_table.columns])
+    return execute_duckdb_query(
+        f"""
+        select {columns} from {get_metadata_source()}
+        where channel_id in (select unnest($seed_channel_ids::BIGINT[]))
+        order by num_subscribers desc nulls first
+        """,
+        {"seed_channel_ids": seed_channel_ids},
+    )
+
+
+def fetch_birth_chart_data(
+    seed_list_names: list[str], birth_chart_unit: str
+) -> list[dict]:
+    seed_channel_ids = fetch_seed_channel_ids(seed_list_names)
+    return execute_duckdb_query(
+        f"""
+        select date_trunc($unit, channel_birthdate) as creation_dt, count(*) as count
+        from {get_metadata_source()}
+        where channel_id in (select unnest($seed_channel_ids::BIGINT[]))
+        group by creation_dt
+        order by creation_dt
+        """,
+        {"unit": birth_chart_unit, "seed_channel_ids": seed_channel_ids},
+    )
+
+
+# The message queries below read the mirror and the archive; where archive_logic combines a
+# query with the same one on Postgres, archived_only=True restricts it to the archive
+
+
+def fetch_time_series_chart_data(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    time_series_chart_unit: str,
+    archived_only: bool = False,
+) -> list[dict]:
+    seed_channel_ids = fetch_seed_channel_ids(seed_list_names)
+    return execute_duckdb_query(
+        f"""
+        select date_trunc($unit, message_datetime) as message_dt, count(*) as count
+        from {get_message_source(not archived_only)}
+        where {MESSAGE_WINDOW_FILTER}
+        group by message_dt
+        order by message_dt
+        """,
+        {
+            "unit": time_series_chart_unit,
+            **get_message_window_parameters(seed_channel_ids, start_date, end_date),
+        },
+    )
+
+
+def fetch_top_messages(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    the_limit: int,
+    archived_only: bool = False,
+) -> list[dict]:
+    seed_channel_ids = fetch_seed_channel_ids(seed_list_names)
+    columns = ", ".join([column.name for column in channel_message_table.columns])
+    return execute_duckdb_query(
+        f"""
+        select {columns} from {get_message_source(not archived_only)}
+        where {MESSAGE_WINDOW_FILTER} and message_views is not null
+        order by message_views desc
+        limit $the_limit
+        """,
+        {
+            "the_limit": the_limit,
+            **get_message_window_parameters(seed_channel_ids, start_date, end_date),
+        },
+    )
+
+
+def fetch_weighted_edges_fwd_network(
+    seed_channel_ids: list[str], start_date: str, end_date: str
+) -> list[dict]:
+    return execute_duckdb_query(
+        f"""
+        select channel_id, forwardee_channel_id, count(*) as count_1
+        from {get_message_source()}
+        where {MESSAGE_WINDOW_FILTER}
+        and message_is_forward and forwardee_channel_id is not null
+        group by channel_id, forwardee_channel_id
+        order by channel_id, forwardee_channel_id
+        """,
+        get_message_window_parameters(seed_channel_ids, start_date, end_date),
+    )
+
+
+def fetch_domain_edges(
+    seed_channel_ids: list, start_date: str, end_date: str, archived_only: bool = False
+) -> list[dict]:
+    return execute_duckdb_query(
+        f"""
+        select unnest(regexp_extract_all(message_text, 'https?://\\S+')) as url,
+        channel_id, message_views as weight
+        from {get_message_source(not archived_only)}
+        where {MESSAGE_WINDOW_FILTER}
+        """,
+        get_message_window_parameters(seed_channel_ids, start_date, end_date),
+    )
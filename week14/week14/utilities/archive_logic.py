@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta, timezone
+
+from .db import (
+    archive_message_month,
+    fetch_archived_message_months,
+    fetch_message_datetime_range,
+    get_month_start,
+    rebuild_month_rollups,
+    MESSAGE_COUNT_ROLLUP_UNITS,
+    fetch_time_series_chart_data as fetch_hot_time_series_chart_data,
+    fetch_top_messages as fetch_hot_top_messages,
+    fetch_domain_edges as fetch_hot_domain_edges,
+)
+from .analytics_db import (
+    stage_archive_month,
+    fetch_staged_archive_months,
+    publish_staged_archive_month,
+    discard_staged_archive_month,
+    summarize_archived_month,
+    fetch_time_series_chart_data as fetch_cold_time_series_chart_data,
+    fetch_top_messages as fetch_cold_top_messages,
+    fetch_domain_edges as fetch_cold_domain_edges,
+)
+
+ARCHIVE_AFTER_MONTHS = 12
+
+
+def get_archive_cutoff(older_than_months: int) -> datetime:
+    # the first month that stays in Postgres
+    month_start = get_month_start(datetime.now(timezone.utc))
+    for _ in range(older_than_months):
+        month_start = get_month_start(month_start - timedelta(days=1))
+    return month_start
+
+
+def finish_staged_archive_months() -> None:
+    # A run that died between staging a month and publishing it left the month in the staging
+    # directory: publish it if its transaction committed (archived_message_months has the
+    # archived_at it was staged for), otherwise the rows are still in Postgres, so drop it
+    archived_at_by_month = {}
+    for archived_month in fetch_archived_message_months():
+        month = get_month_start(archived_month["message_month"]).strftime("%Y-%m")
+        archived_at_by_month[month] = archived_month["archived_at"]
+    for staged_month in fetch_staged_archive_months():
+        month = staged_month["message_month"]
+        if (
+            staged_month["archived_at"] is not None
+            and archived_at_by_month.get(month) == staged_month["archived_at"]
+        ):
+            publish_staged_archive_month(month)
+            print(f"published the archive of {month} left staged by an earlier run")
+        else:
+            discard_staged_archive_month(month)
+            print(f"discarded the archive of {month} left staged by an earlier run")
+
+
+def archive_month(month_start: datetime) -> int:
+    # The new archive files are only swapped in once the rows are gone from Postgres, so the
+    # dashboard queries never see a month in both places
+    month = month_start.strftime("%Y-%m")
+    try:
+        num_moved = archive_message_month(
+            month_start,
+            lambda csv_path, archived_at: stage_archive_month(csv_path, month_start, archived_at),
+        )
+    except Exception:
+        discard_staged_archive_month(month)
+        raise
+    if num_moved > 0:
+        publish_staged_archive_month(month)
+    return num_moved
+
+
+def archive_cold_messages(older_than_months: int = ARCHIVE_AFTER_MONTHS) -> int:
+    """
+    Move every month of channel_messages that ended more than older_than_months months ago to
+    the Parquet archive, oldest first, one month per transaction. Safe to run again: months
+    already archived are skipped, messages that have reappeared in Postgres since (an old
+    channel crawled again) are merged into their month's archive, and a month an interrupted
+    run left staged is finished or rolled back first. Returns the number moved.
+    """
+    finish_staged_archive_months()
+    cutoff = get_archive_cutoff(older_than_months)
+    first_datetime, _ = fetch_message_datetime_range()
+    num_moved = 0
+    month_start = get_month_start(first_datetime) if first_datetime is not None else cutoff
+    while month_start < cutoff:
+        num_month_moved = archive_month(month_start)
+        if num_month_moved > 0:
+            print(f"archived {num_month_moved} messages from {month_start.strftime('%Y-%m')}")
+        num_moved += num_month_moved
+        month_start = get_month_start(month_start + timedelta(days=32))
+    return num_moved
+
+
+def backfill_message_rollups(first_month: datetime = None, last_month: datetime = None) -> None:
+    """
+    Rebuild channel_message_counts_hourly and forward_edges_daily month by month, from the
+    archive and the messages in Postgres, over every month that has messages (or those from
+    first_month to last_month). For a database that had messages before the rollups existed,
+    or to repair them after messages were changed behind the insert paths' back.
+    """
+    archived_months = [
+        archived_month["message_month"] for archived_month in fetch_archived_message_months()
+    ]
+    first_datetime, last_datetime = fetch_message_datetime_range()
+    month_starts = archived_months + [
+        get_month_start(value) for value in [first_datetime, last_datetime] if value is not None
+    ]
+    if len(month_starts) == 0:
+        return
+    month_start = get_month_start(first_month or min(month_starts))
+    last_month_start = get_month_start(last_month or max(month_starts))
+    while month_start <= last_month_start:
+        rebuild_month_rollups(month_start, summarize_archived_month(month_start.strftime("%Y-%m")))
+        print(f"rebuilt the rollups of {month_start.strftime('%Y-%m')}")
+        month_start = get_month_start(month_start + timedelta(days=32))
+    return
+
+
+def reaches_archive(start_date: str) -> bool:
+    # whether a query from start_date on could find anything in the archive
+    archived_months = fetch_archived_message_months()
+    if len(archived_months) == 0:
+        return False
+    archive_end = get_month_start(archived_months[-1]["message_month"] + timedelta(days=32))
+    return datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) < archive_end
+
+
+# The dashboard message queries with Postgres and the archive combined, for callers of the
+# db.py functions of the same names
+
+
+def fetch_time_series_chart_data(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    time_series_chart_unit: str,
+) -> list[dict]:
+    records = fetch_hot_time_series_chart_data(
+        seed_list_names, start_date, end_date, time_series_chart_unit
+    )
+    # the hourly rollup behind the coarser units already counts archived messages
+    if time_series_chart_unit in MESSAGE_COUNT_ROLLUP_UNITS or not reaches_archive(start_date):
+        return records
+    # a week or month can straddle the archive boundary, so counts are added up per bucket
+    counts = {}
+    for record in records + fetch_cold_time_series_chart_data(
+        seed_list_names, start_date, end_date, time_series_chart_unit, archived_only=True
+    ):
+        counts[record["message_dt"]] = counts.get(record["message_dt"], 0) + record["count"]
+    return [
+        {"message_dt": message_dt, "count": counts[message_dt]} for message_dt in sorted(counts)
+    ]
+
+
+def fetch_top_messages(
+    seed_list_names: list[str], start_date: str, end_date: str, the_limit: int
+) -> list[dict]:
+    records = fetch_hot_top_messages(seed_list_names, start_date, end_date, the_limit)
+    if not reaches_archive(start_date):
+        return records
+    records += fetch_cold_top_messages(
+        seed_list_names, start_date, end_date, the_limit, archived_only=True
+    )
+    records = sorted(records, key=lambda record: record["message_views"], reverse=True)
+    return records[:the_limit]
+
+
+def fetch_domain_edges(
+    seed_channel_ids: list, start_date: str, end_date: str
+) -> list[dict]:
+    records = fetch_hot_domain_edges(seed_channel_ids, start_date, end_date)
+    if not reaches_archive(start_date):
+        return records
+    return records + fetch_cold_domain_edges(
+        seed_channel_ids, start_date, end_date, archived_only=True
+    )
@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from telethon.sync import TelegramClient
+
+from .harvest_logic import (
+    harvest_many_channels,
+    print_harvest_report,
+    MAX_CONCURRENT_CHANNELS,
+)
+from .rate_limiter import AdaptiveRateLimiter
+from .telemetry import write_crawl_telemetry
+
+
+def shard_channels(channel_names: list[str], num_shards: int) -> list[list[str]]:
+    # Deal channels out round-robin, so every account gets a similar share
+    return [channel_names[i::num_shards] for i in range(num_shards)]
+
+
+def log_in_all_accounts(credentials: list[dict]) -> None:
+    # Worker processes can't prompt for a phone number or login code, so make sure every
+    # account has an authorized session file before fanning out
+    for credential in credentials:
+        with TelegramClient(
+            credential["app_name"], credential["api_id"], credential["api_hash"]
+        ) as client:
+            print(f"session {credential['app_name']} is logged in as {client.get_me().username}")
+
+
+def harvest_shard(
+    credential: dict, channel_names: list[str], max_concurrent_channels: int
+) -> list[dict]:
+    # Runs in its own process: one account, one session file and one rate limiter, so each
+    # account spends its own flood budget
+    reports = asyncio.run(
+        harvest_many_channels(
+            channel_names,
+            credential["app_name"],
+            credential["api_id"],
+            credential["api_hash"],
+            max_concurrent_channels,
+            AdaptiveRateLimiter(),
+        )
+    )
+    for report in reports:
+        report["credential"] = credential["app_name"]
+    write_crawl_telemetry(f"harvest-{credential['app_name']}")
+    return reports
+
+
+def harvest_with_credential_pool(
+    channel_names: list[str],
+    credentials: list[dict],
+    max_concurrent_channels: int = MAX_CONCURRENT_CHANNELS,
+) -> list[dict]:
+    """
+    Shard channels across every configured Telegram account and crawl the shards in parallel,
+    one worker process per account. Wall-clock time should shrink close to linearly with the
+    number of accounts, since each one is throttled independently by Telegram.
+    """
+    app_names = [credential["app_name"] for credential in credentials]
+    if len(set(app_names)) < len(app_names):
+        raise ValueError("every telegram-credentials-N section needs its own app-name")
+
+    log_in_all_accounts(credentials)
+
+    shards = shard_channels(channel_names, len(credentials))
+
+    # spawn rather than fork, so no worker inherits the parent's DB connections
+    with ProcessPoolExecutor(
+        max_workers=len(credentials), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(harvest_shard, credential, shard, max_concurrent_channels)
+            for credential, shard in zip(credentials, shards)
+            if len(shard) > 0
+        ]
+        reports = [report for future in futures for report in future.result()]
+
+    print_harvest_report(reports)
+    return reports
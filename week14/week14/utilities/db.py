@@ -1,8 +1,133 @@
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import zstandard
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, ARRAY
 from sqlalchemy.sql.schema import Table as SQLAlchemyTable
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator
 from ..config import config
 
+PAYLOAD_COMPRESSION_LEVEL = 3
+PAYLOAD_DICTIONARY_SIZE = 64 * 1024
+PAYLOAD_DICTIONARY_SAMPLE_SIZE = 10000
+PAYLOAD_DICTIONARY_MIN_SAMPLES = 100
+COPY_CHUNK_SIZE = 10000
+# What to do with an incoming row whose key is already in the table
+UPSERT_POLICIES = ("ignore", "update-metrics", "update-all")
+ANALYTICS_ENGINES = ("postgres", "duckdb")
+# (version, name, statements) for apply_schema_migrations, oldest first. Never edit one that
+# has shipped; add a new version instead. Indexes created on a partitioned channel_messages
+# are created on every partition, present and future.
+SCHEMA_MIGRATIONS = [
+    (
+        1,
+        "index suite for the dashboard queries",
+        [
+            # the seed list lookups every dashboard query starts with, answered from the index
+            "create index if not exists seeds_seed_list_idx "
+            "on seeds (seed_list) include (channel_id, channel_name)",
+            "create index if not exists seeds_channel_name_idx on seeds (channel_name)",
+            # time series, domain edges, and ranking for top messages without heap lookups
+            "create index if not exists channel_messages_channel_datetime_idx "
+            "on channel_messages (channel_id, message_datetime) include (message_id, message_views)",
+            # forward network and discovery frontier, over forwards only
+            "create index if not exists channel_messages_forwards_idx "
+            "on channel_messages (channel_id, message_datetime) "
+            "include (forwardee_channel_id, message_id) "
+            "where message_is_forward and forwardee_channel_id is not null",
+            # date-only filters over an append-mostly table, at a fraction of a btree's size
+            "create index if not exists channel_messages_datetime_brin_idx "
+            "on channel_messages using brin (message_datetime)",
+            "analyze seeds",
+            "analyze channel_messages",
+        ],
+    ),
+    (
+        2,
+        "full-text search on message_text",
+        [
+            # Russian and English stems of every message, so a search matches either language.
+            # Adding a stored column rewrites the table once.
+            "alter table channel_messages add column if not exists message_tsv tsvector "
+            "generated always as ("
+            "to_tsvector('russian', coalesce(message_text, '')) || "
+            "to_tsvector('english', coalesce(message_text, ''))"
+            ") stored",
+            "create index if not exists channel_messages_message_tsv_idx "
+            "on channel_messages using gin (message_tsv)",
+            "analyze channel_messages",
+        ],
+    ),
+    (
+        3,
+        "seed channel_metadata_history from channel_metadata",
+        [
+            "insert into channel_metadata_history "
+            "(channel_id, checkup_time, num_subscribers, channel_title, bio_hash) "
+            "select channel_id, coalesce(checkup_time, now()), num_subscribers, channel_title, "
+            "md5(channel_bio) from channel_metadata "
+            "on conflict do nothing",
+        ],
+    ),
+    (
+        4,
+        "count the stored messages into channel_message_counts_hourly",
+        [
+            # the insert paths keep the rollup up to date from here on; months archived
+            # before this ran are counted by backfill_message_rollups.py
+            "insert into channel_message_counts_hourly (channel_id, message_hour, num_messages) "
+            "select channel_id, date_trunc('hour', message_datetime), count(*) "
+            "from channel_messages where message_datetime is not null "
+            "group by 1, 2 "
+            "on conflict (channel_id, message_hour) "
+            "do update set num_messages = excluded.num_messages",
+            "analyze channel_message_counts_hourly",
+        ],
+    ),
+    (
+        5,
+        "sum the stored forwards into forward_edges_daily",
+        [
+            # as in migration 4; archived months are summed by backfill_message_rollups.py
+            "insert into forward_edges_daily "
+            "(channel_id, day, forwardee_channel_id, count, views) "
+            "select channel_id, (message_datetime at time zone 'UTC')::date, "
+            "forwardee_channel_id, count(*), coalesce(sum(message_views), 0) "
+            "from channel_messages "
+            "where message_is_forward and forwardee_channel_id is not null "
+            "and message_datetime is not null "
+            "group by 1, 2, 3 "
+            "on conflict (channel_id, day, forwardee_channel_id) "
+            "do update set count = excluded.count, views = excluded.views",
+            "analyze forward_edges_daily",
+        ],
+    ),
+]
+MESSAGE_SEARCH_CONFIGS = ("russian", "english")
+# time series units made of whole hours, answered from channel_message_counts_hourly
+MESSAGE_COUNT_ROLLUP_UNITS = ("hour", "day", "week", "month", "quarter", "year")
+# what the insert paths return of each message written, to bring the rollups up to date
+MESSAGE_ROLLUP_COLUMNS = [
+    "channel_id",
+    "message_id",
+    "message_datetime",
+    "message_views",
+    "message_forwards",
+    "forwardee_channel_id",
+    "message_is_forward",
+]
+# the channel_metadata columns tracked in channel_metadata_history, and refreshed by "update-metrics"
+CHANNEL_METADATA_METRIC_COLUMNS = ["num_subscribers", "channel_title", "channel_bio"]
+# Postgres' name for the unique constraint on channel_metadata.channel_name
+CHANNEL_NAME_CONSTRAINT = "channel_metadata_channel_name_key"
+
 
 def instantiate_credentials_table(my_table_name: str) -> SQLAlchemyTable:
     my_table = sa.Table(
@@ -45,7 +170,6 @@ def instantiate_channel_metadata_table(my_table_name: str) -> SQLAlchemyTable:
         sa.Column(
             "checkup_time", sa.types.DateTime(timezone=True), default=datetime.utcnow
         ),
-        sa.Column("api_response", sa.types.JSON, nullable=False),
     )
     return my_table
 
@@ -61,356 +185,1969 @@ def instantiate_seed_table(my_table_name: str) -> SQLAlchemyTable:
     return my_table
 
 
-def insert_data_into_channel_metadata_table(records: list[dict]) -> None:
-    stmt = sa.insert(channel_metadata_table).values(records)
-    with engine.connect() as conn:
-        conn.execute(stmt)
-        conn.commit()
-    return
+def instantiate_channel_metadata_history_table(my_table_name: str) -> SQLAlchemyTable:
+    # one row per (channel, checkup) where the subscribers, title or bio changed
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("checkup_time", sa.types.DateTime(timezone=True), primary_key=True),
+        sa.Column("num_subscribers", sa.types.INTEGER),
+        sa.Column("channel_title", sa.types.TEXT),
+        sa.Column("bio_hash", sa.types.TEXT),
+    )
+    return my_table
 
 
-def insert_data_into_channel_metadata_table_advanced(records: list[dict]) -> None:
-    # check if the table already contains channels matching the IDs of the incoming records
-    stmt = sa.select(channel_metadata_table.c.channel_id).where(
-        channel_metadata_table.c.channel_id.in_(
-            [record["channel_id"] for record in records]
+def make_metadata_history_statement(records: list[dict]):
+    """
+    INSERT into channel_metadata_history the records whose subscribers, title or bio differ
+    from the latest snapshot of their channel (or that have none yet), stamped with their
+    checkup_time. Bios are stored as an md5 hash, which is all a change check needs.
+    """
+    history = channel_metadata_history_table
+    incoming = make_unnest_select(channel_metadata_table, records).cte("incoming")
+    latest = (
+        sa.select(history)
+        .distinct(history.c.channel_id)
+        .where(history.c.channel_id.in_(sa.select(incoming.c.channel_id)))
+        .order_by(history.c.channel_id, history.c.checkup_time.desc())
+        .subquery("latest")
+    )
+    tracked = {
+        "num_subscribers": incoming.c.num_subscribers,
+        "channel_title": incoming.c.channel_title,
+        "bio_hash": sa.func.md5(incoming.c.channel_bio),
+    }
+    return (
+        pg_insert(history)
+        .from_select(
+            ["channel_id", "checkup_time", *tracked],
+            sa.select(incoming.c.channel_id, incoming.c.checkup_time, *tracked.values())
+            .select_from(
+                incoming.outerjoin(latest, latest.c.channel_id == incoming.c.channel_id)
+            )
+            .where(
+                sa.or_(
+                    latest.c.channel_id.is_(None),
+                    *[latest.c[column].is_distinct_from(value) for column, value in tracked.items()],
+                )
+            ),
         )
+        .on_conflict_do_nothing()
     )
-    with engine.connect() as conn:
-        rp = conn.execute(stmt)
-        rows = rp.fetchall()
-    if len(rows) > 0:
-        rows = [x for (x,) in rows]
-
-    new_records = [record for record in records if record["channel_id"] not in rows]
-    duplicate_records = [record for record in records if record["channel_id"] in rows]
-
-    if len(new_records) > 0:
-        # save new_records
-        try:
-            stmt = sa.insert(channel_metadata_table).values(new_records)
-            with engine.connect() as conn:
-                conn.execute(stmt)
-                conn.commit()
-        except Exception as e:
-            print(e)
-    if len(duplicate_records) > 0:
-        pass  # do nothing with these
-    return
 
 
-def insert_data_into_seed_table(records: list[dict]) -> None:
-    stmt = sa.insert(seed_table).values(records)
+def insert_data_into_channel_metadata_table(records: list[dict]) -> None:
+    records, payload_records = split_api_responses(
+        records, ["channel_id"], channel_metadata_table_name
+    )
+    stmt = sa.insert(channel_metadata_table).values(records)
     with engine.connect() as conn:
         conn.execute(stmt)
+        insert_payloads(conn, channel_metadata_payload_table, payload_records)
         conn.commit()
     return
 
 
-def instantiate_channel_messages_table(my_table_name: str) -> SQLAlchemyTable:
+def insert_data_into_channel_metadata_table_advanced(
+    records: list[dict], policy: str = "update-metrics", skip_name_conflicts: bool = True
+) -> int:
+    """
+    Insert channel metadata with a single INSERT ... ON CONFLICT (channel_id). Existing
+    channels are left alone (policy "ignore"), get num_subscribers, title and bio refreshed
+    ("update-metrics"), or get every column refreshed ("update-all"); rows are only rewritten
+    when something actually changed. Whatever the policy, a record whose subscribers, title or
+    bio differ from its channel's last snapshot is added to channel_metadata_history, in the
+    same transaction. Returns the number of rows written: 0 when the batch was skipped because
+    a channel_name is already taken by another channel_id (unless skip_name_conflicts is
+    False, for callers that must not lose a batch); every other error is raised.
+    """
+    records = list({record["channel_id"]: record for record in records}.values())
+    if len(records) == 0:
+        return 0
+    records, payload_records = split_api_responses(
+        records, ["channel_id"], channel_metadata_table_name
+    )
+
+    num_written = 0
+    try:
+        with engine.connect() as conn:
+            conn.execute(make_metadata_history_statement(records))
+            stmt = make_upsert_statement(
+                channel_metadata_table,
+                records,
+                ["channel_id"],
+                CHANNEL_METADATA_METRIC_COLUMNS,
+                policy,
+            )
+            rp = conn.execute(stmt)
+            num_written = rp.rowcount
+            insert_payloads(
+                conn, channel_metadata_payload_table, payload_records, policy != "ignore"
+            )
+            conn.commit()
+    except sa.exc.IntegrityError as e:
+        # A username that moved to a different channel_id is still held by the old row; the
+        # batch is skipped. Anything else is the caller's to handle.
+        if not skip_name_conflicts or e.orig.diag.constraint_name != CHANNEL_NAME_CONSTRAINT:
+            raise
+        print(e)
+    return num_written
+
+
+def instantiate_channel_message_payloads_table(my_table_name: str) -> SQLAlchemyTable:
     my_table = sa.Table(
         my_table_name,
         meta,
         sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
         sa.Column("message_id", sa.types.INTEGER, primary_key=True),
-        sa.Column("message_datetime", sa.types.DateTime(timezone=True)),
-        sa.Column("message_views", sa.types.INTEGER, default=None),
-        sa.Column("message_forwards", sa.types.INTEGER, default=None),
-        sa.Column("message_text", sa.types.TEXT, default=None),
-        sa.Column("forwardee_channel_id", sa.types.BIGINT, default=None),
-        sa.Column("forwardee_message_id", sa.types.INTEGER, default=None),
-        sa.Column("message_is_forward", sa.types.BOOLEAN, default=None),
-        sa.Column("data_source", sa.types.TEXT, default="telegram-api"),
-        sa.Column(
-            "checkup_time", sa.types.DateTime(timezone=True), default=datetime.utcnow
-        ),
-        sa.Column("api_response", sa.types.JSON, nullable=False),
+        sa.Column("dictionary_id", sa.types.INTEGER, default=None),
+        sa.Column("payload", sa.types.LargeBinary, nullable=False),
     )
     return my_table
 
 
-def insert_data_into_channel_messages_table(records: list[dict]) -> None:
-    stmt = sa.insert(channel_message_table).values(records)
-    with engine.connect() as conn:
-        conn.execute(stmt)
-        conn.commit()
-    return
-
+def instantiate_channel_metadata_payloads_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("dictionary_id", sa.types.INTEGER, default=None),
+        sa.Column("payload", sa.types.LargeBinary, nullable=False),
+    )
+    return my_table
 
-def insert_data_into_channel_messages_table_advanced(records: list[dict]) -> None:
-    """
-    This function receives a list of records to insert into the channel messages SQL table.
-    That table, however, imposes a primary key restriction on unique tuples (channel_id, message_id).
-    Incoming messages should therefore be partitioned into new_records and duplicate_records, where
-    new records have (channel_id, message_id) tuples that do not match any records in the table, while
-    # duplicate records do already have matches in the table. These two partitions should be handled
-    differently.
-    """
 
-    stmt = sa.select(
-        channel_message_table.c.channel_id, channel_message_table.c.message_id
-    ).filter(
-        channel_message_table.c.channel_id.in_(
-            [record["channel_id"] for record in records]
-        ),
-        channel_message_table.c.message_id.in_(
-            [record["message_id"] for record in records]
+def instantiate_payload_dictionaries_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("dictionary_id", sa.types.INTEGER, primary_key=True, autoincrement=True),
+        sa.Column("payload_kind", sa.types.TEXT, nullable=False),
+        sa.Column("dictionary", sa.types.LargeBinary, nullable=False),
+        sa.Column(
+            "created_at", sa.types.DateTime(timezone=True), default=datetime.utcnow
         ),
     )
+    return my_table
 
-    with engine.connect() as conn:
-        rp = conn.execute(stmt)
-        rows = rp.fetchall()
-    if len(rows) > 0:
-        # there is some overlap, so there would be an integrity violation if you attempted to write
-        # these records to the database. Instead, let's partition the records to those that are ok
-        # to write to the table, and those that are not ok
-        new_records = [
-            record
-            for record in records
-            if (int(record["channel_id"]), int(record["message_id"])) not in rows
-        ]
-        duplicate_records = [record for record in records if record not in new_records]
-    else:
-        new_records = records
-        duplicate_records = []
 
-    if len(new_records) > 0:
-        stmt = sa.insert(channel_message_table).values(new_records)
+def fetch_payload_dictionary(dictionary_id: int) -> zstandard.ZstdCompressionDict:
+    # dictionaries never change once written, so each process only loads them once
+    if dictionary_id not in payload_dictionary_cache:
         with engine.connect() as conn:
-            conn.execute(stmt)
-            conn.commit()
-    if len(duplicate_records) > 0:
-        pass  # Exercise: add code here to update rows, replacing old data with new
-
-    return
+            rp = conn.execute(
+                sa.select(payload_dictionary_table.c.dictionary).where(
+                    payload_dictionary_table.c.dictionary_id == dictionary_id
+                )
+            )
+            payload_dictionary_cache[dictionary_id] = zstandard.ZstdCompressionDict(
+                rp.scalar()
+            )
+    return payload_dictionary_cache[dictionary_id]
 
 
-def fetch_seed_list_names() -> list[dict]:
+def fetch_latest_payload_dictionary_id(payload_kind: str) -> int|None:
     with engine.connect() as conn:
         rp = conn.execute(
-            sa.select(seed_table.c.seed_list).distinct(seed_table.c.seed_list)
+            sa.select(sa.sql.func.max(payload_dictionary_table.c.dictionary_id)).where(
+                payload_dictionary_table.c.payload_kind == payload_kind
+            )
         )
-        rows = rp.fetchall()
-    return [row for (row,) in rows]
+        return rp.scalar()
 
 
-def fetch_seed_list_preview(my_seed_list_names: list[str]) -> list[dict]:
-    with engine.connect() as conn:
-        rp = conn.execute(
-            sa.select(seed_table).where(seed_table.c.seed_list.in_(my_seed_list_names))
+def make_payload_compressor(payload_kind: str) -> tuple[zstandard.ZstdCompressor, int|None]:
+    # Telethon JSON payloads are small and full of repeated keys, which is exactly where a
+    # trained zstd dictionary pays off (roughly 4x smaller than compressing rows on their own)
+    dictionary_id = fetch_latest_payload_dictionary_id(payload_kind)
+    if dictionary_id is None:
+        return zstandard.ZstdCompressor(level=PAYLOAD_COMPRESSION_LEVEL), None
+    compressor = zstandard.ZstdCompressor(
+        level=PAYLOAD_COMPRESSION_LEVEL, dict_data=fetch_payload_dictionary(dictionary_id)
+    )
+    return compressor, dictionary_id
+
+
+def compress_payload(api_response: str, compressor: zstandard.ZstdCompressor) -> bytes:
+    return compressor.compress(api_response.encode("utf-8"))
+
+
+def decompress_payload(payload: bytes, dictionary_id: int|None) -> dict:
+    if dictionary_id is None:
+        decompressor = zstandard.ZstdDecompressor()
+    else:
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=fetch_payload_dictionary(dictionary_id)
         )
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    for record in records:
-        record["channel_id"] = int(record["channel_id"])
-    return records
+    return json.loads(decompressor.decompress(payload))
 
 
-def fetch_birth_chart_data(
-    seed_list_names: list[str], birth_chart_unit: str
-) -> list[dict]:
-    seed_channel_ids = list(
-        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
+def train_payload_dictionary(payload_kind: str, samples: list[str]) -> int:
+    dictionary = zstandard.train_dictionary(
+        PAYLOAD_DICTIONARY_SIZE, [sample.encode("utf-8") for sample in samples]
     )
-
     stmt = (
-        sa.select(
-            sa.sql.func.date_trunc(
-                birth_chart_unit, channel_metadata_table.c.channel_birthdate
-            ),
-            sa.sql.func.count(),
-        )
-        .filter(channel_metadata_table.c.channel_id.in_(seed_channel_ids))
-        .group_by(
-            sa.sql.func.date_trunc(
-                birth_chart_unit, channel_metadata_table.c.channel_birthdate
-            )
-        )
-        .order_by(
-            sa.sql.func.date_trunc(
-                birth_chart_unit, channel_metadata_table.c.channel_birthdate
-            )
-        )
+        sa.insert(payload_dictionary_table)
+        .values(payload_kind=payload_kind, dictionary=dictionary.as_bytes())
+        .returning(payload_dictionary_table.c.dictionary_id)
     )
     with engine.connect() as conn:
         rp = conn.execute(stmt)
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    return [
-        {"creation_dt": record["date_trunc_1"], "count": record["count_1"]}
-        for record in records
-    ]
-
+        dictionary_id = rp.scalar()
+        conn.commit()
+    print(f"trained {payload_kind} payload dictionary {dictionary_id} from {len(samples)} samples")
+    return dictionary_id
 
-def fetch_time_series_chart_data(
-    seed_list_names: list[str],
-    start_date: str,
-    end_date: str,
-    time_series_chart_unit: str,
-) -> list[dict]:
-    seed_channel_ids = list(
-        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
-    )
 
-    stmt = (
-        sa.select(
-            sa.sql.func.date_trunc(
-                time_series_chart_unit, channel_message_table.c.message_datetime
-            ),
-            sa.sql.func.count(),
-        )
-        .filter(
-            channel_message_table.c.channel_id.in_(seed_channel_ids),
-            channel_message_table.c.message_datetime
-            >= datetime.strptime(start_date, "%Y-%m-%d"),
-            channel_message_table.c.message_datetime
-            <= datetime.strptime(end_date, "%Y-%m-%d"),
+def retrain_payload_dictionary(
+    payload_kind: str, sample_size: int = PAYLOAD_DICTIONARY_SAMPLE_SIZE
+) -> int|None:
+    """
+    Train a new dictionary on a random sample of the stored payloads, e.g. after Telegram adds
+    fields to its responses, and return its id. The payload tables have no time column, and
+    their keys would favour the highest channel_ids, so rows are sampled across the whole
+    table. With fewer than PAYLOAD_DICTIONARY_MIN_SAMPLES payloads there is too little to
+    train on: nothing is trained and None is returned.
+    """
+    payload_table = payload_tables_by_kind[payload_kind]
+    with engine.connect() as conn:
+        # the planner's row estimate is enough to aim the sample at about twice sample_size
+        num_rows = conn.execute(
+            sa.text("select reltuples from pg_class where oid = to_regclass(:table_name)"),
+            {"table_name": payload_table.name},
+        ).scalar()
+        sample_percent = (
+            100.0 if not num_rows or num_rows <= 0 else min(100.0, 200.0 * sample_size / num_rows)
         )
-        .group_by(
-            sa.sql.func.date_trunc(
-                time_series_chart_unit, channel_message_table.c.message_datetime
+        while True:
+            sampled = payload_table.tablesample(sa.func.bernoulli(sample_percent))
+            rp = conn.execute(
+                sa.select(sampled.c.payload, sampled.c.dictionary_id).limit(sample_size)
             )
+            rows = rp.fetchall()
+            # an estimate from before the table grew comes up short; sample everything then
+            if len(rows) >= sample_size or sample_percent >= 100.0:
+                break
+            sample_percent = 100.0
+    if len(rows) < PAYLOAD_DICTIONARY_MIN_SAMPLES:
+        print(
+            f"only {len(rows)} {payload_kind} payloads stored, fewer than the "
+            f"{PAYLOAD_DICTIONARY_MIN_SAMPLES} needed to train a dictionary; not training one"
         )
-        .order_by(
-            sa.sql.func.date_trunc(
-                time_series_chart_unit, channel_message_table.c.message_datetime
-            )
+        return None
+    samples = [json.dumps(decompress_payload(row.payload, row.dictionary_id)) for row in rows]
+    return train_payload_dictionary(payload_kind, samples)
+
+
+def split_api_responses(
+    records: list[dict], key_columns: list[str], payload_kind: str
+) -> tuple[list[dict], list[dict]]:
+    """
+    The raw Telethon JSON makes up most of every row, yet hardly any query needs it. Split it
+    off the incoming records and return (records without api_response, payload records with
+    the zstd-compressed JSON keyed by key_columns), to be written to the payload tables.
+    """
+    compressor, dictionary_id = make_payload_compressor(payload_kind)
+    lean_records = []
+    payload_records = []
+    for record in records:
+        record = dict(record)
+        api_response = record.pop("api_response", None)
+        lean_records.append(record)
+        if api_response is None:
+            continue
+        if not isinstance(api_response, str):
+            api_response = json.dumps(api_response, default=str)
+        payload_records.append(
+            {
+                **{key_column: record[key_column] for key_column in key_columns},
+                "dictionary_id": dictionary_id,
+                "payload": compress_payload(api_response, compressor),
+            }
         )
+    return lean_records, payload_records
+
+
+def insert_payloads(
+    conn: sa.Connection,
+    payload_table: SQLAlchemyTable,
+    payload_records: list[dict],
+    overwrite: bool = True,
+) -> None:
+    # Called inside the caller's transaction, so rows and payloads are committed together
+    if len(payload_records) == 0:
+        return
+    unnested = make_unnest_select(payload_table, payload_records)
+    stmt = pg_insert(payload_table).from_select(
+        [column.name for column in unnested.selected_columns], unnested
     )
+    if overwrite:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(payload_table.primary_key.columns),
+            set_={
+                "dictionary_id": stmt.excluded.dictionary_id,
+                "payload": stmt.excluded.payload,
+            },
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing()
+    conn.execute(stmt)
+    return
 
-    with engine.connect() as conn:
-        rp = conn.execute(stmt)
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
+
+def get_upsert_update_columns(
+    table: SQLAlchemyTable, key_columns: list[str], metric_columns: list[str], policy: str
+) -> list[str]:
+    # The columns an ON CONFLICT DO UPDATE rewrites under policy; checkup_time always follows
+    if policy not in UPSERT_POLICIES:
+        raise ValueError(f"policy must be one of {UPSERT_POLICIES}, not {policy!r}")
+    if policy == "ignore":
+        return []
+    if policy == "update-metrics":
+        return metric_columns
     return [
-        {"message_dt": record["date_trunc_1"], "count": record["count_1"]}
-        for record in records
+        column.name
+        for column in table.columns
+        if column.name not in key_columns and column.name != "checkup_time"
     ]
 
 
-def fetch_top_messages(
-    seed_list_names: list[str], start_date: str, end_date: str, the_limit: int
-) -> list[dict]:
-    seed_channel_ids = list(
-        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
-    )
-
-    with engine.connect() as conn:
-        rp = conn.execute(
-            sa.select(channel_message_table)
-            .filter(
-                channel_message_table.c.channel_id.in_(seed_channel_ids),
-                channel_message_table.c.message_views.is_not(None),
-                channel_message_table.c.message_datetime
-                >= datetime.strptime(start_date, "%Y-%m-%d"),
-                channel_message_table.c.message_datetime
-                <= datetime.strptime(end_date, "%Y-%m-%d"),
+def make_unnest_select(table: SQLAlchemyTable, records: list[dict]) -> sa.Select:
+    """
+    select * from unnest(:channel_id, :message_id, ...): the records passed as one array per
+    column. The statement stays the same size, and compiles just as fast, whatever the
+    number of records, unlike a multi-row VALUES list with a bind parameter per value.
+    """
+    records = apply_column_defaults(table, records)
+    columns = [column for column in table.columns if column.name in records[0]]
+    rows = sa.func.unnest(
+        *[
+            sa.bindparam(
+                f"{column.name}_values",
+                [record.get(column.name) for record in records],
+                type_=ARRAY(column.type),
             )
-            .order_by(channel_message_table.c.message_views.desc())
-            .limit(the_limit)
-        )
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    return records
-
-
-def fetch_seed_metadata_full(seed_list_names: list[str]) -> list[dict]:
-    seed_channel_ids = list(
-        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
+            for column in columns
+        ]
+    ).table_valued(*[column.name for column in columns], name="incoming").render_derived()
+    return sa.select(*[rows.c[column.name] for column in columns])
+
+
+def make_upsert_statement(
+    table: SQLAlchemyTable,
+    records: list[dict],
+    key_columns: list[str],
+    metric_columns: list[str],
+    policy: str,
+):
+    unnested = make_unnest_select(table, records)
+    stmt = pg_insert(table).from_select(
+        [column.name for column in unnested.selected_columns], unnested
+    )
+    update_columns = get_upsert_update_columns(table, key_columns, metric_columns, policy)
+    if len(update_columns) == 0:
+        return stmt.on_conflict_do_nothing(index_elements=key_columns)
+    return stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: stmt.excluded[column] for column in update_columns + ["checkup_time"]},
+        # rows that would come out unchanged are skipped, so they aren't rewritten for nothing
+        where=sa.or_(
+            *[table.c[column].is_distinct_from(stmt.excluded[column]) for column in update_columns]
+        ),
     )
-
-    with engine.connect() as conn:
-        rp = conn.execute(
-            sa.select(channel_metadata_table)
-            .where(channel_metadata_table.c.channel_id.in_(seed_channel_ids))
-            .order_by(channel_metadata_table.c.num_subscribers.desc())
-        )
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    return records
 
 
-def fetch_weighted_edges_fwd_network(
-    seed_channel_ids: list[str], start_date: str, end_date: str
-) -> list[dict]:
+def fetch_message_api_responses(message_keys: list[tuple[int, int]]) -> dict:
+    # Raw Telethon JSON for the given (channel_id, message_id) pairs, only when explicitly asked for
+    if len(message_keys) == 0:
+        return {}
     with engine.connect() as conn:
         rp = conn.execute(
-            sa.select(
-                channel_message_table.c.channel_id,
-                channel_message_table.c.forwardee_channel_id,
-                sa.sql.func.count(),
-            )
-            .filter(
-                channel_message_table.c.channel_id.in_(seed_channel_ids),
-                channel_message_table.c.message_is_forward == True,
-                channel_message_table.c.forwardee_channel_id.is_not(None),
-                channel_message_table.c.message_datetime
-                >= datetime.strptime(start_date, "%Y-%m-%d"),
-                channel_message_table.c.message_datetime
-                <= datetime.strptime(end_date, "%Y-%m-%d"),
-            )
-            .group_by(
-                channel_message_table.c.channel_id,
-                channel_message_table.c.forwardee_channel_id,
-            )
-            .order_by(
-                channel_message_table.c.channel_id,
-                channel_message_table.c.forwardee_channel_id,
+            sa.select(channel_message_payload_table).where(
+                sa.tuple_(
+                    channel_message_payload_table.c.channel_id,
+                    channel_message_payload_table.c.message_id,
+                ).in_(message_keys)
             )
         )
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    return records
-
-
-def fetch_metadata_for_single_channel(channel_id: int) -> dict:
-    with engine.connect() as conn:
-        rp = conn.execute(
-            sa.select(channel_metadata_table)
-            .where(channel_metadata_table.c.channel_id == channel_id)
-            .order_by(channel_metadata_table.c.num_subscribers.desc())
+        rows = rp.fetchall()
+    return {
+        (int(row.channel_id), int(row.message_id)): decompress_payload(
+            row.payload, row.dictionary_id
         )
-    records = [dict(elt._mapping) for elt in rp.fetchall()]
-    assert len(records) == 1
-    return records[0]
+        for row in rows
+    }
 
-def look_up_channel_id_with_channel_name(channel_name: str) -> int|None:
-    # Look up the channel ID for a given channel name:
+
+def fetch_channel_metadata_api_response(channel_id: int) -> dict|None:
     with engine.connect() as conn:
         rp = conn.execute(
-            sa.select(seed_table.c.channel_id).where(seed_table.c.channel_name == channel_name)
+            sa.select(channel_metadata_payload_table).where(
+                channel_metadata_payload_table.c.channel_id == channel_id
+            )
         )
-        channel_id = rp.fetchone()
-    if channel_id is None:
+        row = rp.fetchone()
+    if row is None:
         return None
-    return channel_id[0]
+    return decompress_payload(row.payload, row.dictionary_id)
 
-def fetch_target_start_date(channel_name: str):
-    """
-    We are looking up the new messages for a given channel. Possibly, this channel is completely new to our seed list
-    so we want to retrieve their messages all the way back to the beginning of their timeline.
-    Alternatively, it might be a channel we've tracked before, so we just want to get their new messages (back to, say,
-    Jan 31st, 2026).
 
-    This function should figure out what to do:
-    (1) query the database to see if we've ever tracked this channel before, and
-    (2) if so, when last did we do that
+def migrate_api_responses_to_payload_tables(batch_size: int = 10000) -> None:
     """
+    One-off migration for databases created before the payload tables existed: train a
+    compression dictionary on a sample of the existing JSON, copy every api_response column
+    into its compressed payload table batch by batch, then drop the column. Safe to re-run;
+    tables that no longer have the column are skipped.
+    """
+    for payload_kind, payload_table in payload_tables_by_kind.items():
+        column_names = [column["name"] for column in sa.inspect(engine).get_columns(payload_kind)]
+        if "api_response" not in column_names:
+            print(f"{payload_kind}.api_response is already gone")
+            continue
 
-    channel_id = look_up_channel_id_with_channel_name(channel_name)
-    if channel_id is None: # we don't have this channel in our database yet
-        return datetime.strptime("2010-01-01", "%Y-%m-%d").date()
-
-    with engine.connect() as conn:
-        rp = conn.execute(
-            sa.select(channel_message_table.c.message_datetime).where(channel_message_table.c.channel_id == channel_id)
-        )
-        message_datetimes = rp.fetchall() # message_datetimes = []
+        if fetch_latest_payload_dictionary_id(payload_kind) is None:
+            with engine.connect() as conn:
+                rp = conn.execute(
+                    sa.text(
+                        f"select api_response::text from {payload_kind} "
+                        f"where api_response is not null limit :sample_size"
+                    ),
+                    {"sample_size": PAYLOAD_DICTIONARY_SAMPLE_SIZE},
+                )
+                samples = [sample for (sample,) in rp.fetchall()]
+            if len(samples) >= PAYLOAD_DICTIONARY_MIN_SAMPLES:
+                train_payload_dictionary(payload_kind, samples)
+
+        key_columns = [column.name for column in payload_table.primary_key.columns]
+        keys = ", ".join(key_columns)
+        last_key = None
+        num_migrated = 0
+        while True:
+            # keyset pagination, so every batch is an index range scan
+            where_clause = "api_response is not null"
+            params = {"batch_size": batch_size}
+            if last_key is not None:
+                where_clause += f" and ({keys}) > ({', '.join([f':k{i}' for i in range(len(key_columns))])})"
+                params.update({f"k{i}": value for i, value in enumerate(last_key)})
+            with engine.connect() as conn:
+                rp = conn.execute(
+                    sa.text(
+                        f"select {keys}, api_response::text as api_response from {payload_kind} "
+                        f"where {where_clause} order by {keys} limit :batch_size"
+                    ),
+                    params,
+                )
+                rows = [dict(elt._mapping) for elt in rp.fetchall()]
+                if len(rows) == 0:
+                    break
+                _, payload_records = split_api_responses(rows, key_columns, payload_kind)
+                insert_payloads(conn, payload_table, payload_records)
+                conn.commit()
+            last_key = tuple(rows[-1][key_column] for key_column in key_columns)
+            num_migrated += len(rows)
+            print(f"moved {num_migrated} {payload_kind} payloads so far")
 
-    if len(message_datetimes) == 0:
-        return datetime.strptime("2010-01-01", "%Y-%m-%d").date()
+        with engine.connect() as conn:
+            conn.execute(sa.text(f"alter table {payload_kind} drop column api_response"))
+            conn.commit()
+        print(f"dropped {payload_kind}.api_response")
+    return
 
-    most_recent_message_datetime = max(message_datetimes)[0]
-    most_recent_message_date = most_recent_message_datetime.date()
+
+def insert_data_into_seed_table(records: list[dict]) -> None:
+    # a channel that is already on the seed list stays there; re-adding it is a no-op
+    stmt = pg_insert(seed_table).values(records).on_conflict_do_nothing()
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+
+def instantiate_channel_messages_table(
+    my_table_name: str, partitioned: bool = False
+) -> SQLAlchemyTable:
+    # Partitioned by month of message_datetime, the partition key has to be part of the
+    # primary key, and so of every ON CONFLICT target on the table
+    partition_options = {"postgresql_partition_by": "RANGE (message_datetime)"} if partitioned else {}
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("message_id", sa.types.INTEGER, primary_key=True),
+        sa.Column("message_datetime", sa.types.DateTime(timezone=True), primary_key=partitioned),
+        sa.Column("message_views", sa.types.INTEGER, default=None),
+        sa.Column("message_forwards", sa.types.INTEGER, default=None),
+        sa.Column("message_text", sa.types.TEXT, default=None),
+        sa.Column("forwardee_channel_id", sa.types.BIGINT, default=None),
+        sa.Column("forwardee_message_id", sa.types.INTEGER, default=None),
+        sa.Column("message_is_forward", sa.types.BOOLEAN, default=None),
+        sa.Column("data_source", sa.types.TEXT, default="telegram-api"),
+        sa.Column(
+            "checkup_time", sa.types.DateTime(timezone=True), default=datetime.utcnow
+        ),
+        **partition_options,
+    )
+    return my_table
+
+
+def fetch_table_layout(my_table_name: str) -> str|None:
+    # "partitioned" or "plain" for an existing table, None if there is no such table
+    with engine.connect() as conn:
+        relkind = conn.execute(
+            sa.text("select relkind from pg_class where oid = to_regclass(:table_name)"),
+            {"table_name": my_table_name},
+        ).scalar()
+    if relkind is None:
+        return None
+    return "partitioned" if relkind == "p" else "plain"
+
+
+def get_month_start(value) -> datetime:
+    # The first instant (UTC) of the month a message datetime falls in
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def create_message_partitions(conn: sa.Connection, month_starts: Iterable[datetime]) -> list[str]:
+    """
+    Give channel_messages a partition for each month that doesn't have one yet, and return
+    the names of the ones created. Each is created as a table of its own and then attached,
+    which only needs a SHARE UPDATE EXCLUSIVE lock on channel_messages, so reads and writes
+    on the other partitions carry on. Runs inside the caller's transaction.
+    """
+    # writers that need the same month at the same time take turns
+    conn.execute(
+        sa.text("select pg_advisory_xact_lock(hashtext(:table_name))"),
+        {"table_name": channel_message_table_name},
+    )
+    created = []
+    for month_start in sorted(set(month_starts)):
+        partition_name = f"{channel_message_table_name}_{month_start:%Y_%m}"
+        exists = conn.execute(
+            sa.text("select to_regclass(:partition_name) is not null"),
+            {"partition_name": partition_name},
+        ).scalar()
+        if exists:
+            continue
+        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+        conn.execute(
+            sa.text(
+                f"create table {partition_name} "
+                f"(like {channel_message_table_name} "
+                f"including defaults including constraints including generated)"
+            )
+        )
+        conn.execute(
+            sa.text(
+                f"alter table {channel_message_table_name} attach partition {partition_name} "
+                f"for values from ('{month_start.isoformat()}') to ('{next_month_start.isoformat()}')"
+            )
+        )
+        created.append(partition_name)
+    return created
+
+
+def ensure_message_partitions(message_datetimes: Iterable) -> None:
+    # Make sure every month the messages about to be written fall in has a partition. The
+    # partitions are committed on a connection of their own before the write, so the write's
+    # transaction never waits on them.
+    if not channel_messages_partitioned:
+        return
+    month_starts = set(
+        [get_month_start(value) for value in message_datetimes if value is not None]
+    ) - message_partition_cache
+    if len(month_starts) == 0:
+        return
+    with engine.connect() as conn:
+        created = create_message_partitions(conn, month_starts)
+        conn.commit()
+    if len(created) > 0:
+        print(f"created partitions {', '.join(created)}")
+    message_partition_cache.update(month_starts)
+    return
+
+
+def migrate_channel_messages_to_partitions() -> None:
+    """
+    Switch an existing, unpartitioned channel_messages over to monthly partitions, in a
+    single transaction: the table is renamed to channel_messages_unpartitioned, a partitioned
+    channel_messages takes its place with a partition for every month its messages cover, and
+    the rows are copied across. The old table is kept until you drop it; messages without a
+    datetime can't be placed in a partition and are only found there.
+    Stop crawlers first, and restart everything that writes messages afterwards, since the
+    layout is read when this module is imported.
+    """
+    if fetch_table_layout(channel_message_table_name) == "partitioned":
+        print(f"{channel_message_table_name} is already partitioned")
+        return
+    old_table_name = f"{channel_message_table_name}_unpartitioned"
+    primary_key = ", ".join([column.name for column in channel_message_table.primary_key])
+
+    with engine.connect() as conn:
+        conn.execute(
+            sa.text(f"alter table {channel_message_table_name} rename to {old_table_name}")
+        )
+        conn.execute(
+            sa.text(
+                f"alter table {old_table_name} rename constraint "
+                f"{channel_message_table_name}_pkey to {old_table_name}_pkey"
+            )
+        )
+        conn.execute(
+            sa.text(
+                f"create table {channel_message_table_name} "
+                f"(like {old_table_name} including defaults including generated) "
+                f"partition by range (message_datetime)"
+            )
+        )
+        conn.execute(
+            sa.text(
+                f"alter table {channel_message_table_name} "
+                f"add primary key ({primary_key}, message_datetime)"
+            )
+        )
+        message_months = conn.execute(
+            sa.text(
+                f"select distinct date_trunc('month', message_datetime, 'UTC') "
+                f"from {old_table_name} where message_datetime is not null"
+            )
+        ).scalars().all()
+        created = create_message_partitions(
+            conn, [get_month_start(value) for value in message_months]
+        )
+        print(f"created {len(created)} monthly partitions")
+
+        # generated columns (message_tsv) are recomputed, so only the Table's columns are copied
+        column_list = ", ".join(column.name for column in channel_message_table.columns)
+        rp = conn.execute(
+            sa.text(
+                f"insert into {channel_message_table_name} ({column_list}) "
+                f"select {column_list} from {old_table_name} where message_datetime is not null"
+            )
+        )
+        print(f"copied {rp.rowcount} messages into {channel_message_table_name}")
+
+        # secondary indexes move across too; the old ones are renamed out of the way first
+        rp = conn.execute(
+            sa.text(
+                "select indexname, indexdef from pg_indexes "
+                "where tablename = :table_name and indexname != :primary_key_name"
+            ),
+            {"table_name": old_table_name, "primary_key_name": f"{old_table_name}_pkey"},
+        )
+        for index_name, index_definition in rp.fetchall():
+            conn.execute(sa.text(f"alter index {index_name} rename to {index_name}_unpartitioned"))
+            conn.execute(
+                sa.text(
+                    re.sub(
+                        rf" ON (\S+\.)?{old_table_name} ",
+                        f" ON {channel_message_table_name} ",
+                        index_definition,
+                    )
+                )
+            )
+            print(f"rebuilt index {index_name}")
+        num_left_behind = conn.execute(
+            sa.text(f"select count(*) from {old_table_name} where message_datetime is null")
+        ).scalar()
+        conn.commit()
+
+    print(
+        f"{num_left_behind} messages without a datetime were not copied; drop "
+        f"{old_table_name} once you are happy with the new table"
+    )
+    return
+
+
+def lock_message_channels(conn: sa.Connection, channel_ids: Iterable[int]) -> None:
+    """
+    Make message writers that share a channel take turns, until the caller's transaction
+    ends. The rollup deltas subtract each rewritten message's old row as the statement's
+    snapshot saw it; a concurrent writer of the same message that commits while the upsert
+    waits on it is invisible to that snapshot, so its row would be counted twice. Taken
+    before the upsert, the lock makes the upsert's snapshot include the other writer's
+    commit. Locks are taken in channel_id order so two writers can't wait on each other.
+    """
+    conn.execute(
+        sa.text(
+            "select pg_advisory_xact_lock(hashtext(:table_name), hashtext(channel_id::text)) "
+            "from (select distinct channel_id from unnest(cast(:channel_ids as bigint[])) "
+            "as channel_ids (channel_id) order by channel_id) as ordered_channel_ids"
+        ),
+        {"table_name": channel_message_table_name, "channel_ids": sorted(set(channel_ids))},
+    )
+
+
+def insert_data_into_channel_messages_table(records: list[dict]) -> None:
+    records, payload_records = split_api_responses(
+        records, ["channel_id", "message_id"], channel_message_table_name
+    )
+    ensure_message_partitions([record.get("message_datetime") for record in records])
+    inserted = (
+        sa.insert(channel_message_table)
+        .values(records)
+        .returning(
+            *[channel_message_table.c[column] for column in MESSAGE_ROLLUP_COLUMNS]
+        )
+        .cte("inserted")
+    )
+    with engine.connect() as conn:
+        lock_message_channels(conn, [record["channel_id"] for record in records])
+        counts = make_message_counts_statement(inserted).cte("counts")
+        conn.execute(make_forward_edges_statement(inserted).add_cte(inserted, counts))
+        insert_payloads(conn, channel_message_payload_table, payload_records)
+        conn.commit()
+    return
+
+
+def instantiate_message_engagement_snapshots_table(my_table_name: str) -> SQLAlchemyTable:
+    # one row per (message, observation) where the views or forwards moved
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("message_id", sa.types.INTEGER, primary_key=True),
+        sa.Column("observed_at", sa.types.DateTime(timezone=True), primary_key=True),
+        sa.Column("message_views", sa.types.INTEGER),
+        sa.Column("message_forwards", sa.types.INTEGER),
+    )
+    return my_table
+
+
+def instantiate_channel_message_counts_hourly_table(my_table_name: str) -> SQLAlchemyTable:
+    # messages per channel and hour, archived ones included, for the time series charts
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("message_hour", sa.types.DateTime(timezone=True), primary_key=True),
+        sa.Column("num_messages", sa.types.BIGINT, nullable=False),
+    )
+    return my_table
+
+
+def instantiate_forward_edges_daily_table(my_table_name: str) -> SQLAlchemyTable:
+    # forwards (and the views of the forwarding messages) per channel, UTC day and forwardee,
+    # archived messages included, for the forward network
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("day", sa.types.Date, primary_key=True),
+        sa.Column("forwardee_channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("count", sa.types.BIGINT, nullable=False),
+        sa.Column("views", sa.types.BIGINT, nullable=False),
+    )
+    return my_table
+
+
+def get_message_day(message_datetime):
+    # the UTC day of a message, as forward_edges_daily and the archive have it
+    return sa.cast(sa.func.timezone("UTC", message_datetime), sa.types.Date)
+
+
+def make_forward_edges_statement(written, old: SQLAlchemyTable = None):
+    """
+    An INSERT ... ON CONFLICT that adds the forwards among the rows of written (a CTE
+    returning channel_id, message_id, message_datetime, message_views, forwardee_channel_id
+    and message_is_forward of the messages an insert wrote) to forward_edges_daily. With
+    old, as in make_message_counts_statement, a message that was updated rather than
+    inserted is taken off its old edge first, which also keeps the views current.
+    """
+    edges = forward_edges_daily_table
+    changes = []
+    for rows, sign in [(written, 1), (old, -1)]:
+        if rows is None:
+            continue
+        select = sa.select(
+            rows.c.channel_id,
+            get_message_day(rows.c.message_datetime).label("day"),
+            rows.c.forwardee_channel_id,
+            sa.literal(sign).label("count"),
+            (sign * sa.func.coalesce(rows.c.message_views, 0)).label("views"),
+        ).where(
+            rows.c.message_is_forward == True,
+            rows.c.forwardee_channel_id.is_not(None),
+            rows.c.message_datetime.is_not(None),
+        )
+        if rows is old:
+            select = select.select_from(
+                written.join(
+                    old,
+                    sa.and_(
+                        old.c.channel_id == written.c.channel_id,
+                        old.c.message_id == written.c.message_id,
+                    ),
+                )
+            )
+        changes.append(select)
+    changes = sa.union_all(*changes).subquery("forward_changes")
+    edge_columns = [changes.c.channel_id, changes.c.day, changes.c.forwardee_channel_id]
+    stmt = pg_insert(edges).from_select(
+        ["channel_id", "day", "forwardee_channel_id", "count", "views"],
+        sa.select(*edge_columns, sa.func.sum(changes.c["count"]), sa.func.sum(changes.c.views))
+        .group_by(*edge_columns)
+        .having(
+            sa.or_(sa.func.sum(changes.c["count"]) != 0, sa.func.sum(changes.c.views) != 0)
+        )
+        .order_by(*edge_columns),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["channel_id", "day", "forwardee_channel_id"],
+        set_={
+            "count": edges.c["count"] + stmt.excluded["count"],
+            "views": edges.c.views + stmt.excluded.views,
+        },
+    )
+
+
+def make_message_counts_statement(written, old: SQLAlchemyTable = None):
+    """
+    An INSERT ... ON CONFLICT that adds the rows of written (a CTE returning channel_id,
+    message_id and message_datetime of the messages an insert wrote) to
+    channel_message_counts_hourly. With old, the table as the statement found it, a message
+    that was updated rather than inserted is taken off the hour it was in, so re-crawls are
+    not counted twice.
+    """
+    counts = channel_message_counts_hourly_table
+    changes = [
+        sa.select(
+            written.c.channel_id,
+            sa.func.date_trunc("hour", written.c.message_datetime).label("message_hour"),
+            sa.literal(1).label("change"),
+        ).where(written.c.message_datetime.is_not(None))
+    ]
+    if old is not None:
+        changes.append(
+            sa.select(
+                old.c.channel_id,
+                sa.func.date_trunc("hour", old.c.message_datetime),
+                sa.literal(-1),
+            )
+            .select_from(
+                written.join(
+                    old,
+                    sa.and_(
+                        old.c.channel_id == written.c.channel_id,
+                        old.c.message_id == written.c.message_id,
+                    ),
+                )
+            )
+            .where(old.c.message_datetime.is_not(None))
+        )
+    changes = sa.union_all(*changes).subquery("changes")
+    # in key order, so concurrent loads lock the rollup rows in the same order
+    stmt = pg_insert(counts).from_select(
+        ["channel_id", "message_hour", "num_messages"],
+        sa.select(changes.c.channel_id, changes.c.message_hour, sa.func.sum(changes.c.change))
+        .group_by(changes.c.channel_id, changes.c.message_hour)
+        .having(sa.func.sum(changes.c.change) != 0)
+        .order_by(changes.c.channel_id, changes.c.message_hour),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["channel_id", "message_hour"],
+        set_={"num_messages": counts.c.num_messages + stmt.excluded.num_messages},
+    )
+
+
+def insert_data_into_channel_messages_table_advanced(
+    records: list[dict], policy: str = "update-metrics"
+) -> int:
+    """
+    Insert messages with a single INSERT ... ON CONFLICT (channel_id, message_id). Existing
+    messages are left alone (policy "ignore"), get views/forwards refreshed
+    ("update-metrics"), or get every column refreshed ("update-all"); rows are only rewritten
+    when something actually changed. Every message that is new or whose views/forwards moved
+    also gets a row in message_engagement_snapshots, so engagement growth can be charted
+    without storing a row per unchanged re-crawl, and channel_message_counts_hourly and
+    forward_edges_daily are brought up to date. Returns the number of rows written.
+    """
+    key_columns = ["channel_id", "message_id"]
+    metric_columns = ["message_views", "message_forwards"]
+
+    # ON CONFLICT DO UPDATE can't touch the same row twice in one statement, so the latest
+    # copy of a message wins within a batch
+    records = list(
+        {(record["channel_id"], record["message_id"]): record for record in records}.values()
+    )
+    if len(records) == 0:
+        return 0
+    records, payload_records = split_api_responses(
+        records, key_columns, channel_message_table_name
+    )
+    ensure_message_partitions([record.get("message_datetime") for record in records])
+    # (channel_id, message_id), plus message_datetime when the table is partitioned
+    conflict_columns = [column.name for column in channel_message_table.primary_key]
+
+    with engine.connect() as conn:
+        lock_message_channels(conn, [record["channel_id"] for record in records])
+        upserted = (
+            make_upsert_statement(
+                channel_message_table, records, conflict_columns, metric_columns, policy
+            )
+            .returning(*[channel_message_table.c[column] for column in MESSAGE_ROLLUP_COLUMNS])
+            .cte("upserted")
+        )
+        # Every part of the statement sees the table as it was before the statement ran,
+        # so joining it back gives each written row's previous metrics
+        old = channel_message_table
+        snapshots = (
+            sa.insert(message_engagement_snapshot_table)
+            .from_select(
+                key_columns + ["observed_at"] + metric_columns,
+                sa.select(
+                    *[upserted.c[column] for column in key_columns],
+                    sa.func.now(),
+                    *[upserted.c[column] for column in metric_columns],
+                )
+                .select_from(
+                    upserted.outerjoin(
+                        old,
+                        sa.and_(*[old.c[column] == upserted.c[column] for column in key_columns]),
+                    )
+                )
+                .where(
+                    sa.or_(
+                        old.c.channel_id.is_(None),
+                        *[old.c[column].is_distinct_from(upserted.c[column]) for column in metric_columns],
+                    )
+                ),
+            )
+            .cte("snapshots")
+        )
+        counts = make_message_counts_statement(upserted, old).cte("counts")
+        edges = make_forward_edges_statement(upserted, old).cte("edges")
+        stmt = sa.select(sa.func.count()).select_from(upserted).add_cte(snapshots, counts, edges)
+        num_written = conn.execute(stmt).scalar()
+        insert_payloads(conn, channel_message_payload_table, payload_records, policy != "ignore")
+        conn.commit()
+    return num_written
+
+
+def fetch_message_engagement_history(channel_id: int, message_id: int) -> list[dict]:
+    stmt = (
+        sa.select(message_engagement_snapshot_table)
+        .where(
+            message_engagement_snapshot_table.c.channel_id == channel_id,
+            message_engagement_snapshot_table.c.message_id == message_id,
+        )
+        .order_by(message_engagement_snapshot_table.c.observed_at)
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        rows = rp.fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def format_copy_value(value) -> str:
+    # One field in PostgreSQL's COPY text format
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_records_into_table(
+    conn: sa.Connection, table_name: str, columns: list[str], records: list[dict]
+) -> None:
+    # Stream records through COPY FROM STDIN: no SQL to compile and no bind parameters
+    buffer = io.StringIO()
+    for record in records:
+        buffer.write("\t".join([format_copy_value(record.get(column)) for column in columns]))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.copy_expert(
+        f"copy {table_name} ({', '.join(columns)}) from stdin", buffer
+    )
+    cursor.close()
+
+
+def apply_column_defaults(table: SQLAlchemyTable, records: list[dict]) -> list[dict]:
+    # COPY skips SQLAlchemy's Python-side defaults (checkup_time, data_source), so fill them in
+    defaults = {}
+    for column in table.columns:
+        if column.default is not None and column.default.is_scalar:
+            defaults[column.name] = column.default.arg
+        elif column.default is not None and column.default.is_callable:
+            defaults[column.name] = column.default.arg(None)
+    return [{**defaults, **record} for record in records]
+
+
+def bulk_load_channel_messages(
+    records: Iterable[dict],
+    chunk_size: int = COPY_CHUNK_SIZE,
+    policy: str = "update-metrics",
+) -> int:
+    """
+    Load any number of message records through COPY into temporary staging tables, then merge
+    them into channel_messages and channel_message_payloads with one INSERT ... SELECT ... ON
+    CONFLICT each. The merge follows insert_data_into_channel_messages_table_advanced: existing
+    messages are handled according to policy, new ones and ones whose views/forwards moved get
+    an engagement snapshot, channel_message_counts_hourly and forward_edges_daily are brought
+    up to date, and when a message occurs more than once the last copy wins.
+    Records are staged chunk_size at a time, so memory use stays flat however many there are.
+    Everything happens in one transaction. Returns the number of rows written.
+    """
+    message_columns = [column.name for column in channel_message_table.columns]
+    payload_columns = [column.name for column in channel_message_payload_table.columns]
+    key_columns = ["channel_id", "message_id"]
+    conflict_columns = [column.name for column in channel_message_table.primary_key]
+    metric_columns = ["message_views", "message_forwards"]
+    message_months = set()
+
+    with engine.connect() as conn:
+        for table, staging_table_name in [
+            (channel_message_table, "channel_messages_staging"),
+            (channel_message_payload_table, "channel_message_payloads_staging"),
+        ]:
+            conn.execute(
+                sa.text(
+                    f"create temporary table {staging_table_name} "
+                    f"(like {table.name}, staging_row bigserial) on commit drop"
+                )
+            )
+
+        chunk = []
+        for record in itertools.chain(records, [None]):
+            if record is not None:
+                chunk.append(record)
+            if len(chunk) >= chunk_size or (record is None and len(chunk) > 0):
+                lean_records, payload_records = split_api_responses(
+                    chunk, key_columns, channel_message_table_name
+                )
+                message_months.update(
+                    [
+                        get_month_start(record["message_datetime"])
+                        for record in lean_records
+                        if record.get("message_datetime") is not None
+                    ]
+                )
+                copy_records_into_table(
+                    conn,
+                    "channel_messages_staging",
+                    message_columns,
+                    apply_column_defaults(channel_message_table, lean_records),
+                )
+                copy_records_into_table(
+                    conn, "channel_message_payloads_staging", payload_columns, payload_records
+                )
+                chunk = []
+
+        ensure_message_partitions(message_months)
+        lock_message_channels(
+            conn,
+            conn.execute(sa.text("select distinct channel_id from channel_messages_staging")).scalars(),
+        )
+        keys = ", ".join(key_columns)
+        metrics = ", ".join(metric_columns)
+        message_column_list = ", ".join(message_columns)
+        payload_column_list = ", ".join(payload_columns)
+        update_columns = get_upsert_update_columns(
+            channel_message_table, conflict_columns, metric_columns, policy
+        )
+        if len(update_columns) == 0:
+            on_conflict = "do nothing"
+        else:
+            assignments = ", ".join(
+                [f"{column} = excluded.{column}" for column in update_columns + ["checkup_time"]]
+            )
+            changed = " or ".join(
+                [
+                    f"{channel_message_table.name}.{column} is distinct from excluded.{column}"
+                    for column in update_columns
+                ]
+            )
+            on_conflict = f"do update set {assignments} where {changed}"
+        metrics_changed = " or ".join(
+            [f"old.{column} is distinct from upserted.{column}" for column in metric_columns]
+        )
+        # old is the table as it was before the statement, as in the INSERT path
+        rp = conn.execute(
+            sa.text(
+                f"""
+                with upserted as (
+                    insert into {channel_message_table.name} ({message_column_list})
+                    select distinct on ({keys}) {message_column_list}
+                    from channel_messages_staging
+                    order by {keys}, staging_row desc
+                    on conflict ({", ".join(conflict_columns)}) {on_conflict}
+                    returning {", ".join(MESSAGE_ROLLUP_COLUMNS)}
+                ), snapshots as (
+                    insert into {message_engagement_snapshot_table.name}
+                        ({keys}, observed_at, {metrics})
+                    select {", ".join([f"upserted.{column}" for column in key_columns])},
+                        now(), {", ".join([f"upserted.{column}" for column in metric_columns])}
+                    from upserted
+                    left join {channel_message_table.name} as old using ({keys})
+                    where old.channel_id is null or {metrics_changed}
+                ), changes as (
+                    select channel_id, date_trunc('hour', message_datetime) as message_hour,
+                        1 as change
+                    from upserted
+                    union all
+                    select old.channel_id, date_trunc('hour', old.message_datetime), -1
+                    from upserted
+                    join {channel_message_table.name} as old using ({keys})
+                ), counts as (
+                    insert into {channel_message_counts_hourly_table.name}
+                        (channel_id, message_hour, num_messages)
+                    select channel_id, message_hour, sum(change)
+                    from changes
+                    where message_hour is not null
+                    group by channel_id, message_hour
+                    having sum(change) <> 0
+                    order by channel_id, message_hour
+                    on conflict (channel_id, message_hour)
+                    do update set num_messages =
+                        {channel_message_counts_hourly_table.name}.num_messages + excluded.num_messages
+                ), forward_changes as (
+                    select channel_id, (message_datetime at time zone 'UTC')::date as day,
+                        forwardee_channel_id, 1 as count, coalesce(message_views, 0) as views
+                    from upserted
+                    where message_is_forward and forwardee_channel_id is not null
+                    union all
+                    select old.channel_id, (old.message_datetime at time zone 'UTC')::date,
+                        old.forwardee_channel_id, -1, -coalesce(old.message_views, 0)
+                    from upserted
+                    join {channel_message_table.name} as old using ({keys})
+                    where old.message_is_forward and old.forwardee_channel_id is not null
+                ), edges as (
+                    insert into {forward_edges_daily_table.name}
+                        (channel_id, day, forwardee_channel_id, count, views)
+                    select channel_id, day, forwardee_channel_id, sum(count), sum(views)
+                    from forward_changes
+                    where day is not null
+                    group by channel_id, day, forwardee_channel_id
+                    having sum(count) <> 0 or sum(views) <> 0
+                    order by channel_id, day, forwardee_channel_id
+                    on conflict (channel_id, day, forwardee_channel_id)
+                    do update set count = {forward_edges_daily_table.name}.count + excluded.count,
+                        views = {forward_edges_daily_table.name}.views + excluded.views
+                )
+                select count(*) from upserted
+                """
+            )
+        )
+        num_written = rp.scalar()
+        payload_on_conflict = (
+            "do nothing"
+            if policy == "ignore"
+            else "do update set dictionary_id = excluded.dictionary_id, payload = excluded.payload"
+        )
+        conn.execute(
+            sa.text(
+                f"""
+                insert into {channel_message_payload_table.name} ({payload_column_list})
+                select distinct on ({keys}) {payload_column_list}
+                from channel_message_payloads_staging
+                order by {keys}, staging_row desc
+                on conflict ({keys}) {payload_on_conflict}
+                """
+            )
+        )
+        conn.commit()
+    return num_written
+
+
+def fetch_seed_list_names() -> list[dict]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(seed_table.c.seed_list).distinct(seed_table.c.seed_list)
+        )
+        rows = rp.fetchall()
+    return [row for (row,) in rows]
+
+
+def fetch_seed_list_preview(my_seed_list_names: list[str]) -> list[dict]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(seed_table).where(seed_table.c.seed_list.in_(my_seed_list_names))
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    for record in records:
+        record["channel_id"] = int(record["channel_id"])
+    return records
+
+
+def select_seed_channel_ids(seed_list_names: list[str]):
+    # seed membership as a subquery, so the fetch_* queries resolve it in the same statement
+    return (
+        sa.select(seed_table.c.channel_id)
+        .where(seed_table.c.seed_list.in_(seed_list_names))
+        .scalar_subquery()
+    )
+
+
+def fetch_seed_channel_ids(seed_list_names: list[str]) -> list[int]:
+    """
+    Ids of the channels on any of seed_list_names, for the queries that take ids rather than
+    a subquery (and those that don't run on Postgres). Each seed list's ids are cached with
+    the list's row count and channel_id sum; seeds are added by other processes (crawl
+    workers, discovery), so every call checks those against the seeds index and re-reads
+    only the lists that changed.
+    """
+    seed_list_names = set(seed_list_names)
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(
+                seed_table.c.seed_list,
+                sa.func.count(),
+                sa.func.sum(seed_table.c.channel_id),
+            )
+            .where(seed_table.c.seed_list.in_(seed_list_names))
+            .group_by(seed_table.c.seed_list)
+        )
+        fingerprints = {
+            seed_list: (count, channel_id_sum) for seed_list, count, channel_id_sum in rp
+        }
+        stale_seed_list_names = [
+            name
+            for name in fingerprints
+            if seed_channel_id_cache.get(name, (None, None))[0] != fingerprints[name]
+        ]
+        if len(stale_seed_list_names) > 0:
+            rp = conn.execute(
+                sa.select(seed_table.c.seed_list, array_agg(seed_table.c.channel_id))
+                .where(seed_table.c.seed_list.in_(stale_seed_list_names))
+                .group_by(seed_table.c.seed_list)
+            )
+            for seed_list, channel_ids in rp.fetchall():
+                seed_channel_id_cache[seed_list] = (
+                    fingerprints[seed_list],
+                    [int(channel_id) for channel_id in channel_ids],
+                )
+    # lists that have no seeds (any more) are dropped
+    for name in seed_list_names - set(fingerprints):
+        seed_channel_id_cache.pop(name, None)
+    return sorted(
+        set(
+            itertools.chain.from_iterable(
+                [seed_channel_id_cache[name][1] for name in fingerprints]
+            )
+        )
+    )
+
+
+def fetch_birth_chart_data(
+    seed_list_names: list[str], birth_chart_unit: str
+) -> list[dict]:
+    seed_channel_ids = select_seed_channel_ids(seed_list_names)
+
+    stmt = (
+        sa.select(
+            sa.sql.func.date_trunc(
+                birth_chart_unit, channel_metadata_table.c.channel_birthdate
+            ),
+            sa.sql.func.count(),
+        )
+        .filter(channel_metadata_table.c.channel_id.in_(seed_channel_ids))
+        .group_by(
+            sa.sql.func.date_trunc(
+                birth_chart_unit, channel_metadata_table.c.channel_birthdate
+            )
+        )
+        .order_by(
+            sa.sql.func.date_trunc(
+                birth_chart_unit, channel_metadata_table.c.channel_birthdate
+            )
+        )
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return [
+        {"creation_dt": record["date_trunc_1"], "count": record["count_1"]}
+        for record in records
+    ]
+
+
+def fetch_message_counts_from_rollup(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    time_series_chart_unit: str,
+) -> list[dict]:
+    # Sums of channel_message_counts_hourly, so the cost follows the number of hours charted
+    # rather than the number of messages. Whole hours can't stop at the end date's first
+    # instant the way the raw query does, so the range ends before the end date.
+    counts = channel_message_counts_hourly_table
+    message_dt = sa.func.date_trunc(time_series_chart_unit, counts.c.message_hour)
+    num_messages = sa.cast(sa.func.sum(counts.c.num_messages), sa.types.BIGINT)
+    stmt = (
+        sa.select(message_dt.label("message_dt"), num_messages.label("count"))
+        .filter(
+            counts.c.channel_id.in_(select_seed_channel_ids(seed_list_names)),
+            counts.c.message_hour >= datetime.strptime(start_date, "%Y-%m-%d"),
+            counts.c.message_hour < datetime.strptime(end_date, "%Y-%m-%d"),
+        )
+        .group_by(message_dt)
+        .having(num_messages > 0)
+        .order_by(message_dt)
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+    return [dict(elt._mapping) for elt in rp.fetchall()]
+
+
+def fetch_time_series_chart_data(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    time_series_chart_unit: str,
+) -> list[dict]:
+    # hours and up come from the rollup (which counts archived messages too), minutes from
+    # the messages themselves
+    if time_series_chart_unit in MESSAGE_COUNT_ROLLUP_UNITS:
+        return fetch_message_counts_from_rollup(
+            seed_list_names, start_date, end_date, time_series_chart_unit
+        )
+    seed_channel_ids = select_seed_channel_ids(seed_list_names)
+
+    stmt = (
+        sa.select(
+            sa.sql.func.date_trunc(
+                time_series_chart_unit, channel_message_table.c.message_datetime
+            ),
+            sa.sql.func.count(),
+        )
+        .filter(
+            channel_message_table.c.channel_id.in_(seed_channel_ids),
+            channel_message_table.c.message_datetime
+            >= datetime.strptime(start_date, "%Y-%m-%d"),
+            channel_message_table.c.message_datetime
+            <= datetime.strptime(end_date, "%Y-%m-%d"),
+        )
+        .group_by(
+            sa.sql.func.date_trunc(
+                time_series_chart_unit, channel_message_table.c.message_datetime
+            )
+        )
+        .order_by(
+            sa.sql.func.date_trunc(
+                time_series_chart_unit, channel_message_table.c.message_datetime
+            )
+        )
+    )
+
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return [
+        {"message_dt": record["date_trunc_1"], "count": record["count_1"]}
+        for record in records
+    ]
+
+
+def fetch_top_messages(
+    seed_list_names: list[str], start_date: str, end_date: str, the_limit: int
+) -> list[dict]:
+    seed_channel_ids = select_seed_channel_ids(seed_list_names)
+
+    # Rank on channel_messages_channel_datetime_idx alone (it carries message_views), then
+    # read only the winning rows from the table
+    top_keys = (
+        sa.select(
+            channel_message_table.c.channel_id,
+            channel_message_table.c.message_id,
+            channel_message_table.c.message_datetime,
+            channel_message_table.c.message_views,
+        )
+        .filter(
+            channel_message_table.c.channel_id.in_(seed_channel_ids),
+            channel_message_table.c.message_views.is_not(None),
+            channel_message_table.c.message_datetime
+            >= datetime.strptime(start_date, "%Y-%m-%d"),
+            channel_message_table.c.message_datetime
+            <= datetime.strptime(end_date, "%Y-%m-%d"),
+        )
+        .order_by(channel_message_table.c.message_views.desc())
+        .limit(the_limit)
+        .subquery("top_keys")
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(channel_message_table)
+            .join(
+                top_keys,
+                sa.and_(
+                    channel_message_table.c.channel_id == top_keys.c.channel_id,
+                    channel_message_table.c.message_id == top_keys.c.message_id,
+                    channel_message_table.c.message_datetime == top_keys.c.message_datetime,
+                ),
+            )
+            .order_by(top_keys.c.message_views.desc())
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return records
+
+
+def fetch_message_search_hits(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    query: str,
+    the_limit: int,
+    the_offset: int,
+) -> list[dict]:
+    """
+    Messages whose text matches a web-search style query (quoted phrases, "or", -exclusions),
+    best match first. Needs schema migration 2, which adds message_tsv and its GIN index.
+    Only messages still in Postgres are searched: archived months have no message_tsv, and
+    the Parquet archive has no full-text index to rank against it.
+    Every hit carries num_hits, the number of matches across all pages.
+    """
+    seed_channel_ids = select_seed_channel_ids(seed_list_names)
+
+    # message_tsv is managed by the schema migration rather than the Table, so that inserts,
+    # COPY staging and "select channel_messages" never touch it
+    message_tsv = sa.literal_column(f"{channel_message_table_name}.message_tsv")
+    ts_query = sa.func.websearch_to_tsquery(MESSAGE_SEARCH_CONFIGS[0], query)
+    for config in MESSAGE_SEARCH_CONFIGS[1:]:
+        ts_query = ts_query.op("||")(sa.func.websearch_to_tsquery(config, query))
+    rank = sa.func.ts_rank_cd(message_tsv, ts_query)
+
+    # Rank every match but only build headlines for the page being returned
+    page = (
+        sa.select(
+            channel_message_table.c.channel_id,
+            channel_message_table.c.message_id,
+            channel_message_table.c.message_datetime,
+            channel_message_table.c.message_text,
+            channel_message_table.c.message_views,
+            rank.label("rank"),
+            sa.func.count().over().label("num_hits"),
+        )
+        .filter(
+            channel_message_table.c.channel_id.in_(seed_channel_ids),
+            message_tsv.op("@@")(ts_query),
+            channel_message_table.c.message_datetime
+            >= datetime.strptime(start_date, "%Y-%m-%d"),
+            channel_message_table.c.message_datetime
+            <= datetime.strptime(end_date, "%Y-%m-%d"),
+        )
+        .order_by(
+            sa.desc("rank"),
+            channel_message_table.c.message_datetime.desc(),
+            channel_message_table.c.channel_id,
+            channel_message_table.c.message_id,
+        )
+        .limit(the_limit)
+        .offset(the_offset)
+        .subquery("page")
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(
+                page.c.channel_id,
+                page.c.message_id,
+                page.c.message_datetime,
+                page.c.message_views,
+                page.c.rank,
+                page.c.num_hits,
+                sa.func.ts_headline(
+                    MESSAGE_SEARCH_CONFIGS[0], page.c.message_text, ts_query
+                ).label("headline"),
+            ).order_by(
+                page.c.rank.desc(),
+                page.c.message_datetime.desc(),
+                page.c.channel_id,
+                page.c.message_id,
+            )
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return records
+
+
+def fetch_seed_metadata_full(seed_list_names: list[str]) -> list[dict]:
+    seed_channel_ids = select_seed_channel_ids(seed_list_names)
+
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(channel_metadata_table)
+            .where(channel_metadata_table.c.channel_id.in_(seed_channel_ids))
+            .order_by(channel_metadata_table.c.num_subscribers.desc())
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return records
+
+
+def fetch_weighted_edges_fwd_network(
+    seed_channel_ids: list[str], start_date: str, end_date: str
+) -> list[dict]:
+    # A range sum over forward_edges_daily (archived messages included), which ends before
+    # end_date like the time series rollup
+    edges = forward_edges_daily_table
+    count_1 = sa.cast(sa.func.sum(edges.c["count"]), sa.types.BIGINT)
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(edges.c.channel_id, edges.c.forwardee_channel_id, count_1.label("count_1"))
+            .filter(
+                edges.c.channel_id.in_([int(channel_id) for channel_id in seed_channel_ids]),
+                edges.c.day >= datetime.strptime(start_date, "%Y-%m-%d").date(),
+                edges.c.day < datetime.strptime(end_date, "%Y-%m-%d").date(),
+            )
+            .group_by(edges.c.channel_id, edges.c.forwardee_channel_id)
+            .having(count_1 > 0)
+            .order_by(edges.c.channel_id, edges.c.forwardee_channel_id)
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    return records
+
+
+def fetch_channel_metadata_history(channel_ids: list[int]) -> list[dict]:
+    stmt = (
+        sa.select(channel_metadata_history_table)
+        .where(channel_metadata_history_table.c.channel_id.in_(channel_ids))
+        .order_by(
+            channel_metadata_history_table.c.channel_id,
+            channel_metadata_history_table.c.checkup_time,
+        )
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        rows = rp.fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def fetch_metadata_for_single_channel(channel_id: int) -> dict:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(channel_metadata_table)
+            .where(channel_metadata_table.c.channel_id == channel_id)
+            .order_by(channel_metadata_table.c.num_subscribers.desc())
+        )
+    records = [dict(elt._mapping) for elt in rp.fetchall()]
+    assert len(records) == 1
+    return records[0]
+
+def look_up_channel_id_with_channel_name(channel_name: str) -> int|None:
+    # Look up the channel ID for a given channel name:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(seed_table.c.channel_id).where(seed_table.c.channel_name == channel_name)
+        )
+        channel_id = rp.fetchone()
+    if channel_id is None:
+        return None
+    return channel_id[0]
+
+def fetch_target_start_date(channel_name: str):
+    """
+    We are looking up the new messages for a given channel. Possibly, this channel is completely new to our seed list
+    so we want to retrieve their messages all the way back to the beginning of their timeline.
+    Alternatively, it might be a channel we've tracked before, so we just want to get their new messages (back to, say,
+    Jan 31st, 2026).
+
+    This function should figure out what to do:
+    (1) query the database to see if we've ever tracked this channel before, and
+    (2) if so, when last did we do that
+    """
+
+    channel_id = look_up_channel_id_with_channel_name(channel_name)
+    if channel_id is None: # we don't have this channel in our database yet
+        return datetime.strptime("2010-01-01", "%Y-%m-%d").date()
+
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(sa.sql.func.max(channel_message_table.c.message_datetime)).where(
+                channel_message_table.c.channel_id == channel_id
+            )
+        )
+        most_recent_message_datetime = rp.scalar()
+
+    if most_recent_message_datetime is None:
+        return datetime.strptime("2010-01-01", "%Y-%m-%d").date()
+
+    most_recent_message_date = most_recent_message_datetime.date()
 
     return most_recent_message_date
 
 
+def instantiate_crawl_checkpoints_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("channel_name", sa.types.TEXT, nullable=False, index=True),
+        sa.Column("max_message_id", sa.types.INTEGER, nullable=False),
+        sa.Column("max_message_datetime", sa.types.DateTime(timezone=True)),
+        sa.Column("min_message_id", sa.types.INTEGER, nullable=False),
+        sa.Column("min_message_datetime", sa.types.DateTime(timezone=True)),
+        sa.Column("history_complete", sa.types.BOOLEAN, nullable=False, default=False),
+        sa.Column(
+            "checkup_time", sa.types.DateTime(timezone=True), default=datetime.utcnow
+        ),
+    )
+    return my_table
+
+
+def fetch_crawl_checkpoint(channel_name: str) -> dict|None:
+    """
+    Return the high- and low-water marks (message_id and datetime) we hold for a channel, or
+    None if we have never stored a message from it. Channels crawled before the checkpoint
+    table existed get a checkpoint bootstrapped from channel_messages with a single aggregate
+    query; since we can't tell whether that earlier crawl reached the start of the channel,
+    history_complete starts out False.
+    """
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(crawl_checkpoint_table).where(
+                crawl_checkpoint_table.c.channel_name == channel_name
+            )
+        )
+        row = rp.fetchone()
+    if row is not None:
+        return dict(row._mapping)
+
+    channel_id = look_up_channel_id_with_channel_name(channel_name)
+    if channel_id is None:
+        return None
+
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(crawl_checkpoint_table).where(
+                crawl_checkpoint_table.c.channel_id == channel_id
+            )
+        )
+        row = rp.fetchone()
+    if row is not None:
+        return dict(row._mapping)
+
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(
+                sa.sql.func.max(channel_message_table.c.message_id).label("max_message_id"),
+                sa.sql.func.max(channel_message_table.c.message_datetime).label("max_message_datetime"),
+                sa.sql.func.min(channel_message_table.c.message_id).label("min_message_id"),
+                sa.sql.func.min(channel_message_table.c.message_datetime).label("min_message_datetime"),
+            ).where(channel_message_table.c.channel_id == channel_id)
+        )
+        aggregates = dict(rp.fetchone()._mapping)
+    if aggregates["max_message_id"] is None:
+        return None
+
+    checkpoint = {
+        "channel_id": channel_id,
+        "channel_name": channel_name,
+        **aggregates,
+        "history_complete": False,
+    }
+    update_crawl_checkpoint(checkpoint)
+    return checkpoint
+
+
+def update_crawl_checkpoint(checkpoint: dict) -> None:
+    """
+    Widen a channel's checkpoint to cover the incoming one: the high-water mark only moves up,
+    the low-water mark only moves down, and history_complete is sticky once True.
+    """
+    stmt = pg_insert(crawl_checkpoint_table).values(
+        {**checkpoint, "checkup_time": datetime.utcnow()}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[crawl_checkpoint_table.c.channel_id],
+        set_={
+            "channel_name": stmt.excluded.channel_name,
+            "max_message_id": sa.sql.func.greatest(
+                crawl_checkpoint_table.c.max_message_id, stmt.excluded.max_message_id
+            ),
+            "max_message_datetime": sa.sql.func.greatest(
+                crawl_checkpoint_table.c.max_message_datetime,
+                stmt.excluded.max_message_datetime,
+            ),
+            "min_message_id": sa.sql.func.least(
+                crawl_checkpoint_table.c.min_message_id, stmt.excluded.min_message_id
+            ),
+            "min_message_datetime": sa.sql.func.least(
+                crawl_checkpoint_table.c.min_message_datetime,
+                stmt.excluded.min_message_datetime,
+            ),
+            "history_complete": sa.or_(
+                crawl_checkpoint_table.c.history_complete,
+                stmt.excluded.history_complete,
+            ),
+            "checkup_time": stmt.excluded.checkup_time,
+        },
+    )
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+
+
+def mark_crawl_history_complete(channel_name: str) -> None:
+    stmt = (
+        sa.update(crawl_checkpoint_table)
+        .where(crawl_checkpoint_table.c.channel_name == channel_name)
+        .values(history_complete=True, checkup_time=datetime.utcnow())
+    )
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+def instantiate_crawl_jobs_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("job_id", sa.types.BIGINT, primary_key=True, autoincrement=True),
+        sa.Column("job_type", sa.types.TEXT, nullable=False),
+        sa.Column("channel_name", sa.types.TEXT, nullable=False),
+        sa.Column("seed_list", sa.types.TEXT, default=None),
+        sa.Column("priority", sa.types.INTEGER, nullable=False, default=0),
+        sa.Column("status", sa.types.TEXT, nullable=False, default="queued"),
+        sa.Column("attempts", sa.types.INTEGER, nullable=False, default=0),
+        sa.Column("max_attempts", sa.types.INTEGER, nullable=False, default=5),
+        sa.Column("run_after", sa.types.DateTime(timezone=True), server_default=sa.sql.func.now()),
+        sa.Column("leased_by", sa.types.TEXT, default=None),
+        sa.Column("lease_expires_at", sa.types.DateTime(timezone=True), default=None),
+        sa.Column("last_error", sa.types.TEXT, default=None),
+        sa.Column("created_at", sa.types.DateTime(timezone=True), server_default=sa.sql.func.now()),
+        sa.Column("updated_at", sa.types.DateTime(timezone=True), server_default=sa.sql.func.now()),
+        # at most one queued/running job per (job_type, channel_name):
+        sa.Index(
+            f"{my_table_name}_active_uq",
+            "job_type",
+            "channel_name",
+            unique=True,
+            postgresql_where=sa.text("status in ('queued', 'running')"),
+        ),
+        sa.Index(f"{my_table_name}_claim_idx", "status", "priority", "job_id"),
+    )
+    return my_table
+
+
+def enqueue_crawl_jobs(records: list[dict]) -> int:
+    """
+    Add jobs to the crawl queue. A channel that already has a queued or running job of the
+    same type is skipped, so re-enqueueing a seed list is harmless. Returns the number of
+    jobs actually added.
+    """
+    stmt = (
+        pg_insert(crawl_job_table)
+        .values(records)
+        .on_conflict_do_nothing(
+            index_elements=["job_type", "channel_name"],
+            index_where=sa.text("status in ('queued', 'running')"),
+        )
+        .returning(crawl_job_table.c.job_id)
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        job_ids = rp.fetchall()
+        conn.commit()
+    return len(job_ids)
+
+
+def claim_crawl_job(
+    worker_id: str, lease_seconds: int, job_types: list[str] = None
+) -> dict|None:
+    """
+    Atomically lease the highest-priority job that is ready to run, or whose previous lease
+    expired because its worker died. FOR UPDATE SKIP LOCKED lets any number of workers poll
+    the same table without blocking on, or double-claiming, each other's rows.
+    """
+    ready = sa.or_(
+        sa.and_(
+            crawl_job_table.c.status == "queued",
+            crawl_job_table.c.run_after <= sa.sql.func.now(),
+        ),
+        sa.and_(
+            crawl_job_table.c.status == "running",
+            crawl_job_table.c.lease_expires_at < sa.sql.func.now(),
+        ),
+    )
+    next_job = sa.select(crawl_job_table.c.job_id).where(ready)
+    if job_types is not None:
+        next_job = next_job.where(crawl_job_table.c.job_type.in_(job_types))
+    next_job = (
+        next_job.order_by(crawl_job_table.c.priority.desc(), crawl_job_table.c.job_id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+
+    stmt = (
+        sa.update(crawl_job_table)
+        .where(crawl_job_table.c.job_id == next_job)
+        .values(
+            status="running",
+            attempts=crawl_job_table.c.attempts + 1,
+            leased_by=worker_id,
+            lease_expires_at=sa.sql.func.now() + timedelta(seconds=lease_seconds),
+            updated_at=sa.sql.func.now(),
+        )
+        .returning(crawl_job_table)
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        row = rp.fetchone()
+        conn.commit()
+    if row is None:
+        return None
+    return dict(row._mapping)
+
+
+def renew_crawl_job_lease(job_id: int, worker_id: str, lease_seconds: int) -> bool:
+    # Returns False if the lease was lost (it expired and another worker took the job)
+    stmt = (
+        sa.update(crawl_job_table)
+        .where(
+            crawl_job_table.c.job_id == job_id,
+            crawl_job_table.c.leased_by == worker_id,
+            crawl_job_table.c.status == "running",
+        )
+        .values(
+            lease_expires_at=sa.sql.func.now() + timedelta(seconds=lease_seconds),
+            updated_at=sa.sql.func.now(),
+        )
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        conn.commit()
+    return rp.rowcount == 1
+
+
+def complete_crawl_job(job_id: int, worker_id: str) -> bool:
+    # Returns False if the lease was lost, in which case the job belongs to another worker
+    stmt = (
+        sa.update(crawl_job_table)
+        .where(
+            crawl_job_table.c.job_id == job_id,
+            crawl_job_table.c.leased_by == worker_id,
+            crawl_job_table.c.status == "running",
+        )
+        .values(
+            status="done",
+            lease_expires_at=None,
+            last_error=None,
+            updated_at=sa.sql.func.now(),
+        )
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        conn.commit()
+    return rp.rowcount == 1
+
+
+def fail_crawl_job(job_id: int, worker_id: str, error: str, retry_delay_seconds: int) -> bool:
+    # Put the job back in the queue after a delay, or give up once it has used all its attempts.
+    # Returns False if the lease was lost, as complete_crawl_job does.
+    stmt = (
+        sa.update(crawl_job_table)
+        .where(
+            crawl_job_table.c.job_id == job_id,
+            crawl_job_table.c.leased_by == worker_id,
+            crawl_job_table.c.status == "running",
+        )
+        .values(
+            status=sa.case(
+                (crawl_job_table.c.attempts >= crawl_job_table.c.max_attempts, "failed"),
+                else_="queued",
+            ),
+            run_after=sa.sql.func.now() + timedelta(seconds=retry_delay_seconds),
+            lease_expires_at=None,
+            last_error=error,
+            updated_at=sa.sql.func.now(),
+        )
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        conn.commit()
+    return rp.rowcount == 1
+
+
+def fetch_crawl_job_counts() -> list[dict]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(
+                crawl_job_table.c.job_type,
+                crawl_job_table.c.status,
+                sa.sql.func.count().label("count"),
+            )
+            .group_by(crawl_job_table.c.job_type, crawl_job_table.c.status)
+            .order_by(crawl_job_table.c.job_type, crawl_job_table.c.status)
+        )
+    return [dict(elt._mapping) for elt in rp.fetchall()]
+
+
+def instantiate_channel_entities_table(my_table_name: str) -> SQLAlchemyTable:
+    # access_hash values are issued per Telegram account, hence the api_id in the key
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_name", sa.types.TEXT, primary_key=True),
+        sa.Column("api_id", sa.types.INTEGER, primary_key=True),
+        sa.Column("channel_id", sa.types.BIGINT, nullable=False),
+        sa.Column("access_hash", sa.types.BIGINT, nullable=False),
+        sa.Column(
+            "resolved_at", sa.types.DateTime(timezone=True), default=datetime.utcnow
+        ),
+    )
+    return my_table
+
+
+def fetch_channel_entity(channel_name: str, api_id: int) -> dict|None:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(channel_entity_table).where(
+                channel_entity_table.c.channel_name == channel_name,
+                channel_entity_table.c.api_id == api_id,
+            )
+        )
+        row = rp.fetchone()
+    if row is None:
+        return None
+    return dict(row._mapping)
+
+
+def save_channel_entity(record: dict) -> None:
+    stmt = pg_insert(channel_entity_table).values(
+        {**record, "resolved_at": datetime.utcnow()}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[channel_entity_table.c.channel_name, channel_entity_table.c.api_id],
+        set_={
+            "channel_id": stmt.excluded.channel_id,
+            "access_hash": stmt.excluded.access_hash,
+            "resolved_at": stmt.excluded.resolved_at,
+        },
+    )
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+
+def delete_channel_entity(channel_name: str, api_id: int) -> None:
+    stmt = sa.delete(channel_entity_table).where(
+        channel_entity_table.c.channel_name == channel_name,
+        channel_entity_table.c.api_id == api_id,
+    )
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+
 def fetch_domain_edges(
     seed_channel_ids: list, start_date: str, end_date: str
 ) -> list[dict]:
@@ -445,11 +2182,512 @@ def fetch_domain_edges(
     return records
 
 
+def delete_channel_messages(channel_ids: list[int]) -> None:
+    # Forget everything crawled for these channels: messages, payloads, snapshots, rollups,
+    # checkpoints
+    with engine.connect() as conn:
+        for table in [
+            channel_message_table,
+            channel_message_payload_table,
+            message_engagement_snapshot_table,
+            channel_message_counts_hourly_table,
+            forward_edges_daily_table,
+            crawl_checkpoint_table,
+        ]:
+            conn.execute(sa.delete(table).where(table.c.channel_id.in_(channel_ids)))
+        conn.commit()
+    return
+
+
+def instantiate_channel_discovery_attempts_table(my_table_name: str) -> SQLAlchemyTable:
+    # one row per forwardee channel the discovery crawler has tried, so it isn't paid for twice
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("channel_id", sa.types.BIGINT, primary_key=True),
+        sa.Column("channel_name", sa.types.TEXT, default=None),
+        sa.Column("status", sa.types.TEXT, nullable=False),
+        sa.Column("forward_weight", sa.types.INTEGER, nullable=False),
+        sa.Column("error", sa.types.TEXT, default=None),
+        sa.Column(
+            "attempted_at", sa.types.DateTime(timezone=True), default=datetime.utcnow
+        ),
+    )
+    return my_table
+
+
+def instantiate_api_budget_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("usage_date", sa.types.DATE, primary_key=True),
+        sa.Column("purpose", sa.types.TEXT, primary_key=True),
+        sa.Column("num_requests", sa.types.INTEGER, nullable=False),
+    )
+    return my_table
+
+
+def fetch_discovery_frontier(seed_list_names: list[str], limit: int) -> list[dict]:
+    """
+    Channels forwarded by the channels on seed_list_names that are on no seed list yet and
+    haven't been tried before (or failed with an error), ranked by how many times the seed
+    channels forwarded them. Each comes with its most recent forwarding message, which is how
+    the crawler gets hold of the channel without knowing its username.
+    """
+    source_channel_ids = (
+        sa.select(seed_table.c.channel_id)
+        .where(seed_table.c.seed_list.in_(seed_list_names))
+        .scalar_subquery()
+    )
+    stmt = (
+        sa.select(
+            channel_message_table.c.forwardee_channel_id,
+            sa.func.count().label("forward_weight"),
+            sa.func.count(sa.distinct(channel_message_table.c.channel_id)).label(
+                "num_forwarding_channels"
+            ),
+            array_agg(
+                aggregate_order_by(
+                    channel_message_table.c.channel_id,
+                    channel_message_table.c.message_id.desc(),
+                )
+            )[1].label("forwarding_channel_id"),
+            array_agg(
+                aggregate_order_by(
+                    channel_message_table.c.message_id,
+                    channel_message_table.c.message_id.desc(),
+                )
+            )[1].label("forwarding_message_id"),
+        )
+        .where(
+            channel_message_table.c.channel_id.in_(source_channel_ids),
+            channel_message_table.c.message_is_forward == True,
+            channel_message_table.c.forwardee_channel_id.is_not(None),
+            channel_message_table.c.forwardee_channel_id.not_in(
+                sa.select(seed_table.c.channel_id)
+            ),
+            channel_message_table.c.forwardee_channel_id.not_in(
+                sa.select(channel_discovery_attempt_table.c.channel_id).where(
+                    channel_discovery_attempt_table.c.status != "error"
+                )
+            ),
+        )
+        .group_by(channel_message_table.c.forwardee_channel_id)
+        .order_by(sa.desc("forward_weight"), channel_message_table.c.forwardee_channel_id)
+        .limit(limit)
+    )
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+    return [dict(elt._mapping) for elt in rp.fetchall()]
+
+
+def record_channel_discovery_attempt(record: dict) -> None:
+    stmt = pg_insert(channel_discovery_attempt_table).values(
+        {**record, "attempted_at": datetime.utcnow()}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[channel_discovery_attempt_table.c.channel_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in ["channel_name", "status", "forward_weight", "error", "attempted_at"]
+        },
+    )
+    with engine.connect() as conn:
+        conn.execute(stmt)
+        conn.commit()
+    return
+
+
+def spend_api_budget(purpose: str, daily_budget: int, num_requests: int = 1) -> bool:
+    """
+    Charge num_requests against today's (UTC) budget for purpose. Returns False, and charges
+    nothing, if that would take the day over daily_budget. The check and the increment are a
+    single statement, so concurrent crawlers can share one budget.
+    """
+    if num_requests > daily_budget:
+        return False
+    stmt = pg_insert(api_budget_table).values(
+        usage_date=datetime.utcnow().date(), purpose=purpose, num_requests=num_requests
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[api_budget_table.c.usage_date, api_budget_table.c.purpose],
+        set_={"num_requests": api_budget_table.c.num_requests + stmt.excluded.num_requests},
+        where=api_budget_table.c.num_requests + stmt.excluded.num_requests <= daily_budget,
+    ).returning(api_budget_table.c.num_requests)
+    with engine.connect() as conn:
+        rp = conn.execute(stmt)
+        row = rp.fetchone()
+        conn.commit()
+    return row is not None
+
+
+def fetch_api_budget_spent(purpose: str) -> int:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(api_budget_table.c.num_requests).where(
+                api_budget_table.c.usage_date == datetime.utcnow().date(),
+                api_budget_table.c.purpose == purpose,
+            )
+        )
+        row = rp.fetchone()
+    return 0 if row is None else row[0]
+
+
+def instantiate_schema_migrations_table(my_table_name: str) -> SQLAlchemyTable:
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("version", sa.types.INTEGER, primary_key=True, autoincrement=False),
+        sa.Column("name", sa.types.TEXT, nullable=False),
+        sa.Column(
+            "applied_at", sa.types.DateTime(timezone=True), default=datetime.utcnow
+        ),
+    )
+    return my_table
+
+
+def fetch_applied_schema_migrations() -> list[dict]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(schema_migration_table).order_by(schema_migration_table.c.version)
+        )
+        rows = rp.fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def apply_schema_migrations(target_version: int = None) -> list[int]:
+    """
+    Apply the SCHEMA_MIGRATIONS that haven't been applied yet (up to target_version, if
+    given), oldest first, each in a transaction of its own, and return their versions.
+    Processes racing to migrate the same database take turns, and a migration another process
+    finished in the meantime is skipped. Index builds lock their table against writes while
+    they run, so stop the crawlers for the first run against a big archive.
+    """
+    applied_versions = []
+    for version, name, statements in SCHEMA_MIGRATIONS:
+        if target_version is not None and version > target_version:
+            break
+        with engine.connect() as conn:
+            conn.execute(
+                sa.text("select pg_advisory_xact_lock(hashtext(:table_name))"),
+                {"table_name": schema_migration_table_name},
+            )
+            already_applied = conn.execute(
+                sa.select(schema_migration_table.c.version).where(
+                    schema_migration_table.c.version == version
+                )
+            ).first()
+            if already_applied is not None:
+                continue
+            print(f"applying schema migration {version}: {name}")
+            for statement in statements:
+                conn.execute(sa.text(statement))
+            conn.execute(
+                sa.insert(schema_migration_table).values(
+                    {"version": version, "name": name, "applied_at": datetime.utcnow()}
+                )
+            )
+            conn.commit()
+        applied_versions.append(version)
+    return applied_versions
+
+
+@contextmanager
+def capture_statements() -> Iterator[list[tuple]]:
+    # Collect the (sql, parameters) of every statement this process sends while inside
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    sa.event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", record_statement)
+
+
+def explain_statement(statement: str, parameters) -> dict:
+    # The planner's chosen plan for a captured statement, without running it
+    with engine.connect() as conn:
+        rp = conn.exec_driver_sql(f"explain (format json) {statement}", parameters or None)
+        plan = rp.scalar()
+    return plan[0]["Plan"]
+
+
+def fetch_partition_parents() -> dict[str, str]:
+    # partition (or partition index) name -> the partitioned table (or index) it belongs to
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.text(
+                "select relname, pg_partition_root(oid)::regclass::text from pg_class "
+                "where relispartition"
+            )
+        )
+        rows = rp.fetchall()
+    return {name: parent_name for name, parent_name in rows}
+
+
+def fetch_latest_message_datetime() -> datetime|None:
+    with engine.connect() as conn:
+        rp = conn.execute(sa.select(sa.func.max(channel_message_table.c.message_datetime)))
+    return rp.scalar()
+
+
+def fetch_message_datetime_range() -> tuple[datetime|None, datetime|None]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(
+                sa.func.min(channel_message_table.c.message_datetime),
+                sa.func.max(channel_message_table.c.message_datetime),
+            )
+        )
+    return tuple(rp.one())
+
+
+def write_table_rows_as_csv(conn: sa.Connection, table: SQLAlchemyTable, output_file, *criteria) -> int:
+    # Rows of table matching criteria, written to output_file as headerless CSV with COPY ... TO
+    # STDOUT; timestamps come out as naive UTC. Returns the number of rows written.
+    columns = [
+        sa.func.timezone("UTC", column).label(column.name)
+        if isinstance(column.type, sa.types.DateTime)
+        else column
+        for column in table.columns
+    ]
+    query = sa.select(*columns).where(*criteria).compile(
+        engine, compile_kwargs={"literal_binds": True}
+    )
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.copy_expert(f"copy ({query}) to stdout with (format csv)", output_file)
+    num_rows = cursor.rowcount
+    cursor.close()
+    return num_rows
+
+
+def copy_table_rows_to_csv(table: SQLAlchemyTable, output_file, *criteria) -> int:
+    with engine.connect() as conn:
+        return write_table_rows_as_csv(conn, table, output_file, *criteria)
+
+
+def instantiate_archived_message_months_table(my_table_name: str) -> SQLAlchemyTable:
+    # months of channel_messages moved out to the Parquet archive (see archive_message_month)
+    my_table = sa.Table(
+        my_table_name,
+        meta,
+        sa.Column("message_month", sa.types.DateTime(timezone=True), primary_key=True),
+        sa.Column("num_messages", sa.types.BIGINT, nullable=False),
+        sa.Column("archived_at", sa.types.DateTime(timezone=True), nullable=False),
+    )
+    return my_table
+
+
+def get_message_month_table_name(month_start: datetime) -> str:
+    # the table holding a month of messages: its partition, or the whole table
+    if channel_messages_partitioned:
+        return f"{channel_message_table_name}_{month_start:%Y_%m}"
+    return channel_message_table_name
+
+
+def write_month_message_counts(
+    conn: sa.Connection, month_start: datetime, archived_counts: list[dict]
+) -> None:
+    # Replace a month of channel_message_counts_hourly with the archive's counts plus those
+    # of the month's messages still in Postgres
+    counts = channel_message_counts_hourly_table
+    next_month_start = get_month_start(month_start + timedelta(days=32))
+    conn.execute(
+        sa.delete(counts).where(
+            counts.c.message_hour >= month_start, counts.c.message_hour < next_month_start
+        )
+    )
+    if len(archived_counts) > 0:
+        conn.execute(sa.insert(counts), archived_counts)
+    message_hour = sa.func.date_trunc("hour", channel_message_table.c.message_datetime)
+    stmt = pg_insert(counts).from_select(
+        ["channel_id", "message_hour", "num_messages"],
+        sa.select(channel_message_table.c.channel_id, message_hour, sa.func.count())
+        .where(
+            channel_message_table.c.message_datetime >= month_start,
+            channel_message_table.c.message_datetime < next_month_start,
+        )
+        .group_by(channel_message_table.c.channel_id, message_hour),
+    )
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["channel_id", "message_hour"],
+            set_={"num_messages": counts.c.num_messages + stmt.excluded.num_messages},
+        )
+    )
+
+
+def write_month_forward_edges(
+    conn: sa.Connection, month_start: datetime, archived_edges: list[dict]
+) -> None:
+    # Replace a month of forward_edges_daily with the archive's edges plus those of the
+    # month's messages still in Postgres
+    edges = forward_edges_daily_table
+    next_month_start = get_month_start(month_start + timedelta(days=32))
+    conn.execute(
+        sa.delete(edges).where(
+            edges.c.day >= month_start.date(), edges.c.day < next_month_start.date()
+        )
+    )
+    if len(archived_edges) > 0:
+        conn.execute(sa.insert(edges), archived_edges)
+    edge_columns = [
+        channel_message_table.c.channel_id,
+        get_message_day(channel_message_table.c.message_datetime),
+        channel_message_table.c.forwardee_channel_id,
+    ]
+    stmt = pg_insert(edges).from_select(
+        ["channel_id", "day", "forwardee_channel_id", "count", "views"],
+        sa.select(
+            *edge_columns,
+            sa.func.count(),
+            sa.func.coalesce(sa.func.sum(channel_message_table.c.message_views), 0),
+        )
+        .where(
+            channel_message_table.c.message_is_forward == True,
+            channel_message_table.c.forwardee_channel_id.is_not(None),
+            channel_message_table.c.message_datetime >= month_start,
+            channel_message_table.c.message_datetime < next_month_start,
+        )
+        .group_by(*edge_columns),
+    )
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["channel_id", "day", "forwardee_channel_id"],
+            set_={
+                "count": edges.c["count"] + stmt.excluded["count"],
+                "views": edges.c.views + stmt.excluded.views,
+            },
+        )
+    )
+
+
+def write_month_rollups(
+    conn: sa.Connection, month_start: datetime, archived_rollups: dict[str, list[dict]]
+) -> None:
+    # archived_rollups: a month of the archive summarized as rows of
+    # channel_message_counts_hourly and forward_edges_daily, keyed by table name
+    write_month_message_counts(
+        conn, month_start, archived_rollups[channel_message_counts_hourly_table_name]
+    )
+    write_month_forward_edges(conn, month_start, archived_rollups[forward_edges_daily_table_name])
+
+
+def archive_message_month(
+    month_start: datetime, write_archive: Callable[[str, datetime], dict[str, list[dict]]]
+) -> int:
+    """
+    Move one month of channel_messages out of Postgres, in one transaction. Writes to the
+    month are locked out (reads carry on) while its rows are exported to a CSV file, which
+    write_archive stages along with the archived_at the transaction will record, returning the
+    month's staged archive summarized for the rollup tables (see write_month_rollups). The rows
+    are then removed, the month's rollups replaced with those, and the month recorded in
+    archived_message_months; the caller publishes the staged archive once this has returned,
+    i.e. committed. When the table is partitioned the month's
+    partition is truncated, which hands the space back at once and keeps it attached for any
+    late writes; otherwise the rows are deleted and the space is reused after the next
+    vacuum. Returns the number of messages moved.
+    """
+    next_month_start = get_month_start(month_start + timedelta(days=32))
+    in_month = [
+        channel_message_table.c.message_datetime >= month_start,
+        channel_message_table.c.message_datetime < next_month_start,
+    ]
+    locked_table_name = get_message_month_table_name(month_start)
+
+    with engine.connect() as conn, tempfile.TemporaryDirectory() as tmp_dir:
+        exists = conn.execute(
+            sa.text("select to_regclass(:table_name) is not null"),
+            {"table_name": locked_table_name},
+        ).scalar()
+        if not exists:
+            return 0
+        conn.execute(sa.text(f"lock table {locked_table_name} in exclusive mode"))
+        csv_path = os.path.join(tmp_dir, "messages.csv")
+        with open(csv_path, "wb") as csv_file:
+            num_moved = write_table_rows_as_csv(conn, channel_message_table, csv_file, *in_month)
+        if num_moved == 0:
+            conn.rollback()
+            return 0
+        archived_at = conn.execute(sa.select(sa.func.now())).scalar()
+        archived_rollups = write_archive(csv_path, archived_at)
+        num_archived = sum(
+            [
+                record["num_messages"]
+                for record in archived_rollups[channel_message_counts_hourly_table_name]
+            ]
+        )
+
+        if channel_messages_partitioned:
+            conn.execute(sa.text(f"truncate table {locked_table_name}"))
+        else:
+            conn.execute(sa.delete(channel_message_table).where(*in_month))
+        # re-crawled messages that were already archived have just been merged into one copy
+        write_month_rollups(conn, month_start, archived_rollups)
+        stmt = pg_insert(archived_message_month_table).values(
+            message_month=month_start, num_messages=num_archived, archived_at=archived_at
+        )
+        conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["message_month"],
+                set_={
+                    "num_messages": stmt.excluded.num_messages,
+                    "archived_at": stmt.excluded.archived_at,
+                },
+            )
+        )
+        conn.commit()
+    return num_moved
+
+
+def rebuild_month_rollups(month_start: datetime, archived_rollups: dict[str, list[dict]]) -> None:
+    # Rebuild a month of the rollup tables from its archive's summary (see write_month_rollups)
+    # and the messages in Postgres, with writes to the month locked out meanwhile
+    with engine.connect() as conn:
+        locked_table_name = get_message_month_table_name(month_start)
+        exists = conn.execute(
+            sa.text("select to_regclass(:table_name) is not null"),
+            {"table_name": locked_table_name},
+        ).scalar()
+        if exists:
+            conn.execute(sa.text(f"lock table {locked_table_name} in exclusive mode"))
+        write_month_rollups(conn, month_start, archived_rollups)
+        conn.commit()
+    return
+
+
+def fetch_archived_message_months() -> list[dict]:
+    with engine.connect() as conn:
+        rp = conn.execute(
+            sa.select(archived_message_month_table).order_by(
+                archived_message_month_table.c.message_month
+            )
+        )
+    return [dict(elt._mapping) for elt in rp.fetchall()]
+
+
 channel_message_table_name = "channel_messages"
 channel_metadata_table_name = "channel_metadata"
 seed_table_name = "seeds"
 investigators_table_name = "investigators"
 credentials_table_name = "credentials"
+crawl_checkpoint_table_name = "crawl_checkpoints"
+crawl_job_table_name = "crawl_jobs"
+channel_message_payload_table_name = "channel_message_payloads"
+channel_metadata_payload_table_name = "channel_metadata_payloads"
+payload_dictionary_table_name = "payload_dictionaries"
+channel_entity_table_name = "channel_entities"
+message_engagement_snapshot_table_name = "message_engagement_snapshots"
+channel_discovery_attempt_table_name = "channel_discovery_attempts"
+api_budget_table_name = "api_budget_usage"
+schema_migration_table_name = "schema_migrations"
+channel_metadata_history_table_name = "channel_metadata_history"
+archived_message_month_table_name = "archived_message_months"
+channel_message_counts_hourly_table_name = "channel_message_counts_hourly"
+forward_edges_daily_table_name = "forward_edges_daily"
 
 
 engine = sa.create_engine(
@@ -465,10 +2703,61 @@ engine = sa.create_engine(
 )
 
 
+# An existing channel_messages keeps the layout it has (see migrate_channel_messages_to_partitions);
+# a new one is partitioned by month if the config asks for it
+channel_messages_partitioned = (
+    fetch_table_layout(channel_message_table_name)
+    or ("partitioned" if config["telegram-db"].getboolean("partition-messages", False) else "plain")
+) == "partitioned"
+# months known to have a partition already
+message_partition_cache = set()
+# seed list -> ((row count, channel_id sum), ids of its channels) (see fetch_seed_channel_ids)
+seed_channel_id_cache = {}
+# where the dashboard fetch_* queries run: "postgres", or "duckdb" over the Parquet mirror
+# written by analytics_db.mirror_to_parquet
+analytics_engine = config["telegram-db"].get("analytics-engine", "postgres")
+if analytics_engine not in ANALYTICS_ENGINES:
+    raise ValueError(f"analytics-engine must be one of {ANALYTICS_ENGINES}, not {analytics_engine!r}")
+
 # Define Telegram tables and create them if they don't already exist:
 meta = sa.MetaData()
-channel_message_table = instantiate_channel_messages_table(channel_message_table_name)
+channel_message_table = instantiate_channel_messages_table(
+    channel_message_table_name, channel_messages_partitioned
+)
 channel_metadata_table = instantiate_channel_metadata_table(channel_metadata_table_name)
 seed_table = instantiate_seed_table(seed_table_name)
 credentials_table = instantiate_credentials_table(credentials_table_name)
+crawl_checkpoint_table = instantiate_crawl_checkpoints_table(crawl_checkpoint_table_name)
+crawl_job_table = instantiate_crawl_jobs_table(crawl_job_table_name)
+channel_message_payload_table = instantiate_channel_message_payloads_table(
+    channel_message_payload_table_name
+)
+channel_metadata_payload_table = instantiate_channel_metadata_payloads_table(
+    channel_metadata_payload_table_name
+)
+payload_dictionary_table = instantiate_payload_dictionaries_table(payload_dictionary_table_name)
+channel_entity_table = instantiate_channel_entities_table(channel_entity_table_name)
+message_engagement_snapshot_table = instantiate_message_engagement_snapshots_table(
+    message_engagement_snapshot_table_name
+)
+channel_discovery_attempt_table = instantiate_channel_discovery_attempts_table(
+    channel_discovery_attempt_table_name
+)
+api_budget_table = instantiate_api_budget_table(api_budget_table_name)
+schema_migration_table = instantiate_schema_migrations_table(schema_migration_table_name)
+channel_metadata_history_table = instantiate_channel_metadata_history_table(
+    channel_metadata_history_table_name
+)
+archived_message_month_table = instantiate_archived_message_months_table(
+    archived_message_month_table_name
+)
+channel_message_counts_hourly_table = instantiate_channel_message_counts_hourly_table(
+    channel_message_counts_hourly_table_name
+)
+forward_edges_daily_table = instantiate_forward_edges_daily_table(forward_edges_daily_table_name)
+payload_tables_by_kind = {
+    channel_message_table_name: channel_message_payload_table,
+    channel_metadata_table_name: channel_metadata_payload_table,
+}
+payload_dictionary_cache = {}
 meta.create_all(engine)
@@ -0,0 +1,135 @@
+from telethon import utils
+from telethon.sync import TelegramClient
+from telethon.tl.types import Channel
+
+from .db import (
+    fetch_discovery_frontier,
+    fetch_seed_list_preview,
+    record_channel_discovery_attempt,
+    spend_api_budget,
+    fetch_api_budget_spent,
+)
+from .logic import (
+    resolve_channel_input_peer,
+    save_input_peer,
+    retrieve_channel_metadata_with_client,
+    save_channel_metadata,
+)
+from .rate_limiter import AdaptiveRateLimiter, telegram_rate_limiter
+from .telemetry import write_crawl_telemetry
+
+DISCOVERY_BUDGET_PURPOSE = "channel_discovery"
+DISCOVERY_DAILY_API_BUDGET = 500
+MAX_CHANNELS_PER_DISCOVERY_RUN = 100
+
+
+def get_discovery_frontier(seed_list_names: list[str], limit: int) -> list[dict]:
+    return fetch_discovery_frontier(seed_list_names, limit)
+
+
+def find_forwardee_channel(
+    client: TelegramClient,
+    forwarding_channel_name: str,
+    forwarding_message_id: int,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> Channel|None:
+    # A forward only carries the source channel's id, but fetching the forwarding message also
+    # returns the source channel itself, username and access_hash included
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    peer = resolve_channel_input_peer(client, forwarding_channel_name, rate_limiter)
+    message = rate_limiter.call(
+        lambda: client.get_messages(peer, ids=forwarding_message_id),
+        request="forwarding_message",
+        channel=forwarding_channel_name,
+        credential=client.api_id,
+    )
+    if message is None or message.forward is None:
+        return None
+    if not isinstance(message.forward.chat, Channel):
+        return None
+    return message.forward.chat
+
+
+def discover_channels(
+    client: TelegramClient,
+    source_seed_list_names: list[str],
+    target_seed_list_name: str,
+    daily_budget: int = DISCOVERY_DAILY_API_BUDGET,
+    max_channels: int = MAX_CHANNELS_PER_DISCOVERY_RUN,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> list[dict]:
+    """
+    Snowball out from the seed lists: look up the channels they forward most that aren't on any
+    seed list yet, heaviest first, and add them to target_seed_list_name. Every API request is
+    charged against a per-day budget shared by all discovery runs; once it is spent the run
+    stops, and the rest of the frontier waits for tomorrow. Channels without a public username
+    (or that can't be looked up) are recorded so they aren't paid for again.
+    Putting the target list among the sources makes repeated runs snowball further, as soon as
+    the channels found have had their messages crawled.
+    """
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    frontier = get_discovery_frontier(source_seed_list_names, max_channels)
+    forwarding_channel_names = {
+        seed["channel_id"]: seed["channel_name"]
+        for seed in fetch_seed_list_preview(source_seed_list_names)
+    }
+    print(
+        f"{len(frontier)} unseen channels on the frontier, "
+        f"{fetch_api_budget_spent(DISCOVERY_BUDGET_PURPOSE)} of {daily_budget} "
+        f"API requests already spent today"
+    )
+
+    attempts = []
+    for candidate in frontier:
+        attempt = {
+            "channel_id": candidate["forwardee_channel_id"],
+            "channel_name": None,
+            "forward_weight": candidate["forward_weight"],
+            "error": None,
+        }
+        try:
+            if not spend_api_budget(DISCOVERY_BUDGET_PURPOSE, daily_budget):
+                print("daily discovery budget is spent, stopping")
+                break
+            channel = find_forwardee_channel(
+                client,
+                forwarding_channel_names[candidate["forwarding_channel_id"]],
+                candidate["forwarding_message_id"],
+                rate_limiter,
+            )
+            if channel is None or channel.username is None:
+                attempt["status"] = "no_username"
+            else:
+                attempt["channel_name"] = channel.username.lower()
+                save_input_peer(
+                    attempt["channel_name"], client.api_id, utils.get_input_peer(channel)
+                )
+                if not spend_api_budget(DISCOVERY_BUDGET_PURPOSE, daily_budget):
+                    # the channel will be back on tomorrow's frontier, with its entity cached
+                    print("daily discovery budget is spent, stopping")
+                    break
+                records = retrieve_channel_metadata_with_client(
+                    client, [attempt["channel_name"]], rate_limiter
+                )
+                save_channel_metadata(records, target_seed_list_name)
+                attempt["status"] = "added" if len(records) > 0 else "no_metadata"
+        except Exception as e:
+            print(f"could not look up channel {attempt['channel_id']}: {e!r}")
+            attempt["status"] = "error"
+            attempt["error"] = repr(e)
+
+        record_channel_discovery_attempt(attempt)
+        attempts.append(attempt)
+        print(
+            f"channel {attempt['channel_id']} (forwarded {attempt['forward_weight']} times): "
+            f"{attempt['status']} {'@' + attempt['channel_name'] if attempt['channel_name'] else ''}"
+        )
+
+    num_added = len([attempt for attempt in attempts if attempt["status"] == "added"])
+    print(f"added {num_added} channels to seed list {target_seed_list_name}")
+    write_crawl_telemetry("channel_discovery")
+    return attempts
@@ -0,0 +1,267 @@
+import asyncio
+import time
+from datetime import date
+from typing import AsyncIterator
+
+from telethon import TelegramClient
+
+from .rate_limiter import AdaptiveRateLimiter, telegram_rate_limiter
+from .telemetry import crawl_telemetry, write_crawl_telemetry
+from .db import (
+    fetch_crawl_checkpoint,
+    mark_crawl_history_complete,
+    fetch_channel_entity,
+    delete_channel_entity,
+)
+from .logic import (
+    extract_records_from_message_page,
+    make_input_peer_from_channel_entity,
+    save_input_peer,
+    STALE_PEER_ERRORS,
+    plan_channel_crawl,
+    save_channel_message_batch,
+    MESSAGES_PER_PAGE,
+    MESSAGES_PER_FLUSH,
+    EARLIEST_MESSAGE_DATE,
+)
+
+MAX_CONCURRENT_CHANNELS = 5
+
+
+async def aresolve_channel_input_peer(
+    client: TelegramClient,
+    channel_name: str,
+    rate_limiter: AdaptiveRateLimiter = None,
+    refresh: bool = False,
+):
+    # Async twin of resolve_channel_input_peer; refresh drops the cached entry first
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    if refresh:
+        print(f"cached entity for @{channel_name} was rejected, resolving it again")
+        await asyncio.to_thread(delete_channel_entity, channel_name, client.api_id)
+    else:
+        peer = make_input_peer_from_channel_entity(
+            await asyncio.to_thread(fetch_channel_entity, channel_name, client.api_id)
+        )
+        if peer is not None:
+            return peer
+
+    peer = await rate_limiter.call_async(
+        lambda: client.get_input_entity(channel_name),
+        request="resolve_username",
+        channel=channel_name,
+        credential=client.api_id,
+    )
+    await asyncio.to_thread(save_input_peer, channel_name, client.api_id, peer)
+    return peer
+
+
+async def aiter_channel_message_pages(
+    client: TelegramClient,
+    channel_name: str,
+    min_id: int = 0,
+    max_id: int = 0,
+    reverse: bool = False,
+    earliest_date: date = EARLIEST_MESSAGE_DATE,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> AsyncIterator[list[dict]]:
+    # Async twin of iter_channel_message_pages: yields one page of extracted records at a time
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    peer = await aresolve_channel_input_peer(client, channel_name, rate_limiter)
+    peer_was_refreshed = False
+
+    async def fetch_page() -> list:
+        return [
+            message
+            async for message in client.iter_messages(
+                peer,
+                min_id=min_id,
+                max_id=max_id,
+                limit=MESSAGES_PER_PAGE,
+                reverse=reverse,
+            )
+        ]
+
+    num_messages = 0
+    while True:
+        try:
+            new_messages = await rate_limiter.call_async(
+                fetch_page,
+                request="messages_page",
+                channel=channel_name,
+                credential=client.api_id,
+            )
+        except STALE_PEER_ERRORS:
+            if peer_was_refreshed:
+                raise
+            peer = await aresolve_channel_input_peer(
+                client, channel_name, rate_limiter, refresh=True
+            )
+            peer_was_refreshed = True
+            continue
+
+        if len(new_messages) == 0:
+            break
+        crawl_telemetry.increment(
+            "crawl_messages_total",
+            len(new_messages),
+            channel=channel_name,
+            credential=client.api_id,
+        )
+
+        if reverse:
+            min_id = max([message.id for message in new_messages])
+        else:
+            max_id = min([message.id for message in new_messages])
+        num_messages += len(new_messages)
+        print(f"@{channel_name}: found {num_messages} messages so far")
+
+        earliest_message_datetime_for_this_batch = min(
+            [message.date for message in new_messages]
+        )
+        yield extract_records_from_message_page(new_messages)
+
+        # Stopping conditions
+        if len(new_messages) < MESSAGES_PER_PAGE:
+            break
+
+        if not reverse and earliest_message_datetime_for_this_batch.date() < earliest_date:
+            print(f"@{channel_name}: we've gone back far enough!")
+            break
+
+
+async def harvest_channel_messages(
+    client: TelegramClient,
+    channel_name: str,
+    messages_per_flush: int = MESSAGES_PER_FLUSH,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> dict:
+    """
+    Crawl the messages of a single channel that we don't have yet, using an already-connected
+    client, flushing records (and the channel's checkpoint) every messages_per_flush messages.
+    Returns a small throughput report for the channel.
+    """
+    start_time = time.perf_counter()
+
+    # DB calls are blocking, so keep them off the event loop:
+    checkpoint = await asyncio.to_thread(fetch_crawl_checkpoint, channel_name)
+
+    num_saved = 0
+    try:
+        for crawl_pass in plan_channel_crawl(checkpoint):
+            batch = []
+            pages = aiter_channel_message_pages(
+                client, channel_name, **crawl_pass, rate_limiter=rate_limiter
+            )
+            async for records in pages:
+                batch += records
+                if len(batch) >= messages_per_flush:
+                    await asyncio.to_thread(
+                        save_channel_message_batch, channel_name, batch, client.api_id
+                    )
+                    num_saved += len(batch)
+                    batch = []
+            if len(batch) > 0:
+                await asyncio.to_thread(
+                    save_channel_message_batch, channel_name, batch, client.api_id
+                )
+                num_saved += len(batch)
+
+            if not crawl_pass["reverse"]:
+                await asyncio.to_thread(mark_crawl_history_complete, channel_name)
+    finally:
+        crawl_telemetry.increment(
+            "crawl_seconds_total",
+            time.perf_counter() - start_time,
+            channel=channel_name,
+            credential=client.api_id,
+        )
+
+    elapsed_seconds = time.perf_counter() - start_time
+    return {
+        "channel_name": channel_name,
+        "num_messages": num_saved,
+        "elapsed_seconds": elapsed_seconds,
+        "messages_per_second": num_saved / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+        "error": None,
+    }
+
+
+async def harvest_many_channels(
+    channel_names: list[str],
+    app_name: str,
+    api_id: int,
+    api_hash: str,
+    max_concurrent_channels: int = MAX_CONCURRENT_CHANNELS,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> list[dict]:
+    semaphore = asyncio.Semaphore(max_concurrent_channels)
+
+    # All channels share one client and one rate limiter, so concurrency never means
+    # hitting Telegram harder than the limiter allows
+    async with TelegramClient(
+        app_name, api_id, api_hash, flood_sleep_threshold=0
+    ) as client:
+
+        async def harvest_with_limit(channel_name: str) -> dict:
+            async with semaphore:
+                try:
+                    return await harvest_channel_messages(
+                        client, channel_name, rate_limiter=rate_limiter
+                    )
+                except Exception as e:
+                    # one bad channel should not take the whole harvest down with it
+                    print(f"@{channel_name}: harvest failed with {e!r}")
+                    return {
+                        "channel_name": channel_name,
+                        "num_messages": 0,
+                        "elapsed_seconds": 0.0,
+                        "messages_per_second": 0.0,
+                        "error": repr(e),
+                    }
+
+        reports = await asyncio.gather(
+            *[harvest_with_limit(channel_name) for channel_name in channel_names]
+        )
+
+    return list(reports)
+
+
+def print_harvest_report(reports: list[dict]) -> None:
+    for report in sorted(reports, key=lambda x: x["messages_per_second"], reverse=True):
+        status = "ok" if report["error"] is None else f"failed: {report['error']}"
+        credential = f" via {report['credential']}" if "credential" in report else ""
+        print(
+            f"@{report['channel_name']}{credential}: {report['num_messages']} messages in "
+            f"{report['elapsed_seconds']:.1f}s "
+            f"({report['messages_per_second']:.1f} messages/s) [{status}]"
+        )
+    total_messages = sum([report["num_messages"] for report in reports])
+    print(f"harvested {total_messages} messages from {len(reports)} channels")
+
+
+def harvest_and_save_channel_messages(
+    channel_names: list[str],
+    app_name: str,
+    api_id: int,
+    api_hash: str,
+    max_concurrent_channels: int = MAX_CONCURRENT_CHANNELS,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> list[dict]:
+    reports = asyncio.run(
+        harvest_many_channels(
+            channel_names,
+            app_name,
+            api_id,
+            api_hash,
+            max_concurrent_channels,
+            rate_limiter,
+        )
+    )
+    print_harvest_report(reports)
+    write_crawl_telemetry("harvest")
+    return reports
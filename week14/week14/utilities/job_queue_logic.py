@@ -0,0 +1,207 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from telethon.sync import TelegramClient
+from telethon.sessions import StringSession
+
+from .db import (
+    enqueue_crawl_jobs,
+    claim_crawl_job,
+    renew_crawl_job_lease,
+    complete_crawl_job,
+    fail_crawl_job,
+    fetch_crawl_job_counts,
+    fetch_seed_list_preview,
+)
+from .logic import (
+    retrieve_channel_metadata_with_client,
+    save_channel_metadata,
+    crawl_and_save_channel_messages,
+)
+from .rate_limiter import AdaptiveRateLimiter
+from .telemetry import write_crawl_telemetry
+
+JOB_TYPES = ("channel_metadata", "channel_messages")
+LEASE_SECONDS = 600
+SECONDS_TO_WAIT_WHEN_QUEUE_IS_EMPTY = 10
+RETRY_DELAY_SECONDS = 60
+
+
+def enqueue_channel_metadata_jobs(
+    channel_names: list[str], seed_list_name: str, priority: int = 0
+) -> int:
+    return enqueue_crawl_jobs(
+        [
+            {
+                "job_type": "channel_metadata",
+                "channel_name": channel_name,
+                "seed_list": seed_list_name,
+                "priority": priority,
+            }
+            for channel_name in channel_names
+        ]
+    )
+
+
+def enqueue_channel_message_jobs(seed_list_names: list[str], priority: int = 0) -> int:
+    channel_names = sorted(
+        set([seed["channel_name"] for seed in fetch_seed_list_preview(seed_list_names)])
+    )
+    if len(channel_names) == 0:
+        return 0
+    return enqueue_crawl_jobs(
+        [
+            {
+                "job_type": "channel_messages",
+                "channel_name": channel_name,
+                "seed_list": None,
+                "priority": priority,
+            }
+            for channel_name in channel_names
+        ]
+    )
+
+
+def get_crawl_job_counts() -> list[dict]:
+    return fetch_crawl_job_counts()
+
+
+def export_string_sessions(credentials: list[dict]) -> list[dict]:
+    # Log every account in from the main process (workers can't prompt for a login code) and
+    # hand workers a StringSession, so several processes can share one account without
+    # fighting over its SQLite session file
+    sessions = []
+    for credential in credentials:
+        with TelegramClient(
+            credential["app_name"], credential["api_id"], credential["api_hash"]
+        ) as client:
+            sessions.append({**credential, "session": StringSession.save(client.session)})
+    return sessions
+
+
+def run_crawl_job(
+    client: TelegramClient, job: dict, rate_limiter: AdaptiveRateLimiter
+) -> None:
+    if job["job_type"] == "channel_metadata":
+        records = retrieve_channel_metadata_with_client(
+            client, [job["channel_name"]], rate_limiter
+        )
+        # a batch that wasn't written fails the job, so it is retried and its error recorded
+        save_channel_metadata(records, job["seed_list"], skip_name_conflicts=False)
+    elif job["job_type"] == "channel_messages":
+        crawl_and_save_channel_messages(
+            client, job["channel_name"], rate_limiter=rate_limiter
+        )
+    else:
+        raise ValueError(f"unknown job type {job['job_type']}")
+
+
+def keep_lease_alive(
+    job_id: int, worker_id: str, lease_seconds: int, stop_event: threading.Event
+) -> None:
+    # Long crawls outlive a single lease, so renew it in the background until told to stop
+    while not stop_event.wait(lease_seconds / 3):
+        if not renew_crawl_job_lease(job_id, worker_id, lease_seconds):
+            print(f"[{worker_id}] lost the lease on job {job_id}")
+            return
+
+
+def run_crawl_worker(
+    worker_id: str,
+    credential: dict,
+    job_types: list[str] = None,
+    lease_seconds: int = LEASE_SECONDS,
+    stop_when_empty: bool = False,
+) -> None:
+    """
+    Claim and run crawl jobs until the queue is empty (if stop_when_empty) or forever.
+    A failed job goes back in the queue with a growing delay until it runs out of attempts;
+    a job whose worker died is picked up again once its lease expires.
+    """
+    rate_limiter = AdaptiveRateLimiter()
+    with TelegramClient(
+        StringSession(credential["session"]),
+        credential["api_id"],
+        credential["api_hash"],
+        flood_sleep_threshold=0,
+    ) as client:
+        while True:
+            job = claim_crawl_job(worker_id, lease_seconds, job_types)
+            if job is None:
+                if stop_when_empty:
+                    break
+                time.sleep(SECONDS_TO_WAIT_WHEN_QUEUE_IS_EMPTY)
+                continue
+
+            if job["attempts"] > job["max_attempts"]:
+                # the worker holding its last attempt died without reporting back
+                fail_crawl_job(job["job_id"], worker_id, job["last_error"] or "lease expired", 0)
+                continue
+
+            print(
+                f"[{worker_id}] {job['job_type']} @{job['channel_name']} "
+                f"(attempt {job['attempts']} of {job['max_attempts']})"
+            )
+            stop_event = threading.Event()
+            heartbeat = threading.Thread(
+                target=keep_lease_alive,
+                args=(job["job_id"], worker_id, lease_seconds, stop_event),
+                daemon=True,
+            )
+            heartbeat.start()
+            try:
+                run_crawl_job(client, job, rate_limiter)
+            except Exception as e:
+                print(f"[{worker_id}] job {job['job_id']} failed: {e!r}")
+                # a flood wait too long for the rate limiter to sit out holds the job back
+                # at least that long
+                retry_delay_seconds = max(
+                    RETRY_DELAY_SECONDS * job["attempts"], getattr(e, "seconds", None) or 0
+                )
+                reported = fail_crawl_job(job["job_id"], worker_id, repr(e), retry_delay_seconds)
+            else:
+                reported = complete_crawl_job(job["job_id"], worker_id)
+            finally:
+                stop_event.set()
+                heartbeat.join()
+                write_crawl_telemetry(f"crawl_worker-{worker_id}")
+            if not reported:
+                # the lease expired mid-job and another worker owns it now; leave it to them
+                print(f"[{worker_id}] lost job {job['job_id']} before reporting on it")
+
+    print(f"[{worker_id}] queue is empty, exiting")
+
+
+def run_crawl_workers(
+    credentials: list[dict],
+    num_workers: int,
+    job_types: list[str] = None,
+    lease_seconds: int = LEASE_SECONDS,
+    stop_when_empty: bool = False,
+) -> None:
+    # Accounts are handed out round-robin; with more workers than accounts, some workers
+    # share an account (and its flood limits)
+    sessions = export_string_sessions(credentials)
+    worker_id_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=run_crawl_worker,
+            args=(
+                f"{worker_id_prefix}-{i}",
+                sessions[i % len(sessions)],
+                job_types,
+                lease_seconds,
+                stop_when_empty,
+            ),
+        )
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -4,32 +4,92 @@ import networkx as nx
 from networkx.classes.digraph import DiGraph
 import community
 from urllib.parse import urlparse
+import json
+import base64
 import time
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator
 
-from telethon.errors.rpcerrorlist import UsernameInvalidError
+from telethon.errors.rpcerrorlist import (
+    UsernameInvalidError,
+    ChannelInvalidError,
+    PeerIdInvalidError,
+)
 from telethon.sync import TelegramClient
 from telethon import functions
 from telethon.tl.patched import Message as TelegramMessage
 from telethon.tl.types.messages import ChatFull
+from telethon.tl.types import InputPeerChannel
 
+from .rate_limiter import AdaptiveRateLimiter, telegram_rate_limiter
+from .telemetry import crawl_telemetry, write_crawl_telemetry
 from .db import (
     insert_data_into_seed_table,
     insert_data_into_channel_metadata_table_advanced,
-    insert_data_into_channel_messages_table_advanced,
+    bulk_load_channel_messages,
     fetch_seed_list_names,
     fetch_seed_list_preview,
+    fetch_seed_channel_ids,
     fetch_seed_metadata_full,
     fetch_birth_chart_data,
     fetch_time_series_chart_data,
     fetch_top_messages,
+    fetch_message_search_hits,
     fetch_weighted_edges_fwd_network,
     fetch_domain_edges,
     fetch_metadata_for_single_channel,
-    fetch_target_start_date
+    fetch_message_api_responses,
+    fetch_channel_metadata_api_response,
+    fetch_crawl_checkpoint,
+    update_crawl_checkpoint,
+    mark_crawl_history_complete,
+    fetch_channel_entity,
+    save_channel_entity,
+    delete_channel_entity,
+    fetch_message_engagement_history,
+    fetch_channel_metadata_history,
+    analytics_engine,
 )
+from .archive_logic import reaches_archive
+
+if analytics_engine == "duckdb":
+    # the dashboard queries read the Parquet mirror and archive instead; same signatures and records
+    from .analytics_db import (
+        fetch_seed_metadata_full,
+        fetch_birth_chart_data,
+        fetch_time_series_chart_data,
+        fetch_top_messages,
+        fetch_weighted_edges_fwd_network,
+        fetch_domain_edges,
+    )
+else:
+    # the message queries add in whatever has been archived (see archive_logic)
+    from .archive_logic import (
+        fetch_time_series_chart_data,
+        fetch_top_messages,
+        fetch_domain_edges,
+    )
 
-SECONDS_TO_PAUSE_BETWEEN_CHANNEL_INFO_LOOKUPS = 30
+MESSAGES_PER_PAGE = 100
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 500
+MESSAGES_PER_FLUSH = 1000
+EARLIEST_MESSAGE_DATE = date(2010, 1, 1)
+CHANNEL_ENTITY_MAX_AGE = timedelta(days=30)
+# errors Telegram raises when a cached channel_id/access_hash pair is no longer accepted
+STALE_PEER_ERRORS = (ChannelInvalidError, PeerIdInvalidError)
+CHANNEL_MESSAGE_COLUMNS = (
+    "channel_id",
+    "message_id",
+    "message_datetime",
+    "message_views",
+    "message_forwards",
+    "message_text",
+    "forwardee_channel_id",
+    "forwardee_message_id",
+    "message_is_forward",
+    "api_response",
+)
 
 
 def extract_data_dictionary_from_channel_object(
@@ -46,57 +106,139 @@ def extract_data_dictionary_from_channel_object(
     }
 
 
-def retrieve_channel_metadata(
-    channel_names: list[str], app_name: str, api_id: int, api_hash: str
+def make_input_peer_from_channel_entity(
+    channel_entity: dict|None,
+) -> InputPeerChannel|None:
+    if channel_entity is None:
+        return None
+    if datetime.now(timezone.utc) - channel_entity["resolved_at"] > CHANNEL_ENTITY_MAX_AGE:
+        return None
+    return InputPeerChannel(channel_entity["channel_id"], channel_entity["access_hash"])
+
+
+def save_input_peer(channel_name: str, api_id: int, peer) -> None:
+    # users and chats can't be crawled like channels, so only channel peers are worth keeping
+    if isinstance(peer, InputPeerChannel):
+        save_channel_entity(
+            {
+                "channel_name": channel_name,
+                "api_id": api_id,
+                "channel_id": peer.channel_id,
+                "access_hash": peer.access_hash,
+            }
+        )
+
+
+def resolve_channel_input_peer(
+    client: TelegramClient,
+    channel_name: str,
+    rate_limiter: AdaptiveRateLimiter = None,
+):
+    """
+    Turn a channel username into an input peer, using the channel_entities cache when it has a
+    fresh entry for this account. Otherwise the username is resolved through the API (which
+    costs a ResolveUsernameRequest, one of the most heavily flood-limited calls) and cached.
+    """
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    peer = make_input_peer_from_channel_entity(
+        fetch_channel_entity(channel_name, client.api_id)
+    )
+    if peer is not None:
+        return peer
+
+    peer = rate_limiter.call(
+        lambda: client.get_input_entity(channel_name),
+        request="resolve_username",
+        channel=channel_name,
+        credential=client.api_id,
+    )
+    save_input_peer(channel_name, client.api_id, peer)
+    return peer
+
+
+def refresh_channel_input_peer(
+    client: TelegramClient,
+    channel_name: str,
+    rate_limiter: AdaptiveRateLimiter = None,
+):
+    # Telegram rejected the cached peer, so drop it and resolve the username again
+    print(f"cached entity for @{channel_name} was rejected, resolving it again")
+    delete_channel_entity(channel_name, client.api_id)
+    return resolve_channel_input_peer(client, channel_name, rate_limiter)
+
+
+def retrieve_channel_metadata_with_client(
+    client: TelegramClient,
+    channel_names: list[str],
+    rate_limiter: AdaptiveRateLimiter = None,
 ) -> list[dict]:
-    # Retrieve data from Telegram API, using Telethon:
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
     records = []
-    with TelegramClient(app_name, api_id, api_hash) as client:
-        for channel_name in channel_names:
-            print(f"Querying Telegram API for @{channel_name}...")
+    for channel_name in channel_names:
+        print(f"Querying Telegram API for @{channel_name}...")
+        try:
+            peer = resolve_channel_input_peer(client, channel_name, rate_limiter)
+            # the rate limiter paces these calls and sits out any flood waits
+            labels = {
+                "request": "channel_metadata",
+                "channel": channel_name,
+                "credential": client.api_id,
+            }
             try:
-                channel_object = client(
-                    functions.channels.GetFullChannelRequest(channel=channel_name)
+                channel_object = rate_limiter.call(
+                    lambda: client(functions.channels.GetFullChannelRequest(channel=peer)),
+                    **labels,
                 )
-            except ValueError as e:
-                print(e)
-                channel_object = None
-            except UsernameInvalidError as e:
-                print(e)
-                channel_object = None
-            except Exception as e:
-                raise e
-
-            if channel_object is not None:
-                records.append(
-                    extract_data_dictionary_from_channel_object(
-                        channel_object, channel_name
-                    )
+            except STALE_PEER_ERRORS:
+                peer = refresh_channel_input_peer(client, channel_name, rate_limiter)
+                channel_object = rate_limiter.call(
+                    lambda: client(functions.channels.GetFullChannelRequest(channel=peer)),
+                    **labels,
                 )
-            else:
-                print(f"No metadata returned by Telegram API for @{channel_name}")
+        except ValueError as e:
+            print(e)
+            channel_object = None
+        except UsernameInvalidError as e:
+            print(e)
+            channel_object = None
+        except Exception as e:
+            raise e
 
-            print(
-                f"Pausing {SECONDS_TO_PAUSE_BETWEEN_CHANNEL_INFO_LOOKUPS} seconds "
-                f"to respect Telegram API rate limits..."
+        if channel_object is not None:
+            records.append(
+                extract_data_dictionary_from_channel_object(
+                    channel_object, channel_name
+                )
             )
-            time.sleep(
-                SECONDS_TO_PAUSE_BETWEEN_CHANNEL_INFO_LOOKUPS
-            )  # pause to respect API rate limiting
+        else:
+            print(f"No metadata returned by Telegram API for @{channel_name}")
 
     return records
 
 
-def retrieve_and_save_channel_metadata(
+def retrieve_channel_metadata(
     channel_names: list[str],
     app_name: str,
     api_id: int,
     api_hash: str,
-    seed_list_name: str,
-) -> None:
-    # Retrieve data from Telegram API
-    records = retrieve_channel_metadata(channel_names, app_name, api_id, api_hash)
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> list[dict]:
+    # Retrieve data from Telegram API, using Telethon:
+    with TelegramClient(app_name, api_id, api_hash, flood_sleep_threshold=0) as client:
+        records = retrieve_channel_metadata_with_client(
+            client, channel_names, rate_limiter
+        )
+    write_crawl_telemetry("channel_metadata")
+    return records
 
+
+def save_channel_metadata(
+    records: list[dict], seed_list_name: str, skip_name_conflicts: bool = True
+) -> None:
     # Prepare seed data
     seed_records = [
         {
@@ -109,11 +251,29 @@ def retrieve_and_save_channel_metadata(
 
     # Insert data into database
     if len(records) > 0:
-        insert_data_into_channel_metadata_table_advanced(records)
+        insert_data_into_channel_metadata_table_advanced(
+            records, skip_name_conflicts=skip_name_conflicts
+        )
         insert_data_into_seed_table(seed_records)
     return
 
 
+def retrieve_and_save_channel_metadata(
+    channel_names: list[str],
+    app_name: str,
+    api_id: int,
+    api_hash: str,
+    seed_list_name: str,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> None:
+    # Retrieve data from Telegram API
+    records = retrieve_channel_metadata(
+        channel_names, app_name, api_id, api_hash, rate_limiter
+    )
+    save_channel_metadata(records, seed_list_name)
+    return
+
+
 def get_names_of_seed_lists() -> list[dict]:
     return fetch_seed_list_names()
 
@@ -126,7 +286,7 @@ def get_seed_channel_metadata(seed_list_names: list[str]) -> list[dict]:
     records = fetch_seed_metadata_full(seed_list_names)
 
     # Remove private fields:
-    private_fields = ["api_response", "checkup_time", "data_source"]
+    private_fields = ["checkup_time", "data_source"]
     for private_field in private_fields:
         [record.pop(private_field) for record in records]
 
@@ -156,12 +316,7 @@ def get_top_messages(
     seed_list_names: list[str],
     the_limit: int = 1000,
 ) -> list[dict]:
-    records = fetch_top_messages(seed_list_names, start_date, end_date, the_limit)
-
-    # Remove api_response field
-    [record.pop("api_response") for record in records]
-
-    return records
+    return fetch_top_messages(seed_list_names, start_date, end_date, the_limit)
 
 
 def generate_markdown_hyperlink(record: dict) -> str:
@@ -208,9 +363,39 @@ def render_message_table(
     return df_records
 
 
-def store_channel_messages(records: list[dict]) -> None:
-    insert_data_into_channel_messages_table_advanced(records)
-    return
+def search_messages(
+    seed_list_names: list[str],
+    start_date: str,
+    end_date: str,
+    query: str,
+    page: int = 1,
+    page_size: int = SEARCH_PAGE_SIZE,
+) -> dict:
+    hits = fetch_message_search_hits(
+        seed_list_names, start_date, end_date, query, page_size, (page - 1) * page_size
+    )
+    channel_names = {
+        int(seed["channel_id"]): seed["channel_name"]
+        for seed in get_seed_list_preview(seed_list_names)
+    }
+    num_hits = hits[0]["num_hits"] if len(hits) > 0 else 0
+    for hit in hits:
+        del hit["num_hits"]
+        hit["channel_name"] = channel_names.get(int(hit["channel_id"]))
+        hit["url"] = f"https://t.me/{hit['channel_name']}/{hit['message_id']}"
+    return {
+        "hits": hits,
+        "num_hits": num_hits,
+        "page": page,
+        "page_size": page_size,
+        # search only covers messages still in Postgres, so tell the caller when some of the
+        # date range has been archived
+        "archive_not_searched": reaches_archive(start_date),
+    }
+
+
+def store_channel_messages(records: list[dict]) -> int:
+    return bulk_load_channel_messages(records)
 
 
 def extract_data_from_message_object(message: TelegramMessage) -> dict:
@@ -241,69 +426,286 @@ def extract_data_from_message_object(message: TelegramMessage) -> dict:
     return message_dict
 
 
-def retrieve_channel_messages_from_telegram(
-    channel_name: str, app_name: str, api_id: int, api_hash: str
-) -> list[dict]:
-
-    # get the date back to which we should retrieve messages:
-    target_start_date = fetch_target_start_date(channel_name)
-
-    new_max_id = 0
-    messages = []
-    with TelegramClient(app_name, api_id, api_hash) as client:
-        while True:
-            message_iterator = client.iter_messages(
-                channel_name, min_id=0, max_id=new_max_id, limit=100
+def json_default(value):
+    # Same fallbacks Telethon's to_json() uses for values JSON can't represent
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    elif isinstance(value, datetime):
+        return value.isoformat()
+    else:
+        return repr(value)
+
+
+def extract_columns_from_message_page(messages: list[TelegramMessage]) -> dict[str, list]:
+    """
+    Batch version of extract_data_from_message_object. Each message is converted with a
+    single to_dict() call, and that same dictionary is walked once to fill one list per
+    channel_messages column (forward fields included) and serialized for api_response.
+    Service messages (joins, pins, etc.) are skipped; only real posts are kept.
+    """
+    columns = {column: [] for column in CHANNEL_MESSAGE_COLUMNS}
+    for message in messages:
+        message_dict = message.to_dict()
+        if message_dict["_"] != "Message":
+            continue
+
+        forwardee_channel_id = None
+        forwardee_message_id = None
+        fwd_from = message_dict["fwd_from"]
+        if fwd_from is not None:
+            from_id = fwd_from["from_id"]
+            if from_id is not None and "channel_id" in from_id:
+                forwardee_channel_id = from_id["channel_id"]
+                forwardee_message_id = fwd_from["channel_post"]
+
+        columns["channel_id"].append(message_dict["peer_id"]["channel_id"])
+        columns["message_id"].append(message_dict["id"])
+        columns["message_datetime"].append(message_dict["date"])
+        columns["message_views"].append(message_dict["views"])
+        columns["message_forwards"].append(message_dict["forwards"])
+        columns["message_text"].append(message_dict["message"])
+        columns["forwardee_channel_id"].append(forwardee_channel_id)
+        columns["forwardee_message_id"].append(forwardee_message_id)
+        columns["message_is_forward"].append(fwd_from is not None)
+        columns["api_response"].append(json.dumps(message_dict, default=json_default))
+
+    return columns
+
+
+def message_columns_to_records(columns: dict[str, list]) -> list[dict]:
+    return [dict(zip(columns.keys(), row)) for row in zip(*columns.values())]
+
+
+def extract_records_from_message_page(messages: list[TelegramMessage]) -> list[dict]:
+    return message_columns_to_records(extract_columns_from_message_page(messages))
+
+
+def plan_channel_crawl(checkpoint: dict|None) -> list[dict]:
+    """
+    Turn a channel's crawl checkpoint into the id ranges we still need from Telegram:
+    (1) a forward pass for anything newer than the high-water mark; on a channel that is
+    already in sync this is a single request that comes back empty, and
+    (2) a backward pass from the low-water mark, until the start of the channel has been
+    reached once (this also resumes first crawls that were interrupted).
+    A channel we've never stored anything from is crawled backward from its newest message.
+    """
+    if checkpoint is None:
+        return [{"min_id": 0, "max_id": 0, "reverse": False}]
+
+    crawl_passes = [{"min_id": checkpoint["max_message_id"], "max_id": 0, "reverse": True}]
+    if not checkpoint["history_complete"]:
+        crawl_passes.append(
+            {"min_id": 0, "max_id": checkpoint["min_message_id"], "reverse": False}
+        )
+    return crawl_passes
+
+
+def iter_channel_message_pages(
+    client: TelegramClient,
+    channel_name: str,
+    min_id: int = 0,
+    max_id: int = 0,
+    reverse: bool = False,
+    earliest_date: date = EARLIEST_MESSAGE_DATE,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> Iterator[list[dict]]:
+    """
+    Page through the messages of a channel with min_id < message_id < max_id (0 meaning
+    unbounded), yielding one page of extracted records at a time. Pages go from newest to
+    oldest, or from oldest to newest if reverse is set; a backward crawl also stops once it
+    has gone back past earliest_date. The Telethon Message objects of a page are dropped as
+    soon as the page has been converted, so memory use does not grow with the size of the
+    channel. Requests are paced by rate_limiter, which also retries flood waits and transient
+    failures; any other error from the Telegram API is raised to the caller.
+    """
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+
+    peer = resolve_channel_input_peer(client, channel_name, rate_limiter)
+    peer_was_refreshed = False
+
+    num_messages = 0
+    while True:
+        try:
+            new_messages = rate_limiter.call(
+                lambda: list(
+                    client.iter_messages(
+                        peer,
+                        min_id=min_id,
+                        max_id=max_id,
+                        limit=MESSAGES_PER_PAGE,
+                        reverse=reverse,
+                    )
+                ),
+                request="messages_page",
+                channel=channel_name,
+                credential=client.api_id,
             )
+        except STALE_PEER_ERRORS:
+            if peer_was_refreshed:
+                raise
+            peer = refresh_channel_input_peer(client, channel_name, rate_limiter)
+            peer_was_refreshed = True
+            continue
+
+        if len(new_messages) == 0:
+            break
+        crawl_telemetry.increment(
+            "crawl_messages_total",
+            len(new_messages),
+            channel=channel_name,
+            credential=client.api_id,
+        )
 
-            try:
-                new_messages = list(message_iterator)
-            except Exception as e:
-                print(e)
-                new_messages = []
-
-            # Calculate new_max_id
-            if len(new_messages) > 0:
-                new_max_id = min([message.id for message in new_messages])
-                messages += new_messages
-
-                print(
-                    f"found {len(messages)} messages so far, and set new_max_id={new_max_id}"
-                )
+        # Move the window past this page
+        if reverse:
+            min_id = max([message.id for message in new_messages])
+        else:
+            max_id = min([message.id for message in new_messages])
+        num_messages += len(new_messages)
+        print(
+            f"found {num_messages} messages so far, and set "
+            f"{'min_id' if reverse else 'max_id'}={min_id if reverse else max_id}"
+        )
 
-            # Stopping condition
-            if len(new_messages) < 100:
-                break
+        earliest_message_datetime_for_this_batch = min(
+            [message.date for message in new_messages]
+        )
+        yield extract_records_from_message_page(new_messages)
 
-            earliest_message_datetime_for_this_batch = min([message.to_dict()["date"] for message in new_messages])
-            print(f"we have gone back to {earliest_message_datetime_for_this_batch.strftime('%Y-%m-%d %H:%M:%S')}")
+        # Stopping conditions
+        if len(new_messages) < MESSAGES_PER_PAGE:
+            break
 
-            if earliest_message_datetime_for_this_batch.date() < target_start_date.date():
+        if not reverse:
+            print(f"we have gone back to {earliest_message_datetime_for_this_batch.strftime('%Y-%m-%d %H:%M:%S')}")
+            if earliest_message_datetime_for_this_batch.date() < earliest_date:
                 print(f"we've gone back far enough!")
                 break
 
-            # Respectful pause so as not to flood the API
-            time.sleep(1)
 
-    records = [
-        extract_data_from_message_object(message)
-        for message in messages
-        if message.to_dict()["_"] == "Message"
-    ]
+def iter_record_batches(
+    record_pages: Iterable[list[dict]], batch_size: int = MESSAGES_PER_FLUSH
+) -> Iterator[list[dict]]:
+    # Regroup pages of records into batches of (at least) batch_size records
+    batch = []
+    for records in record_pages:
+        batch += records
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def make_checkpoint_from_records(channel_name: str, records: list[dict]) -> dict:
+    newest_record = max(records, key=lambda x: x["message_id"])
+    oldest_record = min(records, key=lambda x: x["message_id"])
+    return {
+        "channel_id": newest_record["channel_id"],
+        "channel_name": channel_name,
+        "max_message_id": newest_record["message_id"],
+        "max_message_datetime": newest_record["message_datetime"],
+        "min_message_id": oldest_record["message_id"],
+        "min_message_datetime": oldest_record["message_datetime"],
+        "history_complete": False,
+    }
+
+
+def save_channel_message_batch(channel_name: str, records: list[dict], credential: int) -> None:
+    # Checkpoint only after the records are safely stored; if we crash in between,
+    # the next run simply re-fetches this batch. credential is the api_id of the client that
+    # crawled them, to label the metrics like the Telegram request metrics
+    labels = {"channel": channel_name, "credential": credential}
+    with crawl_telemetry.timer("db_flush_seconds", **labels):
+        num_written = store_channel_messages(records)
+        update_crawl_checkpoint(make_checkpoint_from_records(channel_name, records))
+    crawl_telemetry.increment("db_records_written_total", num_written, **labels)
+    crawl_telemetry.increment(
+        "db_records_deduplicated_total", len(records) - num_written, **labels
+    )
+
+
+def retrieve_channel_messages_from_telegram(
+    channel_name: str,
+    app_name: str,
+    api_id: int,
+    api_hash: str,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> list[dict]:
+    # figure out which messages we don't have yet:
+    crawl_passes = plan_channel_crawl(fetch_crawl_checkpoint(channel_name))
+
+    records = []
+    with TelegramClient(app_name, api_id, api_hash, flood_sleep_threshold=0) as client:
+        start_time = time.perf_counter()
+        for crawl_pass in crawl_passes:
+            for page in iter_channel_message_pages(
+                client, channel_name, **crawl_pass, rate_limiter=rate_limiter
+            ):
+                records += page
+        crawl_telemetry.increment(
+            "crawl_seconds_total",
+            time.perf_counter() - start_time,
+            channel=channel_name,
+            credential=client.api_id,
+        )
 
     return records
 
 
+def crawl_and_save_channel_messages(
+    client: TelegramClient,
+    channel_name: str,
+    messages_per_flush: int = MESSAGES_PER_FLUSH,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> int:
+    # Stream pages from the Telegram API into the database, flushing every
+    # messages_per_flush records so an interrupted crawl keeps what it already wrote
+    num_saved = 0
+    start_time = time.perf_counter()
+    try:
+        for crawl_pass in plan_channel_crawl(fetch_crawl_checkpoint(channel_name)):
+            pages = iter_channel_message_pages(
+                client, channel_name, **crawl_pass, rate_limiter=rate_limiter
+            )
+            for records in iter_record_batches(pages, messages_per_flush):
+                save_channel_message_batch(channel_name, records, client.api_id)
+                num_saved += len(records)
+                print(f"flushed {num_saved} messages for @{channel_name} to the database")
+
+            if not crawl_pass["reverse"]:
+                # the backward pass ran all the way to the start of the channel
+                mark_crawl_history_complete(channel_name)
+    finally:
+        crawl_telemetry.increment(
+            "crawl_seconds_total",
+            time.perf_counter() - start_time,
+            channel=channel_name,
+            credential=client.api_id,
+        )
+
+    return num_saved
+
+
 def retrieve_and_save_channel_messages(
-    channel_name: str, app_name: str, api_id: int, api_hash: str
+    channel_name: str,
+    app_name: str,
+    api_id: int,
+    api_hash: str,
+    messages_per_flush: int = MESSAGES_PER_FLUSH,
+    rate_limiter: AdaptiveRateLimiter = None,
 ) -> None:
-    # Retrieve messages from Telegram API
-    records = retrieve_channel_messages_from_telegram(
-        channel_name, app_name, api_id, api_hash
-    )
-
-    # Save data locally
-    store_channel_messages(records)
+    # Telethon would otherwise sleep through short flood waits on its own, out of our sight
+    with TelegramClient(app_name, api_id, api_hash, flood_sleep_threshold=0) as client:
+        try:
+            crawl_and_save_channel_messages(
+                client, channel_name, messages_per_flush, rate_limiter
+            )
+        except Exception as e:
+            # progress so far is checkpointed, so the next run picks up from here
+            print(f"crawl of @{channel_name} stopped early: {e}")
+    write_crawl_telemetry("channel_messages")
 
 
 def filter_network_by_weight(
@@ -467,11 +869,8 @@ def map_communities_to_colors(G: DiGraph) -> dict:
 def get_domain_network_edges(
     start_date: str, end_date: str, seed_list_names: list[str]
 ) -> list[dict]:
-    seed_channel_ids = list(
-        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
-    )
     df = pd.DataFrame.from_records(
-        fetch_domain_edges(seed_channel_ids, start_date, end_date)
+        fetch_domain_edges(fetch_seed_channel_ids(seed_list_names), start_date, end_date)
     )
 
     # Extract domains from URLs:
@@ -718,3 +1117,27 @@ def make_cytoscape_elements_domain_network(B: DiGraph) -> tuple[list[dict], list
 
 def get_metadata_for_single_channel(channel_id: int) -> dict:
     return fetch_metadata_for_single_channel(channel_id)
+
+
+def get_message_api_responses(message_keys: list[tuple[int, int]]) -> dict:
+    return fetch_message_api_responses(message_keys)
+
+
+def get_channel_metadata_api_response(channel_id: int) -> dict|None:
+    return fetch_channel_metadata_api_response(channel_id)
+
+
+def get_message_engagement_history(channel_id: int, message_id: int) -> DataFrame:
+    # views/forwards of one message at each crawl where they changed, oldest first
+    return pd.DataFrame(
+        fetch_message_engagement_history(channel_id, message_id),
+        columns=["channel_id", "message_id", "observed_at", "message_views", "message_forwards"],
+    )
+
+
+def get_channel_metadata_history(channel_ids: list[int]) -> DataFrame:
+    # subscribers/title/bio hash of each channel at every checkup where they changed, oldest first
+    return pd.DataFrame(
+        fetch_channel_metadata_history(channel_ids),
+        columns=["channel_id", "checkup_time", "num_subscribers", "channel_title", "bio_hash"],
+    )
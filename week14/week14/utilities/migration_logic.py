@@ -0,0 +1,368 @@
+import io
+import json
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Iterator
+
+import pandas as pd
+from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+import sqlalchemy as sa
+
+from ..config import OUTPUT_DIR
+from .db import (
+    channel_message_table,
+    channel_metadata_table,
+    bulk_load_channel_messages,
+    insert_data_into_channel_metadata_table_advanced,
+    insert_data_into_seed_table,
+)
+
+MIGRATION_CHECKPOINT_DIR = os.path.join(OUTPUT_DIR, "migrations")
+MIGRATION_CHUNK_ROWS = 50000
+MIGRATION_NUM_WORKERS = 4
+# a chunk that loses a deadlock against another writer is simply loaded again
+MAX_CHUNK_ATTEMPTS = 3
+FLAT_FILE_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+FLAT_FILE_COLUMNS = {
+    "messages": (
+        "channel_id",
+        "message_id",
+        "message_datetime",
+        "message_views",
+        "message_forwards",
+        "message_text",
+        "forwardee_channel_id",
+        "forwardee_message_id",
+        "message_is_forward",
+        "api_response",
+    ),
+    "channels": (
+        "channel_id",
+        "channel_name",
+        "channel_title",
+        "channel_birthdate",
+        "channel_bio",
+        "num_subscribers",
+        "api_response",
+    ),
+}
+INTEGER_COLUMNS = (
+    "channel_id",
+    "message_id",
+    "message_views",
+    "message_forwards",
+    "forwardee_channel_id",
+    "forwardee_message_id",
+    "num_subscribers",
+)
+DATETIME_COLUMNS = ("message_datetime", "channel_birthdate")
+BOOLEAN_VALUES = {"true": True, "t": True, "1": True, "false": False, "f": False, "0": False}
+
+
+def get_flat_file_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FLAT_FILE_FORMATS:
+        raise ValueError(f"can't migrate {path}: expected one of {sorted(FLAT_FILE_FORMATS)}")
+    return FLAT_FILE_FORMATS[extension]
+
+
+def read_flat_file_row(f: io.BufferedReader, file_format: str) -> bytes:
+    # One row, which in a CSV spans several lines when a quoted field has newlines in it.
+    # Escaped quotes come in pairs, so an odd number of quotes so far means a field is open.
+    row = f.readline()
+    if file_format != "csv":
+        return row
+    num_quotes = row.count(b'"')
+    while num_quotes % 2 == 1:
+        line = f.readline()
+        if line == b"":
+            break
+        row += line
+        num_quotes += line.count(b'"')
+    return row
+
+
+def read_csv_header(path: str) -> tuple[bytes, int]:
+    # The header row, and the byte offset of the first data row
+    with open(path, "rb") as f:
+        header = read_flat_file_row(f, "csv")
+        return header, f.tell()
+
+
+def iter_flat_file_chunks(
+    path: str, file_format: str, start_offset: int, chunk_rows: int
+) -> Iterator[tuple[int, int, int]]:
+    """
+    Walk the file from start_offset and yield (start, end, num_rows) byte ranges holding
+    chunk_rows rows each (the last one fewer). Only row boundaries are found here; the
+    workers read and parse the ranges themselves.
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        start = start_offset
+        num_rows = 0
+        while True:
+            row = read_flat_file_row(f, file_format)
+            if row == b"":
+                break
+            if row.strip() != b"":
+                num_rows += 1
+            if num_rows >= chunk_rows:
+                end = f.tell()
+                yield start, end, num_rows
+                start = end
+                num_rows = 0
+        end = f.tell()
+        if num_rows > 0:
+            yield start, end, num_rows
+
+
+def read_flat_file_chunk(path: str, file_format: str, start: int, end: int) -> DataFrame:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if file_format == "csv":
+        header, _ = read_csv_header(path)
+        # everything comes in as text, and coerce_flat_file_frame decides what it becomes
+        return pd.read_csv(
+            io.BytesIO(header + data), dtype=str, keep_default_na=False, na_values=[""]
+        )
+    return pd.read_json(io.BytesIO(data), lines=True, dtype=False, convert_dates=False)
+
+
+def coerce_integer_column(column: Series) -> Series:
+    # Older exports wrote ids from float columns ("1234.0"); anything that isn't a whole
+    # number becomes null
+    numbers = pd.to_numeric(column, errors="coerce")
+    return numbers.where(numbers == numbers.round()).astype("Int64")
+
+
+def coerce_boolean_column(column: Series) -> Series:
+    if pd.api.types.is_bool_dtype(column):
+        return column
+    return column.astype(str).str.strip().str.lower().map(BOOLEAN_VALUES)
+
+
+def coerce_flat_file_frame(df: DataFrame, kind: str) -> tuple[DataFrame, int]:
+    """
+    Cast a chunk of a flat file to the columns and types of its table, one column at a time,
+    and drop rows without a usable key. Returns the frame and the number of rows dropped.
+    """
+    df = df.reindex(columns=list(FLAT_FILE_COLUMNS[kind]))
+    for column in df.columns:
+        if column in INTEGER_COLUMNS:
+            df[column] = coerce_integer_column(df[column])
+        elif column in DATETIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column], utc=True, errors="coerce")
+
+    if kind == "messages":
+        # message_datetime is part of the key when channel_messages is partitioned
+        key_columns = [column.name for column in channel_message_table.primary_key]
+        df["message_is_forward"] = coerce_boolean_column(df["message_is_forward"])
+        # a message with a forwardee is a forward, whatever the flag column says
+        df["message_is_forward"] = df["message_is_forward"].where(
+            df["forwardee_channel_id"].isna(), True
+        )
+    else:
+        key_columns = [column.name for column in channel_metadata_table.primary_key]
+        df["channel_name"] = df["channel_name"].str.lower()
+
+    num_rows = df.shape[0]
+    df = df.dropna(subset=key_columns)
+    return df, num_rows - df.shape[0]
+
+
+def frame_to_records(df: DataFrame) -> list[dict]:
+    # pandas' missing values (NaN, NA, NaT) all become None
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def load_flat_file_chunk(
+    path: str,
+    file_format: str,
+    kind: str,
+    start: int,
+    end: int,
+    seed_list_name: str|None,
+    policy: str,
+) -> dict:
+    # Runs in a worker process: parse one byte range, coerce it and write it to Postgres
+    df, num_dropped = coerce_flat_file_frame(
+        read_flat_file_chunk(path, file_format, start, end), kind
+    )
+    records = frame_to_records(df)
+
+    for attempt in range(1, MAX_CHUNK_ATTEMPTS + 1):
+        try:
+            if kind == "messages":
+                num_written = bulk_load_channel_messages(records, policy=policy)
+            else:
+                # a chunk that can't be written must fail, so it isn't checkpointed as loaded
+                num_written = insert_data_into_channel_metadata_table_advanced(
+                    records, policy, skip_name_conflicts=False
+                )
+                # channels without a username can't be seeds (seeds.channel_name is NOT NULL)
+                seed_records = [
+                    {
+                        "channel_name": record["channel_name"],
+                        "channel_id": record["channel_id"],
+                        "seed_list": seed_list_name,
+                    }
+                    for record in records
+                    if record["channel_name"] is not None
+                ]
+                if seed_list_name is not None and len(seed_records) > 0:
+                    insert_data_into_seed_table(seed_records)
+            break
+        except sa.exc.OperationalError as e:
+            if "deadlock detected" not in str(e) or attempt == MAX_CHUNK_ATTEMPTS:
+                raise
+            print(f"bytes {start}-{end} of {path} hit a deadlock, loading them again")
+
+    return {
+        "start": start,
+        "end": end,
+        "num_rows": len(records),
+        "num_dropped": num_dropped,
+        "num_written": num_written,
+    }
+
+
+def ignore_keyboard_interrupts() -> None:
+    # Ctrl-C reaches the workers too; let the parent decide what to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_migration_checkpoint_path(path: str, kind: str) -> str:
+    return os.path.join(MIGRATION_CHECKPOINT_DIR, f"{kind}_{os.path.basename(path)}.json")
+
+
+def load_migration_checkpoint(checkpoint_path: str, path: str) -> dict|None:
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint["path"] != os.path.abspath(path):
+        raise ValueError(f"{checkpoint_path} belongs to {checkpoint['path']}, not {path}")
+    if checkpoint["offset"] > os.path.getsize(path):
+        raise ValueError(f"{path} is shorter than when it was last migrated; pass restart=True")
+    return checkpoint
+
+
+def save_migration_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    # written under a temporary name and renamed, so an interrupted write leaves the old one
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    with open(f"{checkpoint_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({**checkpoint, "updated_at": datetime.utcnow().isoformat()}, f, indent=2)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def migrate_flat_file(
+    path: str,
+    kind: str,
+    seed_list_name: str = None,
+    num_workers: int = MIGRATION_NUM_WORKERS,
+    chunk_rows: int = MIGRATION_CHUNK_ROWS,
+    policy: str = "ignore",
+    restart: bool = False,
+) -> dict:
+    """
+    Load a CSV or JSONL file of channel metadata or messages (as written by the earlier
+    crawlers) into Postgres. The file is cut into chunks of chunk_rows rows that num_workers
+    processes parse, coerce and write in parallel, messages through the COPY bulk loader.
+    The byte offset up to which every chunk is in the database is checkpointed after each
+    chunk, so running the same migration again resumes there. Chunks that were written past
+    the checkpoint when a run stopped are written again, which the upserts make harmless;
+    policy says what happens to rows that are already in the database.
+    """
+    if kind not in FLAT_FILE_COLUMNS:
+        raise ValueError(f"kind must be one of {sorted(FLAT_FILE_COLUMNS)}, not {kind!r}")
+    file_format = get_flat_file_format(path)
+    file_size = os.path.getsize(path)
+    checkpoint_path = get_migration_checkpoint_path(path, kind)
+
+    checkpoint = None if restart else load_migration_checkpoint(checkpoint_path, path)
+    if checkpoint is None:
+        data_start = read_csv_header(path)[1] if file_format == "csv" else 0
+        checkpoint = {
+            "path": os.path.abspath(path),
+            "kind": kind,
+            "offset": data_start,
+            "num_rows": 0,
+            "num_dropped": 0,
+            "num_written": 0,
+        }
+        save_migration_checkpoint(checkpoint_path, checkpoint)
+    else:
+        print(f"resuming {path} at byte {checkpoint['offset']} of {file_size}")
+
+    start_time = time.perf_counter()
+    num_rows_at_start = checkpoint["num_rows"]
+    pending = set()
+    # chunks that finished before an earlier one did, keyed by their start offset
+    finished = {}
+
+    def collect(futures: set) -> None:
+        for future in futures:
+            result = future.result()
+            finished[result["start"]] = result
+        while checkpoint["offset"] in finished:
+            result = finished.pop(checkpoint["offset"])
+            checkpoint["offset"] = result["end"]
+            for key in ["num_rows", "num_dropped", "num_written"]:
+                checkpoint[key] += result[key]
+            save_migration_checkpoint(checkpoint_path, checkpoint)
+            elapsed_seconds = time.perf_counter() - start_time
+            print(
+                f"{checkpoint['num_rows']} rows from {os.path.basename(path)} "
+                f"({100 * checkpoint['offset'] / max(file_size, 1):.1f}%), "
+                f"{(checkpoint['num_rows'] - num_rows_at_start) / elapsed_seconds:.0f} rows/s"
+            )
+
+    # spawn rather than fork, so no worker inherits the parent's DB connections
+    executor = ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=ignore_keyboard_interrupts,
+    )
+    try:
+        for start, end, _ in iter_flat_file_chunks(
+            path, file_format, checkpoint["offset"], chunk_rows
+        ):
+            # keep at most two chunks per worker in flight, so memory stays flat
+            if len(pending) >= 2 * num_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(
+                executor.submit(
+                    load_flat_file_chunk,
+                    path,
+                    file_format,
+                    kind,
+                    start,
+                    end,
+                    seed_list_name,
+                    policy,
+                )
+            )
+        done, pending = wait(pending)
+        collect(done)
+    except BaseException:
+        # chunks already being written finish; the rest are picked up by the next run
+        print(f"stopping; {path} will resume at byte {checkpoint['offset']}")
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    checkpoint["completed_at"] = datetime.utcnow().isoformat()
+    save_migration_checkpoint(checkpoint_path, checkpoint)
+    print(
+        f"migrated {path}: {checkpoint['num_rows']} rows, {checkpoint['num_written']} written, "
+        f"{checkpoint['num_dropped']} dropped without a key"
+    )
+    return checkpoint
@@ -0,0 +1,183 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from telethon.errors import FloodError, ServerError, TimedOutError
+
+from .telemetry import crawl_telemetry
+
+T = TypeVar("T")
+
+# Errors worth retrying after a short (jittered) backoff; anything else is raised straight away
+TRANSIENT_ERRORS = (ServerError, TimedOutError, ConnectionError, TimeoutError)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every Telegram call made through it, from threads or coroutines.
+
+    The refill rate creeps up by increase_step requests/second after each successful call
+    (up to max_rate) and is halved whenever Telegram answers with a FloodWaitError (down to
+    min_rate). A flood wait also blocks the bucket for exactly the number of seconds Telegram
+    asked for, so every caller sharing the limiter waits it out, not just the one that hit it.
+    A flood wait longer than max_flood_wait_seconds, or more than max_flood_retries of them
+    for one call, is raised instead of waited out, so a worker can put the job back in the
+    queue rather than sit on it for hours. A FloodError that doesn't say how long to wait is
+    backed off like a transient error.
+
+    Keyword labels passed to call / call_async (e.g. channel and credential) are attached to
+    the request count, latency, throttling and flood-wait metrics in crawl_telemetry.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        min_rate: float = 1 / 30,
+        max_rate: float = 5.0,
+        burst: int = 1,
+        increase_step: float = 0.05,
+        backoff_factor: float = 0.5,
+        max_retries: int = 5,
+        max_backoff_seconds: float = 60.0,
+        max_flood_retries: int = 5,
+        max_flood_wait_seconds: float = 15 * 60,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+        self.max_retries = max_retries
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_flood_retries = max_flood_retries
+        self.max_flood_wait_seconds = max_flood_wait_seconds
+
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # Take a token and return how long the caller must wait before using it. The bucket
+        # may go into debt, which makes concurrent callers queue up behind each other.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            wait_seconds = max(0.0, -self._tokens / self.rate)
+            return max(wait_seconds, self._blocked_until - now)
+
+    def acquire(self) -> float:
+        wait_seconds = self._reserve()
+        time.sleep(wait_seconds)
+        return wait_seconds
+
+    async def acquire_async(self) -> float:
+        wait_seconds = self._reserve()
+        await asyncio.sleep(wait_seconds)
+        return wait_seconds
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def record_flood_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        print(
+            f"Telegram asked us to wait {seconds}s; "
+            f"slowing down to {self.rate:.3f} requests/s"
+        )
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        return min(self.max_backoff_seconds, 2**attempt) * random.uniform(0.5, 1.5)
+
+    def _handle_flood_error(self, e: FloodError, flood_attempt: int, labels: dict) -> None:
+        # Either block the bucket for the wait Telegram asked for, or re-raise e
+        flood_wait_seconds = getattr(e, "seconds", None)
+        crawl_telemetry.increment(
+            "telegram_flood_wait_seconds_total", flood_wait_seconds or 0, **labels
+        )
+        if flood_wait_seconds is not None and flood_wait_seconds > self.max_flood_wait_seconds:
+            with self._lock:
+                self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            print(
+                f"Telegram asked us to wait {flood_wait_seconds}s, "
+                f"more than the {self.max_flood_wait_seconds}s we wait out"
+            )
+            raise e
+        if flood_attempt > self.max_flood_retries:
+            raise e
+        if not flood_wait_seconds:
+            flood_wait_seconds = self._backoff_seconds(flood_attempt)
+        self.record_flood_wait(flood_wait_seconds)
+
+    def call(self, fn: Callable[[], T], **labels) -> T:
+        attempt = 0
+        flood_attempt = 0
+        while True:
+            crawl_telemetry.increment("telegram_throttle_seconds_total", self.acquire(), **labels)
+            crawl_telemetry.increment("telegram_requests_total", **labels)
+            start_time = time.perf_counter()
+            try:
+                result = fn()
+            except FloodError as e:
+                flood_attempt += 1
+                self._handle_flood_error(e, flood_attempt, labels)
+                # a little jitter so callers blocked by the same flood wait don't retry in lockstep
+                time.sleep(random.uniform(0, 1))
+                continue
+            except TRANSIENT_ERRORS as e:
+                crawl_telemetry.increment("telegram_transient_errors_total", **labels)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                backoff_seconds = self._backoff_seconds(attempt)
+                print(f"{e!r}; retrying in {backoff_seconds:.1f}s (attempt {attempt})")
+                time.sleep(backoff_seconds)
+                continue
+            crawl_telemetry.observe(
+                "telegram_request_seconds", time.perf_counter() - start_time, **labels
+            )
+            self.record_success()
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], **labels) -> T:
+        attempt = 0
+        flood_attempt = 0
+        while True:
+            crawl_telemetry.increment("telegram_throttle_seconds_total", await self.acquire_async(), **labels)
+            crawl_telemetry.increment("telegram_requests_total", **labels)
+            start_time = time.perf_counter()
+            try:
+                result = await fn()
+            except FloodError as e:
+                flood_attempt += 1
+                self._handle_flood_error(e, flood_attempt, labels)
+                await asyncio.sleep(random.uniform(0, 1))
+                continue
+            except TRANSIENT_ERRORS as e:
+                crawl_telemetry.increment("telegram_transient_errors_total", **labels)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                backoff_seconds = self._backoff_seconds(attempt)
+                print(f"{e!r}; retrying in {backoff_seconds:.1f}s (attempt {attempt})")
+                await asyncio.sleep(backoff_seconds)
+                continue
+            crawl_telemetry.observe(
+                "telegram_request_seconds", time.perf_counter() - start_time, **labels
+            )
+            self.record_success()
+            return result
+
+
+# Process-wide limiter used whenever a caller doesn't bring its own
+telegram_rate_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from .db import (
+    SCHEMA_MIGRATIONS,
+    fetch_applied_schema_migrations,
+    capture_statements,
+    explain_statement,
+    fetch_partition_parents,
+    fetch_latest_message_datetime,
+    fetch_seed_list_names,
+    fetch_seed_list_preview,
+    fetch_birth_chart_data,
+    fetch_time_series_chart_data,
+    fetch_top_messages,
+    fetch_seed_metadata_full,
+    fetch_weighted_edges_fwd_network,
+    fetch_domain_edges,
+    fetch_discovery_frontier,
+)
+
+STATUS_WINDOW = timedelta(days=30)
+
+
+def get_schema_migration_status() -> list[dict]:
+    applied = {
+        migration["version"]: migration for migration in fetch_applied_schema_migrations()
+    }
+    return [
+        {
+            "version": version,
+            "name": name,
+            "applied_at": applied[version]["applied_at"] if version in applied else None,
+        }
+        for version, name, _ in SCHEMA_MIGRATIONS
+    ]
+
+
+def summarize_plan(plan: dict, partition_parents: dict[str, str]) -> dict:
+    # The indexes a plan reads and the tables it scans whole, with partitions (and their
+    # indexes) reported under the partitioned table they belong to
+    indexes = set()
+    sequential_scans = set()
+    nodes = [plan]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if "Index Name" in node:
+            indexes.add(partition_parents.get(node["Index Name"], node["Index Name"]))
+        if node["Node Type"] == "Seq Scan":
+            relation_name = node["Relation Name"]
+            sequential_scans.add(partition_parents.get(relation_name, relation_name))
+        nodes += node.get("Plans", [])
+    return {"indexes": sorted(indexes), "sequential_scans": sorted(sequential_scans)}
+
+
+def get_query_index_report(
+    seed_list_names: list[str] = None, start_date: str = None, end_date: str = None
+) -> list[dict]:
+    """
+    Run each dashboard fetch_* query (all seed lists and the 30 days up to the newest message,
+    unless told otherwise), EXPLAIN every statement it sends, and report which indexes
+    the planner picked and which tables it fell back to scanning whole.
+    """
+    if seed_list_names is None:
+        seed_list_names = fetch_seed_list_names()
+    if end_date is None:
+        latest_message_datetime = fetch_latest_message_datetime()
+        if latest_message_datetime is None:
+            return []
+        end_date = latest_message_datetime.strftime("%Y-%m-%d")
+        start_date = (latest_message_datetime - STATUS_WINDOW).strftime("%Y-%m-%d")
+    seed_channel_ids = list(
+        set([seed["channel_id"] for seed in fetch_seed_list_preview(seed_list_names)])
+    )
+    if len(seed_channel_ids) == 0:
+        return []
+
+    queries = {
+        "fetch_seed_list_preview": lambda: fetch_seed_list_preview(seed_list_names),
+        "fetch_seed_metadata_full": lambda: fetch_seed_metadata_full(seed_list_names),
+        "fetch_birth_chart_data": lambda: fetch_birth_chart_data(seed_list_names, "month"),
+        "fetch_time_series_chart_data": lambda: fetch_time_series_chart_data(
+            seed_list_names, start_date, end_date, "day"
+        ),
+        "fetch_top_messages": lambda: fetch_top_messages(
+            seed_list_names, start_date, end_date, 10
+        ),
+        "fetch_weighted_edges_fwd_network": lambda: fetch_weighted_edges_fwd_network(
+            seed_channel_ids, start_date, end_date
+        ),
+        "fetch_domain_edges": lambda: fetch_domain_edges(seed_channel_ids, start_date, end_date),
+        "fetch_discovery_frontier": lambda: fetch_discovery_frontier(seed_list_names, 100),
+    }
+
+    partition_parents = fetch_partition_parents()
+    report = []
+    for query_name, run_query in queries.items():
+        with capture_statements() as statements:
+            run_query()
+        for statement, parameters in statements:
+            report.append(
+                {
+                    "query": query_name,
+                    "statement": " ".join(statement.split())[:80],
+                    **summarize_plan(explain_statement(statement, parameters), partition_parents),
+                }
+            )
+    return report
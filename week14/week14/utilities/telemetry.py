@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+
+from ..config import OUTPUT_DIR
+
+TELEMETRY_DIR = os.path.join(OUTPUT_DIR, "telemetry")
+
+# Upper bounds (seconds) of the histogram buckets; a +Inf bucket is always added
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    "telegram_requests_total": ("counter", "Telegram API requests made, retries included"),
+    "telegram_request_seconds": ("histogram", "Latency of successful Telegram API requests"),
+    "telegram_throttle_seconds_total": (
+        "counter", "Seconds spent waiting on the rate limiter before a request",
+    ),
+    "telegram_flood_wait_seconds_total": (
+        "counter", "Seconds Telegram told us to wait in FloodWait errors",
+    ),
+    "telegram_transient_errors_total": ("counter", "Telegram requests retried after an error"),
+    "crawl_messages_total": ("counter", "Messages fetched from Telegram"),
+    "crawl_seconds_total": ("counter", "Wall-clock seconds spent crawling a channel"),
+    "db_flush_seconds": ("histogram", "Time taken to write one batch of messages"),
+    "db_records_written_total": ("counter", "Message rows inserted or updated"),
+    "db_records_deduplicated_total": (
+        "counter", "Message records dropped because the table already had them unchanged",
+    ),
+}
+
+
+def format_labels(labels: tuple) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = [
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    ]
+    return "{" + ",".join([f'{key}="{value}"' for key, value in escaped]) + "}"
+
+
+def make_label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+class CrawlTelemetry:
+    """
+    Counters and latency histograms for the crawlers, labelled by channel and credential,
+    that can be dumped as a Prometheus text file (for node_exporter's textfile collector) and
+    as a JSON summary. Safe to update from several threads; each process keeps its own.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, make_label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, make_label_key(labels))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = {
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            histogram = self._histograms[key]
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper_bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def to_prometheus_text(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: {**value, "buckets": list(value["buckets"])}
+                for key, value in self._histograms.items()
+            }
+
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "counter":
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+            else:
+                for (key_name, labels), histogram in sorted(histograms.items()):
+                    if key_name != name:
+                        continue
+                    for upper_bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                        lines.append(
+                            f"{name}_bucket{format_labels(labels + (('le', upper_bound),))} {count}"
+                        )
+                    lines.append(
+                        f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} "
+                        f"{histogram['count']}"
+                    )
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summarize(self, label: str) -> dict:
+        # Fold every metric down to one entry per value of label (e.g. per channel)
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: {**value, "buckets": list(value["buckets"])}
+                for key, value in self._histograms.items()
+            }
+
+        summary = {}
+        for (name, labels), value in counters.items():
+            group = dict(labels).get(label)
+            if group is None:
+                continue
+            entry = summary.setdefault(group, {})
+            entry[name] = entry.get(name, 0) + value
+        for (name, labels), histogram in histograms.items():
+            group = dict(labels).get(label)
+            if group is None:
+                continue
+            entry = summary.setdefault(group, {})
+            entry[f"{name}_count"] = entry.get(f"{name}_count", 0) + histogram["count"]
+            entry[f"{name}_sum"] = entry.get(f"{name}_sum", 0) + histogram["sum"]
+
+        for entry in summary.values():
+            if entry.get("crawl_seconds_total", 0) > 0:
+                entry["messages_per_second"] = (
+                    entry.get("crawl_messages_total", 0) / entry["crawl_seconds_total"]
+                )
+            for name in ["telegram_request_seconds", "db_flush_seconds"]:
+                if entry.get(f"{name}_count", 0) > 0:
+                    entry[f"{name}_mean"] = entry[f"{name}_sum"] / entry[f"{name}_count"]
+        return summary
+
+    def to_summary(self) -> dict:
+        finished_at = datetime.utcnow()
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "run_seconds": (finished_at - self.started_at).total_seconds(),
+            "channels": self.summarize("channel"),
+            "credentials": self.summarize("credential"),
+        }
+
+    def write(self, output_dir: str, run_name: str) -> tuple[str, str]:
+        """
+        Write <run_name>.prom and <run_name>.json to output_dir and return their paths.
+        Files are written under a temporary name and renamed, so a collector never reads
+        half a file.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        prometheus_path = os.path.join(output_dir, f"{run_name}.prom")
+        summary_path = os.path.join(output_dir, f"{run_name}.json")
+        for path, content in [
+            (prometheus_path, self.to_prometheus_text()),
+            (summary_path, json.dumps(self.to_summary(), indent=2, default=str)),
+        ]:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+        print(f"wrote crawl telemetry to {prometheus_path} and {summary_path}")
+        return prometheus_path, summary_path
+
+
+# Process-wide telemetry that every crawler reports to
+crawl_telemetry = CrawlTelemetry()
+
+
+def write_crawl_telemetry(run_name: str) -> tuple[str, str]:
+    # Everything this process has recorded so far, so calling this after every channel of a
+    # loop leaves the totals for the whole loop behind
+    return crawl_telemetry.write(TELEMETRY_DIR, run_name)
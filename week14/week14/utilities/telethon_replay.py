@@ -0,0 +1,280 @@
+import glob
+import math
+import os
+import random
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+import zstandard
+from telethon import functions, utils
+from telethon.extensions import BinaryReader
+from telethon.sync import TelegramClient
+from telethon.tl import types
+from telethon.tl.tlobject import TLObject
+
+from .rate_limiter import AdaptiveRateLimiter, telegram_rate_limiter
+
+# A fixture is one zstd-compressed file per channel holding a stream of frames:
+# one kind byte, a little-endian uint32 length, then the object in Telegram's own TL encoding
+FIXTURE_SUFFIX = ".tl.zst"
+FRAME_HEADER = struct.Struct("<cI")
+MESSAGE_FRAME = b"M"
+ENTITY_FRAME = b"E"
+CHAT_FULL_FRAME = b"F"
+MESSAGES_PER_REQUEST = 100
+
+
+def fixture_path(fixture_dir: str, channel_name: str) -> str:
+    return os.path.join(fixture_dir, f"{channel_name}{FIXTURE_SUFFIX}")
+
+
+def write_fixture(path: str, frames: Iterator[tuple[bytes, TLObject]]) -> int:
+    num_frames = 0
+    with open(path, "wb") as f:
+        with zstandard.ZstdCompressor().stream_writer(f) as writer:
+            for kind, tl_object in frames:
+                data = tl_object._bytes()
+                writer.write(FRAME_HEADER.pack(kind, len(data)))
+                writer.write(data)
+                num_frames += 1
+    return num_frames
+
+
+def read_fixture(path: str) -> Iterator[tuple[bytes, TLObject]]:
+    with open(path, "rb") as f:
+        data = zstandard.ZstdDecompressor().stream_reader(f).read()
+    offset = 0
+    while offset < len(data):
+        kind, length = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        with BinaryReader(data[offset:offset + length]) as reader:
+            yield kind, reader.tgread_object()
+        offset += length
+
+
+def record_channel_fixture(
+    client: TelegramClient,
+    channel_name: str,
+    fixture_dir: str,
+    max_messages: int = None,
+    rate_limiter: AdaptiveRateLimiter = None,
+) -> int:
+    """
+    Save a channel's ChatFull and its newest max_messages messages (all of them if None),
+    exactly as Telegram sent them, to <fixture_dir>/<channel_name>.tl.zst. The channels that
+    messages were forwarded from are saved too, so replayed forwards resolve like live ones.
+    Returns the number of messages recorded.
+    """
+    if rate_limiter is None:
+        rate_limiter = telegram_rate_limiter
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    chat_full = rate_limiter.call(
+        lambda: client(functions.channels.GetFullChannelRequest(channel=channel_name))
+    )
+    messages = []
+    max_id = 0
+    while max_messages is None or len(messages) < max_messages:
+        limit = MESSAGES_PER_REQUEST
+        if max_messages is not None:
+            limit = min(limit, max_messages - len(messages))
+        page = rate_limiter.call(
+            lambda: list(client.iter_messages(channel_name, max_id=max_id, limit=limit))
+        )
+        if len(page) == 0:
+            break
+        messages += page
+        max_id = min([message.id for message in page])
+        print(f"recorded {len(messages)} messages from @{channel_name}")
+
+    entities = {}
+    for message in messages:
+        if message.forward is not None and message.forward.chat is not None:
+            entities[utils.get_peer_id(message.forward.chat)] = message.forward.chat
+
+    def frames() -> Iterator[tuple[bytes, TLObject]]:
+        yield CHAT_FULL_FRAME, chat_full
+        for entity in entities.values():
+            yield ENTITY_FRAME, entity
+        for message in messages:
+            yield MESSAGE_FRAME, message
+
+    write_fixture(fixture_path(fixture_dir, channel_name), frames())
+    return len(messages)
+
+
+def synthesize_channel_fixture(
+    fixture_dir: str, channel_name: str, channel_id: int, num_messages: int
+) -> None:
+    # Made-up messages in the shape of a busy news channel (roughly one post in five is a
+    # forward), for benchmarking without any recorded account data
+    os.makedirs(fixture_dir, exist_ok=True)
+    first_message_date = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    channel = types.Channel(
+        id=channel_id,
+        title=channel_name,
+        photo=types.ChatPhotoEmpty(),
+        date=first_message_date,
+        username=channel_name,
+        access_hash=channel_id * 31,
+        broadcast=True,
+    )
+    chat_full = types.messages.ChatFull(
+        full_chat=types.ChannelFull(
+            id=channel_id,
+            about=f"synthetic channel @{channel_name}",
+            read_inbox_max_id=0,
+            read_outbox_max_id=0,
+            unread_count=0,
+            chat_photo=types.PhotoEmpty(id=0),
+            notify_settings=types.PeerNotifySettings(),
+            bot_info=[],
+            pts=0,
+            participants_count=random.randint(1000, 500000),
+        ),
+        chats=[channel],
+        users=[],
+    )
+    words = ["новости", "war", "https://t.me/x", "Россия", "update", "видео", "Украина"]
+
+    def frames() -> Iterator[tuple[bytes, TLObject]]:
+        yield CHAT_FULL_FRAME, chat_full
+        for message_id in range(num_messages, 0, -1):
+            fwd_from = None
+            if message_id % 5 == 0:
+                fwd_from = types.MessageFwdHeader(
+                    date=first_message_date,
+                    from_id=types.PeerChannel(1_000_000 + message_id % 37),
+                    channel_post=message_id,
+                )
+            yield MESSAGE_FRAME, types.Message(
+                id=message_id,
+                peer_id=types.PeerChannel(channel_id),
+                date=first_message_date + timedelta(minutes=30 * message_id),
+                message=" ".join(random.choices(words, k=random.randint(5, 80))),
+                views=random.randint(0, 100000),
+                forwards=random.randint(0, 500),
+                fwd_from=fwd_from,
+                post=True,
+            )
+
+    write_fixture(fixture_path(fixture_dir, channel_name), frames())
+
+
+class ReplayTelegramClient:
+    """
+    Stand-in for a sync TelegramClient that serves channels from recorded fixtures, so the
+    crawl and ingest code can run with no account or network. It supports the calls the
+    crawlers make: get_input_entity, iter_messages (min_id / max_id / limit / reverse, as
+    Telethon applies them), get_messages(ids=...) and GetFullChannelRequest. Every simulated
+    API request sleeps for latency_seconds (plus up to jitter_seconds), and iter_messages
+    counts one request per 100 messages, like the real client.
+    """
+
+    def __init__(
+        self,
+        fixture_dir: str,
+        latency_seconds: float = 0.0,
+        jitter_seconds: float = 0.0,
+        api_id: int = 0,
+    ):
+        self.api_id = api_id
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.num_requests = 0
+        # the bits of client state Message._finish_init reads
+        self._self_id = None
+        self._mb_entity_cache = {}
+        self._channels = {}
+        self.channel_ids_by_name = {}
+        for path in sorted(glob.glob(os.path.join(fixture_dir, f"*{FIXTURE_SUFFIX}"))):
+            self._load_fixture(os.path.basename(path)[: -len(FIXTURE_SUFFIX)], path)
+
+    def _load_fixture(self, channel_name: str, path: str) -> None:
+        chat_full = None
+        entities = {}
+        messages = []
+        for kind, tl_object in read_fixture(path):
+            if kind == CHAT_FULL_FRAME:
+                chat_full = tl_object
+                for chat in chat_full.chats:
+                    entities[utils.get_peer_id(chat)] = chat
+            elif kind == ENTITY_FRAME:
+                entities[utils.get_peer_id(tl_object)] = tl_object
+            else:
+                messages.append(tl_object)
+        for message in messages:
+            message._finish_init(self, entities, None)
+
+        channel_id = chat_full.full_chat.id
+        access_hash = next(
+            (chat.access_hash for chat in chat_full.chats if chat.id == channel_id), 0
+        )
+        self._channels[channel_id] = {
+            "chat_full": chat_full,
+            "input_peer": types.InputPeerChannel(channel_id, access_hash or 0),
+            "messages": sorted(messages, key=lambda x: x.id, reverse=True),
+        }
+        self.channel_ids_by_name[channel_name.lower()] = channel_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return
+
+    def _simulate_request(self) -> None:
+        self.num_requests += 1
+        time.sleep(self.latency_seconds + random.uniform(0, self.jitter_seconds))
+
+    def _find_channel(self, entity) -> dict:
+        if isinstance(entity, str):
+            channel_name = entity.lower().lstrip("@")
+            if channel_name not in self.channel_ids_by_name:
+                raise ValueError(f'No user has "{entity}" as username')
+            return self._channels[self.channel_ids_by_name[channel_name]]
+        channel_id = getattr(entity, "channel_id", None)
+        if channel_id is None and hasattr(entity, "input_peer"):
+            channel_id = entity.input_peer.channel_id
+        if channel_id not in self._channels:
+            raise ValueError(f"Could not find the input entity for {entity!r}")
+        return self._channels[channel_id]
+
+    def get_input_entity(self, entity) -> types.InputPeerChannel:
+        if isinstance(entity, str):
+            # resolving a username costs a request, like ResolveUsernameRequest
+            self._simulate_request()
+        return self._find_channel(entity)["input_peer"]
+
+    def __call__(self, request):
+        if isinstance(request, functions.channels.GetFullChannelRequest):
+            self._simulate_request()
+            return self._find_channel(request.channel)["chat_full"]
+        raise NotImplementedError(f"{type(request).__name__} can't be replayed")
+
+    def iter_messages(
+        self, entity, limit: int = None, min_id: int = 0, max_id: int = 0, reverse: bool = False
+    ) -> Iterator[types.Message]:
+        messages = [
+            message
+            for message in self._find_channel(entity)["messages"]
+            if message.id > min_id and (max_id == 0 or message.id < max_id)
+        ]
+        if reverse:
+            messages = messages[::-1]
+        if limit is not None:
+            messages = messages[:limit]
+        for _ in range(max(1, math.ceil(len(messages) / MESSAGES_PER_REQUEST))):
+            self._simulate_request()
+        return iter(messages)
+
+    def get_messages(self, entity, ids=None, **kwargs):
+        if ids is None:
+            return list(self.iter_messages(entity, **kwargs))
+        self._simulate_request()
+        messages_by_id = {message.id: message for message in self._find_channel(entity)["messages"]}
+        if isinstance(ids, int):
+            return messages_by_id.get(ids)
+        return [messages_by_id.get(message_id) for message_id in ids]